@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+PPT自动化工具 - 基准测试
+合成逼真的工作目录（图片、大体积.o日志、大量文件的目录、多页模板），
+无界面地分阶段计时生成流程，结果写为JSON，便于在自己的机器上跨版本对比。
+
+用法示例：
+    python ppt_benchmark.py --images 12 --image-size 1920x1080 --log-mb 512 --results bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import ppt_image_inserter_gui as app
+
+
+# ========== 合成数据 ==========
+
+def make_images(work_dir, count, size, fmt):
+    """生成count张带噪声渐变的图片（接近真实截图/绘图的压缩特性）"""
+    from PIL import Image
+    width, height = size
+    ext = {"jpg": ".jpg", "jpeg": ".jpg", "png": ".png", "bmp": ".bmp", "gif": ".gif"}[fmt]
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    names = []
+    for i in range(count):
+        gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        img = Image.blend(gradient, noise, 0.3 + 0.4 * (i % 5) / 5)
+        name = f"fig{i + 1:03d}{ext}"
+        img.save(os.path.join(work_dir, name))
+        names.append(name)
+    return names
+
+
+def make_log(work_dir, size_mb, job_id=2343908):
+    """生成约size_mb大小的.o日志：开头和末尾各有一行待提取的数值行"""
+    name = f"job.o{job_id}"
+    path = os.path.join(work_dir, name)
+    rng = random.Random(0)
+    line = " ".join(f"{rng.uniform(-1e4, 1e4):.6e}" for _ in range(8)) + "\n"
+    block = line * 4096
+    target = size_mb * 1024 * 1024
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("step energy pressure volume temperature\n")
+        f.write("1 -1234.56789 0.000123456 98765.4321 300.15\n")
+        written = 0
+        while written < target:
+            f.write(block)
+            written += len(block)
+        f.write("9999 -4321.98765 0.000654321 12345.6789 299.85\n")
+    with open(path, "rb") as f:
+        line_count = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+    return name, line_count
+
+
+def make_many_files(work_dir, count):
+    """生成count个小数据文件（放大关键词搜索和文件嗅探的开销）"""
+    for i in range(count):
+        with open(os.path.join(work_dir, f"data_{i:05d}.dat"), "w", encoding="utf-8") as f:
+            f.write(f"{i} {i * 0.5} {i * 1.5e-3}\n")
+
+
+def make_template(path, slides):
+    """生成一个slides页的16:9模板，每页带标题和若干装饰形状"""
+    app.load_heavy_modules()
+    from pptx.util import Cm
+    prs = app.Presentation()
+    prs.slide_width = Cm(66.69)
+    prs.slide_height = Cm(37.27)
+    for i in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        slide.shapes.title.text = f"模板第{i + 1}页"
+        for j in range(5):
+            box = slide.shapes.add_textbox(Cm(2 + j * 12), Cm(34), Cm(10), Cm(1.5))
+            box.text_frame.text = f"标签{j + 1}"
+    prs.save(path)
+
+
+def make_unique_dirs(root, count, size):
+    """生成count个工作目录，每个目录一张内容互不相同的图片（图片无法去重，媒体总量随页数增长）"""
+    from PIL import Image
+    noise = Image.effect_noise(size, 60).convert("RGB")
+    dirs = []
+    for i in range(count):
+        work_dir = os.path.join(root, f"run{i:04d}")
+        os.makedirs(work_dir)
+        img = noise.copy()
+        img.putpixel((i % size[0], i // size[0] % size[1]), (255, 0, 0))
+        img.save(os.path.join(work_dir, "fig.png"))
+        dirs.append(work_dir)
+    return dirs
+
+
+def grid_layouts(filenames, columns=4):
+    """按网格排布图片配置"""
+    configs = []
+    for i, name in enumerate(filenames):
+        row, col = divmod(i, columns)
+        configs.append({"filename": name, "left": 1 + col * 16.2, "top": 3 + row * 11, "height": 10})
+    return configs
+
+
+# ========== 计时 ==========
+
+def measure(func, repeat):
+    """运行func repeat次，返回耗时统计（秒）"""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return {
+        "runs": repeat,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "max": max(times),
+    }, result
+
+
+def run_benchmarks(args, root):
+    results = {}
+
+    def record(name, func, repeat=args.repeat, **extra):
+        stats, result = measure(func, repeat)
+        stats.update(extra)
+        results[name] = stats
+        print(f"{name:<28} median {stats['median'] * 1000:10.2f} ms  (min {stats['min'] * 1000:.2f} ms)")
+        return result
+
+    # ---------- 数字格式化 ----------
+    rng = random.Random(1)
+    values = [f"{rng.uniform(-1, 1) * 10 ** rng.randint(-6, 8):.8g}" for _ in range(args.format_count)]
+    values += ["abc", "nan", "0", "1e309"]
+    record("format_number", lambda: [app.format_number(v) for v in values],
+           items=len(values))
+    results["format_number"]["per_item_us"] = results["format_number"]["median"] / len(values) * 1e6
+
+    # ---------- 工作目录 ----------
+    work_dir = os.path.join(root, "work")
+    os.makedirs(work_dir)
+    print("合成图片...", flush=True)
+    images = make_images(work_dir, args.images, args.image_size, args.image_format)
+    print(f"合成 {args.log_mb} MB 日志...", flush=True)
+    log_name, log_lines = make_log(work_dir, args.log_mb)
+    many_dir = os.path.join(root, "many")
+    os.makedirs(many_dir)
+    make_many_files(many_dir, args.many_files)
+    template = os.path.join(root, "template.pptx")
+    make_template(template, args.template_slides)
+
+    # ---------- 文本提取 ----------
+    head = {"keyword": ".o", "line_number": 2, "file_cols": "2,3", "left": 2, "top": 2}
+    tail = dict(head, line_number=log_lines)
+    record("text_search_keyword", lambda: app.find_text_file(many_dir, "data_09999"),
+           files=args.many_files)
+    record("text_search_no_keyword", lambda: app.find_text_file(many_dir, ""),
+           files=args.many_files)
+    record("text_extract_head_line", lambda: app.extract_text_value(work_dir, head), log_mb=args.log_mb)
+    record("text_extract_tail_line", lambda: app.extract_text_value(work_dir, tail), log_mb=args.log_mb)
+
+    # ---------- 生成各阶段 ----------
+    image_configs = grid_layouts(images)
+    text_configs = [dict(head, top=30 + i) for i in range(args.texts)]
+    out_path = os.path.join(root, "out.pptx")
+
+    app._template_cache.clear()
+    record("template_load_cold", lambda: (app._template_cache.clear(), app.open_template(template)),
+           slides=args.template_slides)
+    record("template_load_cached", lambda: app.open_template(template), slides=args.template_slides)
+
+    def clone():
+        prs = app.open_template(template)
+        return prs, app.clone_template_slide(prs, args.template_slides // 2)[0]
+    record("slide_clone", clone)
+
+    def add_pictures():
+        prs, slide = clone()
+        for config in image_configs:
+            app.add_image_to_slide(slide, os.path.join(work_dir, config["filename"]), config)
+        return prs
+    record("add_pictures", add_pictures, images=len(image_configs))
+
+    # ---------- 大量形状：逐个对象API vs 预编译布局 ----------
+    bulk_images = [dict(config, filename=images[i % len(images)])
+                   for i, config in enumerate(grid_layouts([""] * (args.bulk_shapes * 4 // 5), columns=20))]
+    bulk_texts = [{"left": 1 + (i % 20) * 3, "top": 1 + (i // 20) * 1.2} for i in range(args.bulk_shapes // 5)]
+
+    def bulk_object_api():
+        prs, slide = clone()
+        for config in bulk_images:
+            app.add_image_to_slide(slide, os.path.join(work_dir, config["filename"]), config)
+        for i, config in enumerate(bulk_texts):
+            app.add_text_box(slide, f"{i * 1.5:.4g}", config)
+        return prs
+    record("bulk_shapes_object_api", bulk_object_api, shapes=len(bulk_images) + len(bulk_texts))
+
+    def bulk_compiled():
+        prs, slide = clone()
+        compiled = app.compile_layout(bulk_images, bulk_texts)
+        parts = {name: slide.part.get_or_add_image_part(os.path.join(work_dir, name)) for name in images}
+        pictures = [(i, parts[config["filename"]][1], parts[config["filename"]][0], config["filename"])
+                    for i, config in enumerate(bulk_images)]
+        compiled.stamp(slide, pictures, [(i, f"{i * 1.5:.4g}") for i in range(len(bulk_texts))])
+        return prs
+    record("bulk_shapes_compiled", bulk_compiled, shapes=len(bulk_images) + len(bulk_texts))
+
+    # ---------- 文本框尺寸测量 ----------
+    labels = [app.format_text(value) for value in values[:1000]]
+    app.measure_text("0123456789.-+E/")  # 预热：加载字体
+    record("measure_text", lambda: [app.measure_text(label) for label in labels], items=len(labels))
+    results["measure_text"]["per_item_us"] = results["measure_text"]["median"] / len(labels) * 1e6
+
+    # ---------- 自动排版 ----------
+    layout_rng = random.Random(2)
+    layout_sizes = [(layout_rng.randint(300, 4000), layout_rng.randint(300, 4000)) for _ in range(args.layout_images)]
+    record("auto_layout", lambda: app.solve_auto_layout(layout_sizes), images=args.layout_images)
+
+    prs = add_pictures()
+    record("save", lambda: prs.save(out_path), images=len(image_configs))
+    record("save_fast", lambda: app.save_presentation_fast(prs, out_path), images=len(image_configs))
+    record("save_fast_single_thread", lambda: app.save_presentation_fast(prs, out_path, workers=1),
+           images=len(image_configs))
+
+    record("generate_deck", lambda: app.generate_deck(template, args.template_slides // 2, image_configs,
+                                                      text_configs, work_dir, out_path),
+           images=len(image_configs), texts=len(text_configs))
+    results["output_size_bytes"] = os.path.getsize(out_path)
+    # 刷新数值：重新提取并另存（媒体原样复制），与上面的完整生成对比
+    record("refresh_values", lambda: app.refresh_deck(out_path, output=os.path.join(root, "refreshed.pptx")),
+           texts=len(text_configs))
+
+    # ---------- 多页PPT内存占用：不限制 vs 图片留在磁盘上 ----------
+    import tracemalloc
+    print("合成多页PPT测试目录...", flush=True)
+    unique_dirs = make_unique_dirs(os.path.join(root, "runs"), args.deck_slides, args.image_size)
+    slot = [{"left": 1, "top": 1, "height": 15, "filename": "fig.png"}]
+    for budget_name, budget in (("unbounded", None), ("spooled", 0)):
+        for count in (args.deck_slides // 2, args.deck_slides):
+            jobs = [(work_dir, slot, []) for work_dir in unique_dirs[:count]]
+            tracemalloc.start()
+            start = time.perf_counter()
+            result = app.build_multi_slide_deck(template, 0, jobs, os.path.join(root, "deck.pptx"), workers=1,
+                                                memory_budget=budget)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            name = f"deck_memory_{budget_name}_{count}_slides"
+            results[name] = {"seconds": elapsed, "peak_mb": peak / 1e6,
+                             "media_mb": (result["media_in_memory"] + result["media_spooled"]) / 1e6}
+            print(f"{name:<28} peak {peak / 1e6:10.1f} MB  (媒体共 {results[name]['media_mb']:.1f} MB)")
+
+    # ---------- 多页PPT：单进程 vs 多进程 ----------
+    jobs = [(work_dir, image_configs, text_configs)] * args.deck_slides
+    workers = os.cpu_count() or 1
+    deck_path = os.path.join(root, "deck.pptx")
+    for name, count in (("multi_slide_deck_1_worker", 1), (f"multi_slide_deck_{workers}_workers", workers)):
+        record(name, lambda: app.build_multi_slide_deck(template, args.template_slides // 2, jobs, deck_path,
+                                                        workers=count),
+               slides=args.deck_slides, workers=count, repeat=1)
+    return results
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PPT自动化工具基准测试")
+    parser.add_argument("--images", type=int, default=12, help="图片数量")
+    parser.add_argument("--image-size", type=parse_size, default=(1920, 1080), help="图片分辨率，如1920x1080")
+    parser.add_argument("--image-format", default="png", choices=["png", "jpg", "bmp", "gif"])
+    parser.add_argument("--log-mb", type=int, default=64, help=".o日志大小（MB），可设为数千以模拟GB级日志")
+    parser.add_argument("--many-files", type=int, default=5000, help="大目录中的文件数")
+    parser.add_argument("--template-slides", type=int, default=50, help="模板页数")
+    parser.add_argument("--texts", type=int, default=10, help="文本条目数")
+    parser.add_argument("--deck-slides", type=int, default=60, help="多页PPT测试的页数")
+    parser.add_argument("--bulk-shapes", type=int, default=500, help="大量形状测试的形状数（4/5图片，1/5文本框）")
+    parser.add_argument("--layout-images", type=int, default=300, help="自动排版测试的图片数")
+    parser.add_argument("--format-count", type=int, default=20000, help="format_number测试的数值个数")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数")
+    parser.add_argument("--workdir", help="合成数据目录（默认临时目录，结束后删除）")
+    parser.add_argument("--results", default="bench_results.json", help="结果JSON路径")
+    args = parser.parse_args(argv)
+
+    root = args.workdir or tempfile.mkdtemp(prefix="ppt_bench_")
+    os.makedirs(root, exist_ok=True)
+    try:
+        app.load_heavy_modules()
+        import pptx
+        import PIL
+        results = run_benchmarks(args, root)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "python_pptx": pptx.__version__,
+        "pillow": PIL.__version__,
+        "params": {k: v for k, v in vars(args).items() if k not in ("workdir", "results")},
+        "results": results,
+    }
+    with open(args.results, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.results}")
+
+
+if __name__ == "__main__":
+    main()
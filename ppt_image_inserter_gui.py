@@ -6,20 +6,66 @@ v4.1.1新功能：文本框形式插入文本、一键插字、字体、字间
 v4.1.2新功能：文本不再从单一日志文件读取（依据大数字行号），改为关键词检索文件
 """
 
+import time
+_STARTUP_T0 = time.perf_counter()  # 冷启动计时起点（尽可能早）
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, Canvas, simpledialog
-from pptx import Presentation
-from pptx.util import Inches, Cm, Pt
-from pptx.enum.shapes import MSO_SHAPE_TYPE
-from pptx.enum.text import PP_ALIGN
-from pptx.dml.color import RGBColor
+import io
 import os
+import sys
 import json
-from PIL import Image, ImageTk, ImageDraw, ImageFont
+import hashlib
+import threading
+import zipfile
+import zlib
+from contextlib import contextmanager
 from copy import deepcopy
 from datetime import datetime
 import re
-from decimal import Decimal, getcontext, ROUND_HALF_UP
+from xml.sax.saxutils import escape as xml_escape
+
+# python-pptx / Pillow 体积大、导入慢（单文件exe中尤其明显），改为延迟导入：
+# 窗口先显示，随后在后台线程预加载；首次使用前调用 load_heavy_modules() 保证已加载
+Presentation = None
+Cm = None
+Pt = None
+PP_ALIGN = None
+RGBColor = None
+Image = None
+
+_heavy_modules_lock = threading.Lock()
+_heavy_modules_loaded = False
+
+# 冷启动各阶段耗时（秒），由 record_startup_phase 记录
+STARTUP_TIMES = {}
+
+
+def record_startup_phase(name, start):
+    """记录一个启动阶段的耗时，返回当前时间（作为下一阶段起点）"""
+    now = time.perf_counter()
+    STARTUP_TIMES[name] = now - start
+    return now
+
+
+def load_heavy_modules():
+    """导入python-pptx和Pillow（幂等、线程安全，可在后台线程预加载）"""
+    global Presentation, Cm, Pt, PP_ALIGN, RGBColor, Image, _heavy_modules_loaded
+    if _heavy_modules_loaded:
+        return
+    with _heavy_modules_lock:
+        if _heavy_modules_loaded:
+            return
+        start = time.perf_counter()
+        from pptx import Presentation as _Presentation
+        from pptx.util import Cm as _Cm, Pt as _Pt
+        from pptx.enum.text import PP_ALIGN as _PP_ALIGN
+        from pptx.dml.color import RGBColor as _RGBColor
+        from PIL import Image as _Image
+        Presentation, Cm, Pt = _Presentation, _Cm, _Pt
+        PP_ALIGN, RGBColor, Image = _PP_ALIGN, _RGBColor, _Image
+        record_startup_phase("导入pptx/Pillow", start)
+        _heavy_modules_loaded = True
 
 
 def format_number(value):
@@ -32,6 +78,9 @@ def format_number(value):
         if not isfinite(num):
             return str(value)
 
+        # decimal只在格式化数字时才需要，延迟导入
+        from decimal import Decimal, getcontext, ROUND_HALF_UP
+
         # 设置decimal精度
         getcontext().prec = 10
 
@@ -94,15 +143,12 @@ def format_text(text):
 
 # 配置文件路径
 CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".ppt_image_inserter")
-MODES_FILE = os.path.join(CONFIG_DIR, "custom_modes.json")
+MODES_FILE = os.path.join(CONFIG_DIR, "custom_modes.json")  # 旧版单文件格式，仅用于迁移
+MODES_DIR = os.path.join(CONFIG_DIR, "modes")
 
 # 默认模板文件路径（所有模板都放在一个PPT中，幻灯片索引对应布局模式）
 DEFAULT_TEMPLATE_FILE = "templates/Templates.pptx"
 
-# 确保配置目录存在
-if not os.path.exists(CONFIG_DIR):
-    os.makedirs(CONFIG_DIR)
-
 
 class RoundedButton(tk.Canvas):
     """圆角按钮类"""
@@ -221,10 +267,147 @@ def convert_to_cm(ppt_unit):
         return (emu_value / 914400) * 2.54
 
 
+# 模板元数据缓存：(绝对路径, mtime_ns, 大小) -> 元数据，模板文件改动后自动失效
+_template_cache = {}
+_template_cache_lock = threading.Lock()
 
-def load_custom_modes():
-    """加载自定义贴图模式（包含模板信息和文本布局）"""
-    default_modes = {
+
+def template_cache_key(path):
+    """模板缓存键：路径 + 修改时间 + 大小"""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
+def _describe_shape(shape):
+    """提取单个形状的轻量信息（厘米坐标、类型、占位符类型）"""
+    def cm_or_none(value):
+        return round(convert_to_cm(value), 3) if value is not None else None
+
+    placeholder_type = None
+    if shape.is_placeholder:
+        try:
+            placeholder_type = shape.placeholder_format.type.name
+        except Exception:
+            placeholder_type = None
+    try:
+        shape_type = shape.shape_type.name if shape.shape_type is not None else None
+    except Exception:
+        shape_type = None
+    return {
+        "shape_id": shape.shape_id,
+        "name": shape.name,
+        "shape_type": shape_type,
+        "is_placeholder": shape.is_placeholder,
+        "placeholder_type": placeholder_type,
+        "has_text": shape.has_text_frame and bool(shape.text_frame.text.strip()),
+        "left": cm_or_none(shape.left),
+        "top": cm_or_none(shape.top),
+        "width": cm_or_none(shape.width),
+        "height": cm_or_none(shape.height),
+    }
+
+
+def get_template_info(path):
+    """返回模板元数据（按路径+mtime+大小缓存，命中时只需一次stat）
+
+    返回字典：blob（文件内容）、slide_count、slides（每页的版式名和形状列表，坐标单位为厘米）
+    """
+    key = template_cache_key(path)
+    info = _template_cache.get(key)
+    if info is not None:
+        return info
+
+    with _template_cache_lock:
+        info = _template_cache.get(key)
+        if info is not None:
+            return info
+
+        load_heavy_modules()
+        with open(path, 'rb') as f:
+            blob = f.read()
+        prs = Presentation(io.BytesIO(blob))
+        slides = []
+        for index, slide in enumerate(prs.slides):
+            slides.append({
+                "index": index,
+                "layout_name": slide.slide_layout.name,
+                "shapes": [_describe_shape(shape) for shape in slide.shapes],
+            })
+        info = {
+            "path": key[0],
+            "blob": blob,
+            "slide_count": len(slides),
+            "slide_width": round(convert_to_cm(prs.slide_width), 3),
+            "slide_height": round(convert_to_cm(prs.slide_height), 3),
+            "slides": slides,
+        }
+        # 同一路径只保留最新版本
+        for old_key in [k for k in _template_cache if k[0] == key[0]]:
+            del _template_cache[old_key]
+        _template_cache[key] = info
+        return info
+
+
+def open_template(path):
+    """从缓存的模板内容打开一个新的Presentation（省去重复读盘）"""
+    return Presentation(io.BytesIO(get_template_info(path)["blob"]))
+
+
+def reading_order(shapes, row_tolerance=1.0):
+    """按阅读顺序排序形状：先按行（上边距相差不超过row_tolerance厘米视为同一行），行内从左到右"""
+    rows = []
+    for shape in sorted(shapes, key=lambda sh: (sh["top"], sh["left"])):
+        if rows and abs(shape["top"] - rows[-1][0]["top"]) <= row_tolerance:
+            rows[-1].append(shape)
+        else:
+            rows.append([shape])
+    return [shape for row in rows for shape in sorted(row, key=lambda sh: sh["left"])]
+
+
+def layouts_from_template_slide(slide_info):
+    """把模板页中的图片占位符/图片形状、空白文本框/正文占位符转换为 layouts / text_layouts"""
+    picture_shapes = []
+    text_shapes = []
+    for shape in slide_info["shapes"]:
+        if None in (shape["left"], shape["top"], shape["width"], shape["height"]):
+            continue
+        if shape["placeholder_type"] == "PICTURE" or shape["shape_type"] == "PICTURE":
+            picture_shapes.append(shape)
+        elif not shape["has_text"] and (shape["shape_type"] == "TEXT_BOX"
+                                         or shape["placeholder_type"] in ("BODY", "OBJECT")):
+            text_shapes.append(shape)
+
+    layouts = [{
+        "slide": 0,
+        "left": shape["left"],
+        "top": shape["top"],
+        "width": shape["width"],
+        "height": shape["height"],
+    } for shape in reading_order(picture_shapes)]
+    text_layouts = [{
+        "line_number": 1,
+        "file_cols": "1",
+        "left": shape["left"],
+        "top": shape["top"],
+        "keyword": "",
+    } for shape in reading_order(text_shapes)]
+    return layouts, text_layouts
+
+
+def warm_template_cache(path):
+    """后台线程预读模板元数据，之后询问模板信息的对话框可立即响应"""
+    def worker():
+        try:
+            get_template_info(path)
+        except Exception:
+            pass  # 出错留到真正使用时再报告
+    threading.Thread(target=worker, daemon=True).start()
+
+
+
+def default_custom_modes():
+    """内置的模式集合（只有"自定义"），启动时先用它绘制界面"""
+    return {
         "自定义": {
             "description": "手动配置每张图片的位置和大小",
             "template_file": None,  # 无模板
@@ -234,40 +417,3573 @@ def load_custom_modes():
         }
     }
 
-    if os.path.exists(MODES_FILE):
+
+def normalize_mode(mode):
+    """补全旧版本模式数据中缺失的字段（原地修改并返回）"""
+    # 兼容旧版本数据（没有template_file和slide_index的情况）
+    if "template_file" not in mode:
+        mode["template_file"] = None
+    if "slide_index" not in mode:
+        mode["slide_index"] = 0
+    # 兼容旧版本数据（没有text_layouts的情况）
+    if "text_layouts" not in mode:
+        mode["text_layouts"] = []
+    return mode
+
+
+def atomic_write_json(path, data, indent=None):
+    """原子写入JSON：先写同目录临时文件并刷盘，再用os.replace替换，中途崩溃不会留下半个文件"""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ModeStore:
+    """布局模式存储：每个模式一个JSON文件 + 一个轻量索引
+
+    - 保存/删除只原子地写入单个模式文件和索引，不再整体重写所有模式
+    - 索引只含名称、描述、模板等摘要，layouts/text_layouts 在首次访问时才读取
+    - 对外提供与原来的模式字典相同的接口（keys/get/[]/in），界面代码无需区分
+    """
+
+    INDEX_NAME = "index.json"
+
+    def __init__(self, directory, legacy_file=None):
+        self.directory = directory
+        self.index_path = os.path.join(directory, self.INDEX_NAME)
+        self.legacy_file = legacy_file
+        self._builtin = default_custom_modes()
+        self._index = {}    # 名称 -> 摘要（含文件名）
+        self._loaded = {}   # 名称 -> 完整模式数据（懒加载缓存）
+        self._names_lower = []
+        self._load_index()
+
+    # ---------- 索引 ----------
+
+    def _load_index(self):
+        """读取索引；索引缺失、损坏或与模式文件不一致时以模式文件为准重建
+
+        只有模式目录中还没有任何模式文件时才迁移旧版custom_modes.json（首次运行），
+        索引损坏时不会用旧文件覆盖之后保存的模式。
+        """
+        index = None
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f).get("modes", {})
+            except Exception:
+                index = None
+
         try:
-            with open(MODES_FILE, 'r', encoding='utf-8') as f:
+            mode_files = {n for n in os.listdir(self.directory)
+                          if n.endswith(".json") and n != self.INDEX_NAME}
+        except OSError:
+            mode_files = set()
+
+        if index is None and not mode_files and self.legacy_file and os.path.exists(self.legacy_file):
+            self._migrate_legacy()
+            return
+
+        if index is None or {entry.get("file") for entry in index.values()} != mode_files:
+            # 保存中途崩溃（模式文件已写、索引未写）等情况：以模式文件为准重建索引
+            index = self._rebuild_index(mode_files)
+        self._index = index
+        self._refresh_names()
+
+    def _rebuild_index(self, mode_files):
+        index = {}
+        for filename in sorted(mode_files):
+            try:
+                with open(os.path.join(self.directory, filename), 'r', encoding='utf-8') as f:
+                    mode = json.load(f)
+                name = mode.pop("name")
+            except Exception:
+                continue
+            index[name] = self._summary(filename, normalize_mode(mode))
+        if mode_files or os.path.exists(self.index_path):
+            self._write_index(index)
+        return index
+
+    def _migrate_legacy(self):
+        """把旧版单文件custom_modes.json拆分为每模式一个文件，成功后把旧文件改名为 .migrated（保留备份）"""
+        try:
+            with open(self.legacy_file, 'r', encoding='utf-8') as f:
                 modes = json.load(f)
-                # 确保自定义模式存在
-                if "自定义" not in modes:
-                    modes["自定义"] = default_modes["自定义"]
-                # 兼容旧版本数据
-                for name, mode in modes.items():
-                    # 兼容旧版本数据（没有template_file和slide_index的情况）
-                    if "template_file" not in mode:
-                        mode["template_file"] = None
-                    if "slide_index" not in mode:
-                        mode["slide_index"] = 0
-                    # 兼容旧版本数据（没有text_layouts的情况）
-                    if "text_layouts" not in mode:
-                        mode["text_layouts"] = []
-                return modes
-        except:
-            return default_modes
-    return default_modes
+        except Exception:
+            modes = {}
+        self._index = {}
+        for name, mode in modes.items():
+            if name == "自定义":
+                continue
+            filename = self._filename_for(name)
+            atomic_write_json(os.path.join(self.directory, filename),
+                              dict(normalize_mode(mode), name=name))
+            self._index[name] = self._summary(filename, mode)
+        self._write_index(self._index)
+        self._refresh_names()
+        try:
+            os.replace(self.legacy_file, self.legacy_file + ".migrated")
+        except OSError:
+            pass  # 改名失败也无妨：模式目录已有文件，不会再次迁移
+
+    def _write_index(self, index):
+        atomic_write_json(self.index_path, {"version": 1, "modes": index})
+
+    def _refresh_names(self):
+        self._names_lower = [(name, name.lower()) for name in self._index]
+
+    @staticmethod
+    def _summary(filename, mode):
+        return {
+            "file": filename,
+            "description": mode.get("description", ""),
+            "template_file": mode.get("template_file"),
+            "slide_index": mode.get("slide_index", 0),
+            "image_count": len(mode.get("layouts", [])),
+            "text_count": len(mode.get("text_layouts", [])),
+        }
 
+    @staticmethod
+    def _filename_for(name):
+        """模式名 -> 文件名（保留可读部分，加哈希避免非法字符和重名）"""
+        readable = re.sub(r'[\\/:*?"<>|\s]+', '_', name)[:60]
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:10]
+        return f"{readable}-{digest}.json"
 
-def save_custom_modes(modes):
-    """保存自定义贴图模式"""
-    try:
-        with open(MODES_FILE, 'w', encoding='utf-8') as f:
-            json.dump(modes, f, ensure_ascii=False, indent=2)
+    # ---------- 字典接口 ----------
+
+    def keys(self):
+        return ["自定义"] + list(self._index)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self._index) + 1
+
+    def __contains__(self, name):
+        return name in self._builtin or name in self._index
+
+    def __getitem__(self, name):
+        if name in self._builtin:
+            return self._builtin[name]
+        if name not in self._loaded:
+            entry = self._index[name]
+            with open(os.path.join(self.directory, entry["file"]), 'r', encoding='utf-8') as f:
+                mode = json.load(f)
+            mode.pop("name", None)
+            self._loaded[name] = normalize_mode(mode)
+        return self._loaded[name]
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except (KeyError, OSError, ValueError):
+            return default
+
+    def summary(self, name):
+        """返回模式摘要（不读取布局数据）"""
+        return self._index.get(name)
+
+    def filter(self, text):
+        """按名称筛选（不区分大小写的子串匹配），返回下拉框用的名称列表"""
+        text = text.strip().lower()
+        if not text:
+            return self.keys()
+        return [name for name, lower in self._names_lower if text in lower]
+
+    # ---------- 写入 ----------
+
+    def save_mode(self, name, mode):
+        """原子地保存单个模式；写入失败时抛出异常（由调用方提示）"""
+        entry = self._index.get(name)
+        filename = entry["file"] if entry else self._filename_for(name)
+        atomic_write_json(os.path.join(self.directory, filename), dict(mode, name=name))
+        index = dict(self._index)
+        index[name] = self._summary(filename, mode)
+        self._write_index(index)
+        self._index = index
+        self._loaded[name] = normalize_mode(mode)
+        self._refresh_names()
+
+    def delete_mode(self, name):
+        """删除单个模式（先更新索引再删文件），返回是否存在该模式；写入失败时抛出异常（由调用方提示）"""
+        entry = self._index.get(name)
+        if entry is None:
+            return False
+        index = dict(self._index)
+        del index[name]
+        self._write_index(index)
+        path = os.path.join(self.directory, entry["file"])
+        if os.path.exists(path):
+            os.remove(path)
+        self._index = index
+        self._loaded.pop(name, None)
+        self._refresh_names()
         return True
+
+
+def load_custom_modes():
+    """加载自定义贴图模式存储（只读索引，布局数据按需加载）"""
+    return ModeStore(MODES_DIR, legacy_file=MODES_FILE)
+
+
+# ========== 分阶段计时 ==========
+
+# 计时导出格式：环境变量 PPT_INSERTER_TRACE=jsonl 或 chrome 时，每次生成后在输出文件旁导出计时数据
+TRACE_FORMAT = os.environ.get("PPT_INSERTER_TRACE", "").strip().lower() or None
+
+
+class PhaseTimer:
+    """轻量的分阶段计时器（每个阶段只有两次perf_counter和一次append，可常开）
+
+    事件格式：(名称, 开始时间, 耗时, 参数字典或None, 线程ID)，时间单位为秒
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.peak_tracker = None  # 性能分析时由 run_profiled 设置，每个阶段结束时检查内存
+
+    @contextmanager
+    def phase(self, name, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.events.append((name, start, time.perf_counter() - start, args or None,
+                                threading.get_ident()))
+            if self.peak_tracker is not None:
+                self.peak_tracker.checkpoint(name)
+
+    def totals(self):
+        """按阶段名汇总：{名称: (总耗时, 次数)}，保持首次出现的顺序"""
+        totals = {}
+        for name, _, duration, _, _ in self.events:
+            total, count = totals.get(name, (0.0, 0))
+            totals[name] = (total + duration, count + 1)
+        return totals
+
+    def summary(self):
+        """一行耗时分解，如"模板加载 12ms，插入图片 40ms(×12)，保存 80ms" """
+        parts = []
+        for name, (total, count) in self.totals().items():
+            part = f"{name} {total * 1000:.0f}ms"
+            if count > 1:
+                part += f"(×{count})"
+            parts.append(part)
+        return "，".join(parts)
+
+    def export_jsonl(self, path):
+        """每个事件一行JSON（时间单位毫秒，相对计时器创建时刻）"""
+        with open(path, 'w', encoding='utf-8') as f:
+            for name, start, duration, args, tid in self.events:
+                record = {"name": name, "start_ms": round((start - self.origin) * 1000, 3),
+                          "duration_ms": round(duration * 1000, 3), "tid": tid}
+                if args:
+                    record["args"] = args
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def export_chrome_trace(self, path):
+        """导出Chrome trace-event格式（可在 chrome://tracing 或 Perfetto 中打开）"""
+        pid = os.getpid()
+        events = [{"name": name, "ph": "X", "pid": pid, "tid": tid,
+                   "ts": round((start - self.origin) * 1e6, 1), "dur": round(duration * 1e6, 1),
+                   "args": args or {}}
+                  for name, start, duration, args, tid in self.events]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+    def export(self, output_path, trace_format):
+        """按格式在output_path旁导出计时数据，返回导出文件路径"""
+        base = os.path.splitext(output_path)[0]
+        if trace_format == "jsonl":
+            path = base + ".trace.jsonl"
+            self.export_jsonl(path)
+        else:
+            path = base + ".trace.json"
+            self.export_chrome_trace(path)
+        return path
+
+
+# ========== 性能分析模式（cProfile + tracemalloc，默认关闭） ==========
+
+# 环境变量 PPT_INSERTER_PROFILE=1 时默认开启（也可在"诊断"菜单中切换）
+PROFILE_ENABLED = os.environ.get("PPT_INSERTER_PROFILE", "").strip() not in ("", "0")
+
+
+class PeakSnapshotTracker:
+    """在各计时阶段结束时检查已分配内存，保留其中占用最高时刻的tracemalloc快照
+
+    只在阶段结束时采样，快照不一定是真正的峰值（阶段内部的临时分配可能已释放），真正的峰值见 get_traced_memory。
+    """
+
+    def __init__(self):
+        self.best = 0
+        self.label = None
+        self.snapshot = None
+
+    def checkpoint(self, label):
+        import tracemalloc
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.best:
+            self.best = current
+            self.label = label
+            self.snapshot = tracemalloc.take_snapshot()
+
+
+def run_profiled(func, output_path, timer=None, top=25):
+    """在cProfile和tracemalloc下运行func，把分析结果保存到output_path旁
+
+    timer 为func使用的PhaseTimer，给出时在它的每个阶段结束时检查内存（见 PeakSnapshotTracker）。
+    生成文件：.prof（可用snakeviz等工具打开）、.profile.txt（按累计耗时排序的前top个函数）、
+    .memory.txt（峰值内存、各阶段结束时占用最高的时刻及其前top个内存分配位置）。
+    返回 (func的返回值, 信息字典：prof/profile/memory 路径、peak 峰值字节数)。
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    base = os.path.splitext(output_path)[0]
+    profiler = cProfile.Profile()
+    tracker = PeakSnapshotTracker()
+    # 已在跟踪时（如 python -X tracemalloc）沿用现有跟踪，结束后也不停止
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(10)
+    if timer is not None:
+        timer.peak_tracker = tracker
+    try:
+        profiler.enable()
+        try:
+            result = func()
+        finally:
+            profiler.disable()
+            current, peak = tracemalloc.get_traced_memory()
+            tracker.checkpoint("结束")
+    finally:
+        if timer is not None:
+            timer.peak_tracker = None
+        if started:
+            tracemalloc.stop()
+
+    info = {"prof": base + ".prof", "profile": base + ".profile.txt",
+            "memory": base + ".memory.txt", "peak": peak}
+    profiler.dump_stats(info["prof"])
+    with open(info["profile"], 'w', encoding='utf-8') as f:
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats("cumulative").print_stats(top)
+
+    snapshot = tracker.snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ])
+    with open(info["memory"], 'w', encoding='utf-8') as f:
+        f.write(f"峰值内存: {peak / 1024 / 1024:.1f} MB\n")
+        f.write(f"结束时仍占用: {current / 1024 / 1024:.1f} MB\n")
+        f.write(f"各阶段结束时占用最高: '{tracker.label}' 结束时 {tracker.best / 1024 / 1024:.1f} MB\n")
+        f.write("（快照只在阶段结束时采集，阶段内部已释放的临时分配不在其中，不一定是峰值时刻）\n\n")
+        f.write(f"该快照中占用最多的 {top} 个分配位置（按行）:\n")
+        for stat in snapshot.statistics("lineno")[:top]:
+            f.write(f"{stat}\n")
+        f.write("\n占用最多的 3 个分配调用栈:\n")
+        for stat in snapshot.statistics("traceback")[:3]:
+            f.write(f"\n{stat.size / 1024:.1f} KiB，{stat.count} 个对象\n")
+            for line in stat.traceback.format():
+                f.write(f"{line}\n")
+    return result, info
+
+
+# ========== 生成核心（不依赖界面，可无界面调用/基准测试） ==========
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
+TEXT_EXTENSIONS = ['.txt', '.csv', '.log', '.dat', '.json', '.xml']
+TEXT_ENCODINGS = ['utf-8', 'gbk', 'gb2312', 'utf-16', 'latin-1']
+TEXT_FONT_NAME = 'LiciumFont 2022'
+TEXT_FONT_SIZE = 20
+
+
+class TextExtractionError(Exception):
+    """文本提取失败（消息会以"文本N: "为前缀显示给用户）"""
+
+
+def list_image_files(work_dir):
+    """列出工作目录下的图片文件（按文件名排序）"""
+    return sorted(filename for filename in os.listdir(work_dir)
+                  if os.path.splitext(filename.lower())[1] in IMAGE_EXTENSIONS)
+
+
+# 压缩日志：按文件头魔数识别（不看扩展名），读取时用标准库流式解压
+COMPRESSION_MAGIC = [(b'\x1f\x8b', 'gzip'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz')]
+COMPRESSED_EXTENSIONS = ['.gz', '.bz2', '.xz']
+
+
+def detect_compression(path):
+    """按文件头魔数判断压缩格式，返回 'gzip'/'bz2'/'xz'，未压缩返回None"""
+    with open(path, 'rb') as f:
+        head = f.read(6)
+    for magic, kind in COMPRESSION_MAGIC:
+        if head.startswith(magic):
+            return kind
+    return None
+
+
+def open_data_file(path):
+    """以二进制方式打开数据文件；压缩文件返回流式解压的文件对象（只解压实际读到的部分）"""
+    kind = detect_compression(path)
+    if kind == 'gzip':
+        import gzip
+        return gzip.open(path, 'rb')
+    if kind == 'bz2':
+        import bz2
+        return bz2.open(path, 'rb')
+    if kind == 'xz':
+        import lzma
+        return lzma.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def strip_compression_suffix(filename):
+    """去掉 .gz/.bz2/.xz 后缀（run.log.gz -> run.log），用于按扩展名判断数据文件类型"""
+    base, ext = os.path.splitext(filename)
+    return base if ext.lower() in COMPRESSED_EXTENSIONS else filename
+
+
+def looks_like_text_file(filepath):
+    """读取文件前100字节（压缩文件为解压后的前100字节）判断是否为文本"""
+    with open_data_file(filepath) as f:
+        chunk = f.read(100)
+    # 检查是否包含大量控制字符（非文本）
+    text_chars = 0
+    for byte in chunk:
+        if byte >= 32 or byte in [9, 10, 13]:  # 空格及可打印字符、制表符、换行符
+            text_chars += 1
+    return text_chars / max(len(chunk), 1) > 0.7  # 70%以上是文本字符
+
+
+def find_text_file(work_dir, keyword):
+    """根据关键词搜索数据文件，返回文件名（找不到返回None）"""
+    if keyword:
+        # 搜索包含关键词的文件
+        try:
+            for filename in os.listdir(work_dir):
+                if keyword in filename:
+                    filepath = os.path.join(work_dir, filename)
+                    if os.path.isfile(filepath):
+                        return filename
+        except Exception as e:
+            raise TextExtractionError(f"搜索文件失败 - {str(e)}")
+        return None
+
+    # 如果没有关键词，搜索所有文本文件
+    text_files = []
+    try:
+        for filename in os.listdir(work_dir):
+            # 检查标准扩展名（压缩文件看去掉压缩后缀后的扩展名）
+            name = strip_compression_suffix(filename)
+            if os.path.splitext(name.lower())[1] in TEXT_EXTENSIONS:
+                text_files.append(filename)
+            # 检查.o数字格式（如 .o2343908）
+            elif re.search(r'\.o\d+$', name):
+                text_files.append(filename)
+    except Exception:
+        text_files = []
+
+    # 如果没有找到文本文件，也尝试读取所有文件，判断是否为文本
+    if not text_files:
+        try:
+            for filename in os.listdir(work_dir):
+                filepath = os.path.join(work_dir, filename)
+                if os.path.isfile(filepath):
+                    try:
+                        if looks_like_text_file(filepath):
+                            text_files.append(filename)
+                    except Exception:
+                        continue
+        except Exception:
+            pass
+
+    # 按文件名排序，使用第一个文件
+    text_files.sort()
+    return text_files[0] if text_files else None
+
+
+class LineIndex:
+    """文本文件的稀疏行索引：每读一块（1MB）记录一个检查点 (该位置之前的换行数, 字节偏移)
+
+    - 只扫描到所需的行为止，读取开头的行不必读完整个大文件
+    - 文件只在末尾追加时（大小未变小、已扫描部分末尾的内容未变），从记住的偏移继续扫描新增字节
+    - 行的划分与 bytes.split(b'\\n') 一致；整个文件没有 \\n 但有 \\r（旧Mac换行）时 cr_only() 为True，由调用方整体读取
+    """
+
+    CHUNK_SIZE = 1 << 20
+    TAIL_PROBE = 64  # 用于判断已扫描部分是否被改写的字节数
+    kind = None  # 未压缩
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.checkpoints = [(0, 0)]  # (偏移之前的换行数, 偏移)
+        self.scanned_to = 0          # 已扫描的字节数
+        self.newlines = 0            # 已扫描部分的换行数
+        self.tail_probe = b''        # 已扫描部分末尾的若干字节
+        self.size = 0
+        self.saw_cr = False          # 第一个 \n 之前出现过 \r
+
+    def _still_valid(self, f, size):
+        """文件只是追加（或未变）时返回True"""
+        if size < self.scanned_to:
+            return False
+        start = self.scanned_to - len(self.tail_probe)
+        f.seek(start)
+        return f.read(len(self.tail_probe)) == self.tail_probe
+
+    def _scan(self, f, size, stop_after_newlines):
+        """从scanned_to继续扫描，直到换行数超过stop_after_newlines或到达文件末尾"""
+        f.seek(self.scanned_to)
+        while self.scanned_to < size and self.newlines <= stop_after_newlines:
+            chunk = f.read(min(self.CHUNK_SIZE, size - self.scanned_to))
+            if not chunk:
+                break
+            if not self.newlines and not self.saw_cr:
+                self.saw_cr = b'\r' in chunk
+            self.newlines += chunk.count(b'\n')
+            self.scanned_to += len(chunk)
+            self.checkpoints.append((self.newlines, self.scanned_to))
+            self.tail_probe = chunk[-self.TAIL_PROBE:]
+
+    def get_line(self, line_index):
+        """返回第line_index行（从0开始）的原始字节（不含换行符），行不存在返回None"""
+        with self._lock, open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if not self._still_valid(f, size):
+                self.reset()
+            self.size = size
+            self._scan(f, size, line_index)
+            if line_index > self.newlines:
+                return None
+
+            # 找到第line_index个换行之前最近的检查点，从那里开始数换行
+            newlines_before, offset = 0, 0
+            for cp_newlines, cp_offset in reversed(self.checkpoints):
+                if cp_newlines < line_index or cp_offset == 0:
+                    newlines_before, offset = cp_newlines, cp_offset
+                    break
+            f.seek(offset)
+            remaining = line_index - newlines_before
+            buffer = b''
+            while remaining > 0:
+                chunk = f.read(self.CHUNK_SIZE)
+                if not chunk:
+                    return None
+                count = chunk.count(b'\n')
+                if count < remaining:
+                    remaining -= count
+                    continue
+                pos = -1
+                for _ in range(remaining):
+                    pos = chunk.index(b'\n', pos + 1)
+                buffer = chunk[pos + 1:]
+                remaining = 0
+
+            # 读到本行结束
+            parts = [buffer]
+            while b'\n' not in parts[-1]:
+                chunk = f.read(self.CHUNK_SIZE)
+                if not chunk:
+                    break
+                parts.append(chunk)
+            return b''.join(parts).split(b'\n', 1)[0]
+
+    def cr_only(self):
+        """已扫描完整个文件，其中没有 \\n 但有 \\r"""
+        return self.newlines == 0 and self.saw_cr and self.scanned_to >= self.size
+
+
+class CompressedLineIndex:
+    """压缩日志（gzip/bz2/xz）的行读取：流式解压到所需的行读完为止，不解压文件其余部分
+
+    - 记住上次解压停下的位置（压缩文件偏移 + 解压器）和最后解压出的一块数据，之后读取的行在这块数据中时直接取出，
+      更靠后的行从停下的位置继续解压
+    - gzip 的解压器状态可以复制：每解压约8MB压缩数据记录一个检查点，读取任意靠后的行都从最近的检查点继续；
+      bz2/xz 的解压器不能复制，读更靠前的行时只能从头解压
+    - 读过的行按行号缓存；文件大小或修改时间变化时丢弃全部缓存
+    - 行的划分与 bytes.split(b'\\n') 一致，多段拼接的压缩流按一个文件处理；只用 \\r 换行时见 LineIndex.cr_only
+    """
+
+    CHUNK_SIZE = 256 << 10
+    CHECKPOINT_INTERVAL = 8 << 20
+    LINE_CACHE_SIZE = 256
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self.signature = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.checkpoints = []   # gzip：[(之前的换行数, 压缩文件偏移, 解压器副本)]
+        self.frontier = None    # 上次停下的位置：(之前的换行数, 压缩文件偏移, 解压器)
+        self.total_newlines = None  # 解压到过末尾时的总换行数
+        self.window = None      # 最后解压出的一块：(之前的换行数, 数据)
+        self.lines = {}
+        self.saw_cr = False     # 第一个 \n 之前出现过 \r
+
+    def _new_decompressor(self):
+        if self.kind == 'gzip':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.kind == 'bz2':
+            import bz2
+            return bz2.BZ2Decompressor()
+        import lzma
+        return lzma.LZMADecompressor()
+
+    def _decompress(self, decompressor, data):
+        """解压一块数据，一段压缩流结束后用新的解压器继续处理后面拼接的流，返回 (解压器, 输出)"""
+        output = []
+        while data:
+            output.append(decompressor.decompress(data))
+            if not decompressor.eof:
+                break
+            data = decompressor.unused_data
+            decompressor = self._new_decompressor()
+            if not data.strip(b'\x00'):  # gzip末尾允许的填充
+                break
+        return decompressor, b''.join(output)
+
+    def get_line(self, line_index):
+        """返回第line_index行（从0开始）的原始字节（不含换行符），行不存在返回None"""
+        with self._lock:
+            stat = os.stat(self.path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature != self.signature:
+                self.reset()
+                self.signature = signature
+            if line_index in self.lines:
+                return self.lines[line_index]
+            if self.total_newlines is not None and line_index > self.total_newlines:
+                return None
+            try:
+                raw = self._line_in_window(line_index)
+                if raw is None:
+                    raw = self._read_line(line_index)
+            except Exception:
+                self.reset()
+                raise
+            if len(self.lines) >= self.LINE_CACHE_SIZE:
+                self.lines.pop(next(iter(self.lines)))
+            self.lines[line_index] = raw
+            return raw
+
+    def _line_in_window(self, line_index):
+        """目标行完整地位于最后解压出的一块数据中时直接返回，否则返回None"""
+        if self.window is None:
+            return None
+        before, output = self.window
+        skip = line_index - before
+        if skip <= 0 or output.count(b'\n') <= skip:
+            return None
+        pos = -1
+        for _ in range(skip):
+            pos = output.index(b'\n', pos + 1)
+        return output[pos + 1:output.index(b'\n', pos + 1)]
+
+    def _read_line(self, line_index):
+        # 起点：之前的换行数小于目标行号的最近位置（上次停下处或gzip检查点），否则从头开始
+        newlines, offset, decompressor = 0, 0, None
+        for cp_newlines, cp_offset, cp_decompressor in reversed(self.checkpoints):
+            if cp_newlines < line_index:
+                newlines, offset, decompressor = cp_newlines, cp_offset, cp_decompressor.copy()
+                break
+        if self.frontier and newlines <= self.frontier[0] < line_index:
+            newlines, offset, decompressor = self.frontier
+        self.frontier = None
+        decompressor = decompressor or self._new_decompressor()
+        last_checkpoint = self.checkpoints[-1][1] if self.checkpoints else 0
+
+        parts = [] if line_index == newlines else None  # 目标行已读到的部分（None表示还没到行首）
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                data = f.read(self.CHUNK_SIZE)
+                if not data:
+                    self.total_newlines = newlines
+                    break
+                decompressor, output = self._decompress(decompressor, data)
+                offset += len(data)
+                before = newlines
+                if not newlines and not self.saw_cr:
+                    self.saw_cr = b'\r' in output
+                newlines += output.count(b'\n')
+                self.window = (before, output)
+                if parts is not None:
+                    parts.append(output)
+                elif newlines >= line_index:  # 目标行的行首在这一块里
+                    pos = -1
+                    for _ in range(line_index - before):
+                        pos = output.index(b'\n', pos + 1)
+                    parts = [output[pos + 1:]]
+                if self.kind == 'gzip' and offset - last_checkpoint >= self.CHECKPOINT_INTERVAL:
+                    self.checkpoints.append((newlines, offset, decompressor.copy()))
+                    last_checkpoint = offset
+                if parts is not None and b'\n' in parts[-1]:
+                    self.frontier = (newlines, offset, decompressor)
+                    break
+        if parts is None:
+            return None
+        return b''.join(parts).split(b'\n', 1)[0]
+
+    def cr_only(self):
+        """已解压到末尾，其中没有 \\n 但有 \\r"""
+        return self.total_newlines == 0 and self.saw_cr
+
+
+# 行索引缓存：路径 -> LineIndex / CompressedLineIndex（监视模式下反复读取同一个增长中的日志时只读新增部分）
+# 最多保留 LINE_INDEX_CACHE_SIZE 个文件，超出时丢弃最久未用的
+LINE_INDEX_CACHE_SIZE = 64
+_line_index_cache = {}
+_line_index_lock = threading.Lock()
+
+
+def get_line_index(path):
+    key = os.path.abspath(path)
+    kind = detect_compression(key)
+    with _line_index_lock:
+        index = _line_index_cache.pop(key, None)
+        if index is None or index.kind != kind:
+            index = CompressedLineIndex(key, kind) if kind else LineIndex(key)
+        _line_index_cache[key] = index  # 重新插入到末尾：字典顺序即使用顺序
+        if len(_line_index_cache) > LINE_INDEX_CACHE_SIZE:
+            _line_index_cache.pop(next(iter(_line_index_cache)))
+        return index
+
+
+def decode_line(raw):
+    """按 TEXT_ENCODINGS 顺序解码一行（UTF-16整文件另行处理），都失败时忽略错误按UTF-8解码"""
+    for encoding in TEXT_ENCODINGS:
+        if encoding == 'utf-16':
+            continue
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode('utf-8', errors='ignore')
+
+
+def read_text_line(text_path, line_number):
+    """读取文本文件第line_number行（从1开始）
+
+    按行索引只读取所需部分（大文件、增长中的日志都不必整体读入），再按多种编码尝试解码该行。
+    gzip/bz2/xz压缩的日志流式解压，读到所需的行即停止。带BOM的UTF-16文件无法按字节换行分割、
+    只用 \\r 换行的文件没有 \\n 可分割，这两种仍整体解码。
+    """
+    line_index = line_number - 1
+    if line_index < 0:
+        raise TextExtractionError(f"第{line_number}行不存在")
+    try:
+        with open_data_file(text_path) as f:
+            bom = f.read(2)
+        if bom in (b'\xff\xfe', b'\xfe\xff'):
+            return read_text_line_whole(text_path, line_number)
+        index = get_line_index(text_path)
+        raw = index.get_line(line_index)
     except Exception as e:
-        messagebox.showerror("错误", f"保存模式失败: {str(e)}")
+        raise TextExtractionError(f"读取文件失败 - {str(e)}")
+    if index.cr_only():
+        return read_text_line_whole(text_path, line_number)
+    if raw is None:
+        raise TextExtractionError(f"第{line_number}行不存在")
+    return decode_line(raw).strip()
+
+
+def read_text_line_whole(text_path, line_number):
+    """整体读取文本文件（压缩文件先解压）取第line_number行（从1开始），依次尝试多种编码"""
+    line_index = line_number - 1
+    try:
+        with open_data_file(text_path) as f:
+            data = f.read()
+    except Exception as e:
+        raise TextExtractionError(f"读取文件失败 - {str(e)}")
+    for encoding in TEXT_ENCODINGS:
+        try:
+            lines = io.StringIO(data.decode(encoding), newline=None).readlines()
+
+            # 获取指定行（行号从1开始）
+            if 0 <= line_index < len(lines):
+                return lines[line_index].strip()
+            # 编码读取成功但行数不够，继续尝试其他编码
+        except Exception:
+            continue
+
+    # 所有编码都尝试失败，忽略错误按UTF-8解码
+    lines = data.decode('utf-8', errors='ignore').split('\n')
+    if 0 <= line_index < len(lines):
+        return lines[line_index].strip()
+    raise TextExtractionError(f"第{line_number}行不存在")
+
+
+def format_columns(line_content, file_cols):
+    """按列号（多个列用逗号分隔）取值并格式化，多列用/连接；取不到任何列时格式化整行"""
+    col_values = []
+    try:
+        col_numbers = [int(x.strip()) for x in file_cols.split(',')]
+    except Exception as e:
+        raise TextExtractionError(f"解析列号失败 - {str(e)}")
+    # 按空格或制表符分割行内容
+    words = line_content.split()
+    for col_num in col_numbers:
+        col_idx = col_num - 1  # 转换为索引
+        if 0 <= col_idx < len(words):
+            col_values.append(words[col_idx])
+
+    # 如果没有成功获取任何列的值，整行作为默认值
+    if not col_values:
+        return format_text(line_content)
+    # 使用/分隔多个列的值，每列都格式化
+    return '/'.join(format_text(val) for val in col_values)
+
+
+# ---------- 结构化数据（JSON/XML）按路径流式提取 ----------
+
+STREAM_CHUNK_SIZE = 1 << 16
+JSON_PATH_STEP = re.compile(r'\.([^.\[\]]+)|\[(\d+)\]|\[(["\'])(.*?)\3\]')
+JSON_TOKEN = re.compile(r'\s*(?:"([^"\\]*(?:\\.[^"\\]*)*)"|([{}\[\],:])|([^\s{}\[\],:"]+))')
+JSON_SKIP = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|"|[\[\]{}]')
+XPATH_STEP = re.compile(r'(\*|[^\s\[\]/@]+)((?:\[[^\]]*\])*)$')
+XPATH_PREDICATE = re.compile(r'\[\s*(?:(\d+)|@([^\s=\]]+)\s*(?:=\s*(["\'])(.*?)\3)?)\s*\]')
+
+
+def split_data_paths(text):
+    """按逗号拆分多个数据路径（方括号和引号内的逗号不拆）"""
+    paths, depth, quote, current = [], 0, None, []
+    for char in text:
+        if quote:
+            quote = None if char == quote else quote
+        elif char in '"\'':
+            quote = char
+        elif char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            paths.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    paths.append(''.join(current).strip())
+    return [path for path in paths if path]
+
+
+def parse_json_path(path):
+    """解析简化的JSONPath（$.a.b[0]["c d"]，$和开头的点可省略），返回键/下标元组"""
+    text = path.strip()
+    if text.startswith('$'):
+        text = text[1:]
+    if text and text[0] not in '.[':
+        text = '.' + text
+    steps, pos = [], 0
+    while pos < len(text):
+        m = JSON_PATH_STEP.match(text, pos)
+        if not m:
+            raise TextExtractionError(f"JSON路径格式错误: {path}")
+        name, index, _, quoted = m.groups()
+        if index is not None:
+            steps.append(int(index))
+        elif quoted is not None:
+            steps.append(quoted)
+        else:
+            steps.append(name.strip())
+        pos = m.end()
+    return tuple(steps)
+
+
+class JsonStream:
+    """增量JSON词法分析：按块读取，只在需要时解码字符串；不需要的对象/数组用正则整体跳过"""
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """丢弃已处理部分并读入下一块，文件结束时返回False"""
+        chunk = '' if self.eof else self.f.read(STREAM_CHUNK_SIZE)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return bool(chunk)
+
+    def token(self):
+        """返回下一个记号：('s', 原始字符串内容)、('v', 数字/true/false/null) 或 (标点, 标点)；文件结束返回None"""
+        while True:
+            m = JSON_TOKEN.match(self.buf, self.pos)
+            # 记号恰好在缓冲区末尾结束时可能被截断（如数字），读入更多再匹配
+            if m is None or (m.end() == len(self.buf) and not self.eof):
+                if self._fill():
+                    continue
+                if m is None:
+                    if self.buf[self.pos:].strip():
+                        raise TextExtractionError("JSON格式错误")
+                    return None
+            self.pos = m.end()
+            string, punct, literal = m.groups()
+            if string is not None:
+                return 's', string
+            if punct is not None:
+                return punct, punct
+            return 'v', literal
+
+    def skip_container(self):
+        """跳过刚读到开括号的对象或数组（只匹配字符串和括号，其余内容由正则整体越过）"""
+        depth = 1
+        while True:
+            m = JSON_SKIP.search(self.buf, self.pos)
+            if m is None or m.group() == '"':  # 没有括号，或字符串被块边界截断
+                self.pos = len(self.buf) if m is None else m.start()
+                if not self._fill():
+                    raise TextExtractionError("JSON格式错误：文件不完整")
+                continue
+            self.pos = m.end()
+            char = m.group()
+            if char in '[{':
+                depth += 1
+            elif char in ']}':
+                depth -= 1
+                if depth == 0:
+                    return
+
+
+def _json_string(raw):
+    return json.loads(f'"{raw}"') if '\\' in raw else raw
+
+
+def stream_json_values(f, paths):
+    """从JSON文本流中取出各路径（键/下标元组）对应的标量值，全部找到后立即停止读取
+
+    返回 {路径: 值}；路径指向对象或数组时值为None（不是单个值）。
+    """
+    wanted = set(paths)
+    prefixes = {path[:i] for path in wanted for i in range(len(path))}
+    found = {}
+    stream = JsonStream(f)
+    keys = []   # 当前位置的路径
+    stack = []  # 每层容器：[类型, 已读成员数]
+
+    def next_token():
+        token = stream.token()
+        if token is None:
+            raise TextExtractionError("JSON格式错误：文件不完整")
+        return token
+
+    def begin_value(token):
+        """处理一个值的开始，打开了需要深入的容器时返回True"""
+        path = tuple(keys)
+        kind, text = token
+        if kind in ('{', '['):
+            if path in wanted:
+                found[path] = None
+            if path in prefixes:
+                stack.append([kind, 0])
+                return True
+            stream.skip_container()
+        elif kind in ('s', 'v'):
+            if path in wanted:
+                found[path] = _json_string(text) if kind == 's' else text
+        else:
+            raise TextExtractionError(f"JSON格式错误：意外的'{text}'")
+        return False
+
+    token = stream.token()
+    if token is None:
+        raise TextExtractionError("JSON文件为空")
+    begin_value(token)
+    while stack and len(found) < len(wanted):
+        frame = stack[-1]
+        token = next_token()
+        if token[0] == ('}' if frame[0] == '{' else ']'):
+            stack.pop()
+            if stack:
+                keys.pop()
+            continue
+        if frame[1]:
+            if token[0] != ',':
+                raise TextExtractionError("JSON格式错误：缺少逗号")
+            token = next_token()
+        if frame[0] == '{':
+            if token[0] != 's' or next_token()[0] != ':':
+                raise TextExtractionError("JSON格式错误：对象的键无效")
+            keys.append(_json_string(token[1]))
+            token = next_token()
+        else:
+            keys.append(frame[1])
+        frame[1] += 1
+        if not begin_value(token):
+            keys.pop()
+    return found
+
+
+def parse_xpath(path):
+    """解析简化的XPath：/a/b[2]/c、//c[@id='x']、.../@attr、.../text()；返回 (步骤列表, 属性名或None)
+
+    每个步骤为 (是否任意层级, 标签或*, 位置或None, [(属性, 值或None), ...])，标签比较时忽略命名空间。
+    """
+    text = path.strip()
+    attribute = None
+    head, _, last = text.rpartition('/')
+    if last == 'text()':
+        text = head
+    elif last.startswith('@'):
+        text, attribute = head, last[1:]
+    if not text.startswith('/'):
+        text = '//' + text  # 相对路径按任意层级匹配
+    steps = []
+    for descendant, step in re.findall(r'(/{1,2})([^/]+)', text):
+        m = XPATH_STEP.match(step)
+        if not m:
+            raise TextExtractionError(f"XPath格式错误: {path}")
+        position, conditions = None, []
+        for index, name, quote, value in XPATH_PREDICATE.findall(m.group(2)):
+            if index:
+                position = int(index)
+            else:
+                conditions.append((name, value if quote else None))
+        if XPATH_PREDICATE.sub('', m.group(2)).strip():
+            raise TextExtractionError(f"XPath格式错误: {path}")
+        steps.append((descendant == '//', m.group(1), position, conditions))
+    if not steps:
+        raise TextExtractionError(f"XPath格式错误: {path}")
+    return steps, attribute
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _xpath_matches(steps, stack):
+    """判断当前元素栈（[(本地标签, 属性, 同名兄弟中的位置), ...]）是否匹配路径步骤"""
+    def match(step_index, depth):
+        if step_index == len(steps):
+            return depth == len(stack)
+        descendant, name, position, conditions = steps[step_index]
+        candidates = range(depth, len(stack)) if descendant else (depth,)
+        for at in candidates:
+            if at >= len(stack):
+                break
+            tag, attrib, index = stack[at]
+            if name != '*' and name != tag:
+                continue
+            if position is not None and position != index:
+                continue
+            if any(attrib.get(key) is None or (value is not None and attrib.get(key) != value)
+                   for key, value in conditions):
+                continue
+            if match(step_index + 1, at + 1):
+                return True
+        return False
+    return match(0, 0)
+
+
+def stream_xml_values(f, paths):
+    """用 iterparse 流式解析XML，取出各XPath对应的第一个值（元素文本或属性），全部找到后立即停止
+
+    返回 {路径: 值}；已处理完的元素随即清除，内存占用与文件大小无关。
+    """
+    import xml.etree.ElementTree as ET
+    parsed = {path: parse_xpath(path) for path in paths}
+    found = {}
+    stack, counters, elements = [], [{}], []
+    try:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                tag = _local_name(elem.tag)
+                index = counters[-1][tag] = counters[-1].get(tag, 0) + 1
+                stack.append((tag, elem.attrib, index))
+                counters.append({})
+                elements.append(elem)
+                for path, (steps, attribute) in parsed.items():
+                    if attribute and path not in found and attribute in elem.attrib \
+                            and _xpath_matches(steps, stack):
+                        found[path] = elem.attrib[attribute]
+            else:
+                for path, (steps, attribute) in parsed.items():
+                    if not attribute and path not in found and _xpath_matches(steps, stack):
+                        found[path] = (elem.text or '').strip()
+                stack.pop()
+                counters.pop()
+                elements.pop()
+                if elements:
+                    del elements[-1][:]  # 兄弟元素都已处理完，释放内存
+            if len(found) == len(parsed):
+                break
+    except ET.ParseError as e:
+        raise TextExtractionError(f"XML格式错误 - {str(e)}")
+    return found
+
+
+def sniff_structured_format(text_path):
+    """按扩展名（忽略压缩后缀）或首个非空白字符判断是JSON还是XML，都不是时返回None"""
+    ext = os.path.splitext(strip_compression_suffix(text_path).lower())[1]
+    if ext in ('.json', '.xml'):
+        return ext[1:]
+    with open_data_file(text_path) as f:
+        head = f.read(256).lstrip(b'\xef\xbb\xbf \t\r\n')
+    if head[:1] in (b'{', b'['):
+        return 'json'
+    if head[:1] == b'<':
+        return 'xml'
+    return None
+
+
+def read_structured_values(text_path, paths):
+    """按数据路径（JSON文件用JSONPath，XML文件用XPath）流式读取各值（压缩文件边解压边解析），返回与paths同序的字符串列表"""
+    kind = sniff_structured_format(text_path)
+    if kind is None:
+        raise TextExtractionError("按数据路径提取只支持JSON或XML文件")
+    try:
+        if kind == 'json':
+            parsed = [parse_json_path(path) for path in paths]
+            with io.TextIOWrapper(open_data_file(text_path), encoding='utf-8-sig', errors='replace',
+                                  newline='') as f:
+                found = stream_json_values(f, parsed)
+            keys = parsed
+        else:
+            with open_data_file(text_path) as f:
+                found = stream_xml_values(f, paths)
+            keys = paths
+    except TextExtractionError:
+        raise
+    except Exception as e:  # 包括压缩文件损坏时的解压错误
+        raise TextExtractionError(f"读取文件失败 - {str(e)}")
+
+    values = []
+    for path, key in zip(paths, keys):
+        if key not in found:
+            raise TextExtractionError(f"找不到路径 {path}")
+        if found[key] is None:
+            raise TextExtractionError(f"路径 {path} 不是单个值")
+        values.append(found[key])
+    return values
+
+
+def extract_text_value(work_dir, config, timer=None):
+    """按文本配置（关键词、行、列，或JSON/XML数据路径）从工作目录中提取并格式化文本，返回 (文本, 匹配的文件名)"""
+    timer = timer or PhaseTimer()
+    keyword = config.get('keyword', '').strip()
+    with timer.phase("搜索文本文件", keyword=keyword):
+        matched_file = find_text_file(work_dir, keyword)
+    if not matched_file:
+        if keyword:
+            raise TextExtractionError(f"找不到包含关键词'{keyword}'的文件")
+        raise TextExtractionError("找不到文本文件")
+
+    text_path = os.path.join(work_dir, matched_file)
+    if not os.path.exists(text_path):
+        raise TextExtractionError(f"找不到文件 {matched_file}")
+
+    paths = split_data_paths(config.get('path', ''))
+    if paths:
+        # JSON/XML按数据路径流式读取，找到所有路径即停止
+        with timer.phase("读取数据路径", file=matched_file, paths=len(paths)):
+            values = read_structured_values(text_path, paths)
+        with timer.phase("格式化"):
+            return '/'.join(format_text(value) for value in values), matched_file
+
+    with timer.phase("读取文本行", file=matched_file, line=config['line_number']):
+        line_content = read_text_line(text_path, config['line_number'])
+    with timer.phase("格式化"):
+        return format_columns(line_content, config['file_cols']), matched_file
+
+
+def clone_template_slide(prs, source_slide_index):
+    """复制模板页为新幻灯片（不复制图片），删除其余幻灯片，返回 (新幻灯片, 实际使用的页索引)"""
+    new_slides, source_slide_index = clone_template_slides(prs, source_slide_index, 1)
+    return new_slides[0], source_slide_index
+
+
+def clone_template_slides(prs, source_slide_index, count):
+    """把模板页复制count份（图片超出布局时分页用），删除其余幻灯片，返回 (新幻灯片列表, 实际使用的页索引)"""
+    # 检查幻灯片索引是否有效
+    if source_slide_index < 0 or source_slide_index >= len(prs.slides):
+        source_slide_index = 0
+
+    # 确保源幻灯片存在
+    while len(prs.slides) <= source_slide_index:
+        prs.slides.add_slide(prs.slide_layouts[0])
+
+    # 只复制非图片元素（跳过图片，避免重复）
+    source_slide = prs.slides[source_slide_index]
+    elements = []
+    for shape in source_slide.shapes:
+        try:
+            # 跳过图片类型的形状
+            if shape.shape_type == 13:  # 13 = MSO_SHAPE_TYPE.PICTURE
+                continue
+            # 跳过图片占位符（其位置已作为图片布局导入，复制过去只会留下空占位框）
+            if shape.is_placeholder and shape.placeholder_format.type == 18:  # 18 = PP_PLACEHOLDER.PICTURE
+                continue
+            elements.append(shape.element)
+        except:
+            pass
+
+    # 复制源幻灯片创建新幻灯片
+    new_slides = []
+    for _ in range(count):
+        new_slide = prs.slides.add_slide(source_slide.slide_layout)
+        for el in elements:
+            new_slide.shapes._spTree.append(deepcopy(el))
+        new_slides.append(new_slide)
+
+    # 删除所有旧幻灯片，只保留新创建的幻灯片
+    slides_to_delete = list(range(len(prs.slides) - count))
+    for idx in reversed(slides_to_delete):
+        rId = prs.slides._sldIdLst[idx].rId
+        prs.part.drop_rel(rId)
+        del prs.slides._sldIdLst[idx]
+
+    return new_slides, source_slide_index
+
+
+def paginate_image_configs(slot_configs, image_files):
+    """图片多于布局位置时分页：按文件名顺序依次填满每一页的位置，返回每页的图片配置列表"""
+    slots = [config for config in slot_configs if config is not None and not is_contact_sheet(config)]
+    if not slots:
+        return []
+    return [[dict(slot, filename=name) for slot, name in zip(slots, image_files[start:start + len(slots)])]
+            for start in range(0, len(image_files), len(slots))]
+
+
+def add_image_to_slide(slide, image_path, config):
+    """按图片配置（厘米）插入图片，宽/高缺省时按比例缩放"""
+    # 转换单位
+    left = Cm(config['left'])
+    top = Cm(config['top'])
+    width = Cm(config['width']) if 'width' in config else None
+    height = Cm(config['height']) if 'height' in config else None
+    return slide.shapes.add_picture(image_path, left, top, width=width, height=height)
+
+
+# ---------- 文本尺寸测量（按字体的字形步进宽度，结果按字体和字号缓存） ----------
+
+CM_PER_PT = 2.54 / 72
+TEXT_BOX_INSET_X_CM = 0.254  # PowerPoint文本框默认左右内边距
+TEXT_BOX_INSET_Y_CM = 0.127  # 默认上下内边距
+TEXT_LINE_SPACING = 1.2
+MEASURE_EM = 256  # 测量用字体的像素大小（步进宽度按em换算到实际字号）
+FONT_FILE_EXTENSIONS = ('.ttf', '.otf', '.ttc')
+FONT_FAMILY_CACHE_FILE = os.path.join(CONFIG_DIR, "font_families.json")
+_measure_fonts = {}   # 字体名 -> FreeTypeFont（找不到时为None）
+_glyph_advances = {}  # (字体名, 字号) -> {字符: 步进宽度(磅)}
+_measure_lock = threading.Lock()
+
+
+def font_search_dirs():
+    """系统和用户字体目录（Windows/macOS/Linux）"""
+    dirs = []
+    for env, sub in (('WINDIR', ('Fonts',)), ('LOCALAPPDATA', ('Microsoft', 'Windows', 'Fonts'))):
+        if os.environ.get(env):
+            dirs.append(os.path.join(os.environ[env], *sub))
+    dirs += ['/Library/Fonts', '/System/Library/Fonts', os.path.expanduser('~/Library/Fonts'),
+             '/usr/share/fonts', '/usr/local/share/fonts', os.path.expanduser('~/.fonts'),
+             os.path.expanduser('~/.local/share/fonts')]
+    return [d for d in dirs if os.path.isdir(d)]
+
+
+def font_families(font_files):
+    """各字体文件的家族名 {路径: 家族名}，按 (修改时间, 大小) 缓存在磁盘上，只有新增或改动的字体才需要打开"""
+    from PIL import ImageFont
+    try:
+        with open(FONT_FAMILY_CACHE_FILE, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    families = {}
+    updated = {}
+    for path in font_files:
+        signature = stat_signature(path)
+        entry = cache.get(path)
+        if entry and entry[:2] == signature:
+            family = entry[2]
+        else:
+            try:
+                family = ImageFont.truetype(path, 12).getname()[0] or ""
+            except Exception:
+                family = ""
+        families[path] = family
+        updated[path] = (signature or []) + [family]
+    if updated != cache:
+        try:
+            atomic_write_json(FONT_FAMILY_CACHE_FILE, updated)
+        except OSError:
+            pass
+    return families
+
+
+def find_font_file(name):
+    """按字体名找字体文件：先按文件名匹配，找不到再比较字体的家族名（见 font_families），都找不到返回None"""
+    wanted = re.sub(r'[\s_-]', '', name).lower()
+    font_files = []
+    for font_dir in font_search_dirs():
+        for root, _, files in os.walk(font_dir):
+            font_files += [os.path.join(root, f) for f in files if f.lower().endswith(FONT_FILE_EXTENSIONS)]
+    for path in font_files:
+        if re.sub(r'[\s_-]', '', os.path.splitext(os.path.basename(path))[0]).lower() == wanted:
+            return path
+    for path, family in font_families(font_files).items():
+        if family and re.sub(r'[\s_-]', '', family).lower() == wanted:
+            return path
+    return None
+
+
+def measure_font(name):
+    """测量用字体（MEASURE_EM像素）；系统中没有该字体时用标注字体代替，都没有时返回None"""
+    with _measure_lock:
+        if name not in _measure_fonts:
+            from PIL import ImageFont
+            font = None
+            for candidate in (name, find_font_file(name)) + LABEL_FONT_NAMES:
+                if not candidate:
+                    continue
+                try:
+                    font = ImageFont.truetype(candidate, MEASURE_EM)
+                    break
+                except OSError:
+                    continue
+            _measure_fonts[name] = font
+        return _measure_fonts[name]
+
+
+def measure_font_ready(name=TEXT_FONT_NAME):
+    """测量字体是否已加载（查找字体文件可能要遍历字体目录，界面线程在加载完成前不要调用 measure_text）"""
+    return name in _measure_fonts
+
+
+def glyph_advance(char, font_name, size):
+    """单个字符在指定字体、字号下的步进宽度（磅）；全角字符至少一个字宽（PowerPoint会换用中文字体显示）"""
+    import unicodedata
+    wide = unicodedata.east_asian_width(char) in 'WF'
+    font = measure_font(font_name)
+    if font is None:
+        em = 1.0 if wide else 0.55
+    else:
+        em = font.getlength(char) / MEASURE_EM
+        if wide:
+            em = max(em, 1.0)
+    return em * size
+
+
+def measure_text(text, font_name=TEXT_FONT_NAME, size=TEXT_FONT_SIZE):
+    """按字形步进宽度测量文本，返回恰好容纳它的文本框尺寸 (宽, 高)（厘米，含内边距）
+
+    每个字符的宽度只在第一次出现时由Pillow计算，之后查表求和，测量一个标签只需几微秒。
+    """
+    advances = _glyph_advances.get((font_name, size))
+    if advances is None:
+        advances = _glyph_advances.setdefault((font_name, size), {})
+    lines = text.split('\n')
+    width = 0.0
+    for line in lines:
+        try:
+            line_width = sum(map(advances.__getitem__, line))
+        except KeyError:
+            for char in set(line).difference(advances):
+                advances[char] = glyph_advance(char, font_name, size)
+            line_width = sum(map(advances.__getitem__, line))
+        width = max(width, line_width)
+    return (width * CM_PER_PT + 2 * TEXT_BOX_INSET_X_CM,
+            len(lines) * size * TEXT_LINE_SPACING * CM_PER_PT + 2 * TEXT_BOX_INSET_Y_CM)
+
+
+# 文本框的数值来源记录在形状 cNvPr 的扩展（a:extLst/a:ext）中：不是可选文字，屏幕阅读器不会朗读
+TEXT_SOURCE_EXT_URI = "{7C1E5B2A-3D4F-4A8B-9E6C-2F1D0B3A5C71}"
+TEXT_SOURCE_NAMESPACE = "urn:ppt-image-inserter:text-source"
+TEXT_SOURCE_KEYS = ("keyword", "line_number", "file_cols", "path")
+
+
+def text_source_tag(config, work_dir, deck_dir=None):
+    """文本框的来源标记（a:extLst 片段），刷新数值时据此重新提取
+
+    工作目录只记录相对于PPT所在目录 deck_dir 的路径；不知道PPT位置（如输出到流）或不在同一盘符时不记录，
+    刷新时使用PPT所在目录或指定的工作目录。
+    """
+    source = {key: str(config[key]) for key in TEXT_SOURCE_KEYS if key in config}
+    if deck_dir:
+        try:
+            source["work_dir"] = os.path.relpath(os.path.abspath(work_dir), deck_dir).replace(os.sep, '/')
+        except ValueError:
+            pass
+    attributes = ''.join(' {}="{}"'.format(key, xml_escape(value, {'"': '&quot;', '\n': '&#10;'}))
+                         for key, value in source.items())
+    return (f'<a:extLst><a:ext uri="{TEXT_SOURCE_EXT_URI}">'
+            f'<ts:source xmlns:ts="{TEXT_SOURCE_NAMESPACE}"{attributes}/></a:ext></a:extLst>')
+
+
+def parse_text_source_tag(c_nv_pr):
+    """从形状的 cNvPr 元素读取来源标记，返回文本配置字典（可能含相对的 work_dir）；不是本工具生成的返回None"""
+    a = '{%s}' % A_NAMESPACE
+    for ext in c_nv_pr.iterfind(f'{a}extLst/{a}ext'):
+        if ext.get('uri') != TEXT_SOURCE_EXT_URI:
+            continue
+        source = ext.find('{%s}source' % TEXT_SOURCE_NAMESPACE)
+        if source is None:
+            return None
+        config = dict(source.attrib)
+        try:
+            config["line_number"] = int(config.get("line_number", 1))
+        except ValueError:
+            return None
+        return config
+    return None
+
+
+def add_text_box(slide, text_content, config, tag=None):
+    """在(左, 上)位置添加按文本实际宽度确定大小的文本框并设置字体；tag为来源标记（见 text_source_tag）"""
+    # 添加文本框（通过左、上坐标定位）
+    width, height = measure_text(text_content)
+    text_box = slide.shapes.add_textbox(Cm(config['left']), Cm(config['top']), width=Cm(width), height=Cm(height))
+    if tag:
+        from lxml import etree
+        wrapper = etree.fromstring(f'<w xmlns:a="{A_NAMESPACE}">{tag}</w>', parser=_oxml_parser())
+        text_box._element.nvSpPr.cNvPr.append(wrapper[0])
+
+    # 设置文本内容
+    text_frame = text_box.text_frame
+    text_frame.word_wrap = False
+
+    for paragraph in text_frame.paragraphs:
+        paragraph.text = text_content
+        # 文本默认左对齐
+        paragraph.alignment = PP_ALIGN.LEFT
+
+        for run in paragraph.runs:
+            run.font.name = TEXT_FONT_NAME
+            run.font.size = Pt(TEXT_FONT_SIZE)
+            run.font.color.rgb = RGBColor(0, 0, 0)
+            # 字体不加粗
+            run.font.bold = False
+    return text_box
+
+
+# ========== 联系表（多张小图拼成一张） ==========
+
+CONTACT_SHEET_DPI = 150
+LABEL_FONT_NAMES = ("msyh.ttc", "simhei.ttf", "NotoSansCJK-Regular.ttc", "DejaVuSans.ttf")
+_label_fonts = {}
+
+
+def is_contact_sheet(config):
+    return bool(config and config.get('sheet_columns'))
+
+
+def contact_sheet_files(config, work_dir, used=()):
+    """联系表包含的图片：文件名匹配 sheet_pattern（通配符，空为全部）且未被其他图片位置使用，按文件名排序"""
+    import fnmatch
+    pattern = config.get('sheet_pattern') or '*'
+    return [name for name in list_image_files(work_dir)
+            if name not in used and fnmatch.fnmatch(name.lower(), pattern.lower())]
+
+
+def label_font(size):
+    """标注字体：优先使用支持中文的系统字体，找不到时用Pillow内置字体"""
+    if size not in _label_fonts:
+        from PIL import ImageFont
+        font = None
+        for name in LABEL_FONT_NAMES:
+            try:
+                font = ImageFont.truetype(name, size)
+                break
+            except OSError:
+                continue
+        if font is None:
+            try:
+                font = ImageFont.load_default(size)
+            except TypeError:  # Pillow < 10.1 的内置字体不能指定大小
+                font = ImageFont.load_default()
+        _label_fonts[size] = font
+    return _label_fonts[size]
+
+
+def render_contact_tile(path, tile_size, label, label_height):
+    """渲染一个格子：按比例缩小后居中，下方可选标注文件名（各格子互不相关，可并行）
+
+    图片无法解码时画一个灰色占位框代替，返回 (格子, 是否成功)，一张坏图不影响整张联系表。
+    """
+    from PIL import ImageDraw
+    width, height = tile_size
+    tile = Image.new('RGB', (width, height), 'white')
+    box = (max(1, width - 4), max(1, height - label_height - 4))
+    try:
+        with Image.open(path) as img:
+            img.draft('RGB', box)  # JPEG可直接按缩小的尺寸解码
+            # 透明图片保留alpha，按alpha贴到白底上（直接转RGB时透明部分会变黑）
+            has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+            img = img.convert('RGBA' if has_alpha else 'RGB')
+            img.thumbnail(box, Image.LANCZOS)
+            tile.paste(img, ((width - img.width) // 2, (height - label_height - img.height) // 2),
+                       img if has_alpha else None)
+        ok = True
+    except Exception:
+        ImageDraw.Draw(tile).rectangle((2, 2, 2 + box[0] - 1, 2 + box[1] - 1), fill='#e0e0e0', outline='#a0a0a0')
+        ok = False
+    if label:
+        draw = ImageDraw.Draw(tile)
+        font = label_font(max(8, int(label_height * 0.75)))
+        text = os.path.splitext(os.path.basename(path))[0]
+        text_width = draw.textlength(text, font=font)
+        draw.text((max(0, (width - text_width) / 2), height - label_height), text, fill='black', font=font)
+    return tile, ok
+
+
+def compose_contact_sheet(paths, width_cm, height_cm, columns, dpi=CONTACT_SHEET_DPI, labels=False, workers=None):
+    """把多张图片按columns列拼成一张PNG（按位置的目标尺寸和DPI确定像素），返回 (BytesIO, 无法解码的路径列表)
+
+    每个格子在线程池中独立解码、缩放、标注（Pillow在这些操作中释放GIL），最后依次贴到画布上。
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    canvas_size = (max(1, round(width_cm / 2.54 * dpi)), max(1, round(height_cm / 2.54 * dpi)))
+    columns = max(1, min(columns, len(paths)))
+    rows = -(-len(paths) // columns)
+    tile_size = (canvas_size[0] // columns, canvas_size[1] // rows)
+    label_height = max(10, tile_size[1] // 8) if labels else 0
+    canvas = Image.new('RGB', canvas_size, 'white')
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        tiles = pool.map(lambda path: render_contact_tile(path, tile_size, labels, label_height), paths)
+        failed = []
+        for index, (tile, ok) in enumerate(tiles):
+            row, col = divmod(index, columns)
+            canvas.paste(tile, (col * tile_size[0], row * tile_size[1]))
+            if not ok:
+                failed.append(paths[index])
+    stream = io.BytesIO()
+    canvas.save(stream, format='PNG', compress_level=3)
+    stream.seek(0)
+    return stream, failed
+
+
+A_NAMESPACE = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+TOKEN_PATTERN = re.compile(r'\{\{\s*([^{}\s]+)\s*\}\}')
+
+
+def _substitute_paragraph(text_elements, values, found):
+    """替换一个段落中的 {{标记}}；标记可能被PowerPoint拆到多个run中，替换值写入标记起始的run，保留其格式"""
+    texts = [t.text or '' for t in text_elements]
+    joined = ''.join(texts)
+    matches = [m for m in TOKEN_PATTERN.finditer(joined) if m.group(1) in values]
+    if not matches:
+        return
+    offsets = []
+    position = 0
+    for text in texts:
+        offsets.append(position)
+        position += len(text)
+    lengths = [len(text) for text in texts]
+
+    def run_at(char_index):
+        """原始文本中第char_index个字符所在的run"""
+        for i in range(len(texts) - 1, -1, -1):
+            if lengths[i] and offsets[i] <= char_index:
+                return i
+        return 0
+
+    # 从后往前替换，前面匹配的偏移不受影响
+    for match in reversed(matches):
+        start, end = match.span()
+        value = values[match.group(1)]
+        found.add(match.group(1))
+        first, last = run_at(start), run_at(end - 1)
+        if first == last:
+            texts[first] = texts[first][:start - offsets[first]] + value + texts[first][end - offsets[first]:]
+        else:
+            texts[first] = texts[first][:start - offsets[first]] + value
+            for i in range(first + 1, last):
+                texts[i] = ''
+            texts[last] = texts[last][end - offsets[last]:]
+    for element, text in zip(text_elements, texts):
+        if element.text != text:
+            element.text = text
+
+
+def substitute_tokens(slide, values):
+    """一次遍历幻灯片XML，把所有文本框/表格/组合中的 {{标记}} 替换为对应值，返回实际替换到的标记集合
+
+    直接修改 a:t 文本，模板中的字体、颜色、对齐等样式全部保留。
+    """
+    if not values:
+        return set()
+    found = set()
+    paragraph_tag = '{%s}p' % A_NAMESPACE
+    text_tag = '{%s}t' % A_NAMESPACE
+    for paragraph in slide.shapes._spTree.iter(paragraph_tag):
+        text_elements = list(paragraph.iter(text_tag))
+        if text_elements:
+            _substitute_paragraph(text_elements, values, found)
+    return found
+
+
+def plan_texts(text_configs, work_dir, timer):
+    """提取并格式化所有文本（不涉及PPT），返回 (文本框列表, 替换标记列表, 错误列表)
+
+    文本框为 [(条目序号, 文本)]，替换标记为 [(条目序号, 标记名, 文本)]。
+    """
+    textboxes, tokens, errors = [], [], []
+    for i, config in enumerate(text_configs):
+        if config is None:
+            continue
+        try:
+            text_content, _ = extract_text_value(work_dir, config, timer)
+        except Exception as e:
+            errors.append(f"文本{i+1}: {str(e)}")
+            continue
+        token = config.get('token', '').strip().strip('{}').strip()
+        if token:
+            tokens.append((i, token, text_content))
+        else:
+            textboxes.append((i, text_content))
+    return textboxes, tokens, errors
+
+
+def apply_tokens(slide, tokens, timer):
+    """把替换标记写入幻灯片，返回 (成功数, 错误列表)；模板页中找不到的标记记为错误
+
+    与文本框一致，先去掉XML不允许的控制字符（如日志中的ANSI颜色码），否则lxml拒绝写入。
+    """
+    if not tokens:
+        return 0, []
+    with timer.phase("替换标记", tokens=len(tokens)):
+        found = substitute_tokens(slide, {token: XML_INVALID_CHARS.sub('', text) for _, token, text in tokens})
+    errors = [f"文本{i+1}: 模板页中没有找到 {{{{{token}}}}}" for i, token, _ in tokens if token not in found]
+    return len(tokens) - len(errors), errors
+
+
+def fill_texts(slide, text_configs, work_dir, timer, deck_dir=None):
+    """提取并填充所有文本：设置了替换标记的写入模板中的 {{标记}}，其余添加文本框；返回 (成功数, 错误列表)
+
+    deck_dir 为PPT将要保存到的目录，文本框的来源标记中工作目录相对它记录（见 text_source_tag）。
+    """
+    textboxes, tokens, errors = plan_texts(text_configs, work_dir, timer)
+    for i, text_content in textboxes:
+        with timer.phase("添加文本框", index=i):
+            add_text_box(slide, text_content, text_configs[i], text_source_tag(text_configs[i], work_dir, deck_dir))
+    token_success, token_errors = apply_tokens(slide, tokens, timer)
+    return len(textboxes) + token_success, errors + token_errors
+
+
+# ========== 预编译布局（批量插入形状） ==========
+
+RT_IMAGE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+
+P_NAMESPACE = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+EMU_PER_CM = 360000
+XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# 与 add_picture / add_text_box 生成的XML一致，几何位置在编译时换算成EMU
+PICTURE_XML = (
+    '<p:pic><p:nvPicPr><p:cNvPr id="{id}" name="Picture {name_id}" descr="{descr}"/>'
+    '<p:cNvPicPr><a:picLocks noChangeAspect="1"/></p:cNvPicPr><p:nvPr/></p:nvPicPr>'
+    '<p:blipFill><a:blip r:embed="{rId}"/><a:stretch><a:fillRect/></a:stretch></p:blipFill>'
+    '<p:spPr><a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr></p:pic>'
+)
+TEXTBOX_XML = (
+    '<p:sp><p:nvSpPr><p:cNvPr id="{{id}}" name="TextBox {{name_id}}">{{tag}}</p:cNvPr><p:cNvSpPr txBox="1"/><p:nvPr/></p:nvSpPr>'
+    '<p:spPr><a:xfrm><a:off x="{x}" y="{y}"/><a:ext cx="{{cx}}" cy="{{cy}}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom><a:noFill/></p:spPr>'
+    '<p:txBody><a:bodyPr wrap="none"><a:spAutoFit/></a:bodyPr><a:lstStyle/><a:p><a:pPr algn="l"/>'
+    '<a:r><a:rPr sz="{size}" b="0"><a:solidFill><a:srgbClr val="000000"/></a:solidFill>'
+    '<a:latin typeface="{font}"/></a:rPr><a:t>{{text}}</a:t></a:r></a:p></p:txBody></p:sp>'
+)
+
+
+def cm_to_emu(value):
+    """厘米转EMU（与 pptx.util.Cm 相同的取整方式）"""
+    return int(value * EMU_PER_CM)
+
+
+class CompiledLayout:
+    """布局的预编译形式：图片位置换算为EMU，文本框预先生成完整XML片段（只留编号和文本待填）
+
+    生成时只需写入图片关系ID和文本，拼接后一次解析、整体追加到spTree，
+    不再为每个形状走 add_picture/add_textbox 和逐个设置字体属性。
+    """
+
+    def __init__(self, image_configs, text_configs):
+        self.picture_slots = [
+            None if config is None else (
+                cm_to_emu(config['left']), cm_to_emu(config['top']),
+                cm_to_emu(config['width']) if config.get('width') else None,
+                cm_to_emu(config['height']) if config.get('height') else None)
+            for config in image_configs]
+        textbox_xml = {}
+        self.textbox_fragments = []
+        for config in text_configs:
+            if config is None:
+                self.textbox_fragments.append(None)
+                continue
+            key = (cm_to_emu(config['left']), cm_to_emu(config['top']))
+            if key not in textbox_xml:
+                textbox_xml[key] = TEXTBOX_XML.format(
+                    x=key[0], y=key[1],
+                    size=TEXT_FONT_SIZE * 100, font=xml_escape(TEXT_FONT_NAME, {'"': '&quot;'}))
+            self.textbox_fragments.append(textbox_xml[key])
+
+    def stamp(self, slide, pictures, textboxes, tags=None):
+        """pictures: [(图片序号, rId, image_part, 文件名)]，textboxes: [(文本序号, 文本)]；按此顺序批量追加形状
+
+        tags: {文本序号: 来源标记}，写入文本框的 cNvPr 供刷新数值时使用（标记随数据变化，不进编译缓存）。
+        """
+        tags = tags or {}
+        from lxml import etree
+        sp_tree = slide.shapes._spTree
+        next_id = max((int(value) for value in sp_tree.xpath('//@id') if value.isdigit()), default=0) + 1
+        fragments = []
+        sizes = {}  # 同一图片同一尺寸只换算一次（scale每次都要重新解析图片头）
+        for index, rId, image_part, filename in pictures:
+            x, y, width, height = self.picture_slots[index]
+            size_key = (id(image_part), width, height)
+            if size_key not in sizes:
+                sizes[size_key] = image_part.scale(width, height)
+            cx, cy = sizes[size_key]
+            fragments.append(PICTURE_XML.format(id=next_id, name_id=next_id - 1, rId=rId,
+                                                descr=xml_escape(filename, {'"': '&quot;'}),
+                                                x=x, y=y, cx=cx, cy=cy))
+            next_id += 1
+        for index, text in textboxes:
+            text = XML_INVALID_CHARS.sub('', text)
+            width, height = measure_text(text)
+            fragments.append(self.textbox_fragments[index].format(id=next_id, name_id=next_id - 1,
+                                                                  tag=tags.get(index, ''),
+                                                                  cx=cm_to_emu(width), cy=cm_to_emu(height),
+                                                                  text=xml_escape(text)))
+            next_id += 1
+        if not fragments:
+            return 0
+        container = etree.fromstring(
+            f'<p:spTree xmlns:p="{P_NAMESPACE}" xmlns:a="{A_NAMESPACE}" xmlns:r="{R_NAMESPACE}">'
+            + ''.join(fragments) + '</p:spTree>',
+            parser=_oxml_parser())
+        ext_lst = sp_tree.find('{%s}extLst' % P_NAMESPACE)
+        if ext_lst is not None:
+            for element in list(container):
+                ext_lst.addprevious(element)
+        else:
+            sp_tree.extend(list(container))
+        return len(fragments)
+
+
+_compiled_layouts = {}
+_compiled_layouts_lock = threading.Lock()
+
+
+def compile_layout(image_configs, text_configs):
+    """取得布局的预编译形式（按几何位置缓存，同一模式重复生成时直接复用）"""
+    def geometry(configs, keys):
+        return tuple(None if c is None else tuple(c.get(k) for k in keys) for c in configs)
+    key = (geometry(image_configs, ('left', 'top', 'width', 'height')),
+           geometry(text_configs, ('left', 'top')), TEXT_FONT_NAME, TEXT_FONT_SIZE)
+    with _compiled_layouts_lock:
+        compiled = _compiled_layouts.get(key)
+        if compiled is None:
+            compiled = _compiled_layouts[key] = CompiledLayout(image_configs, text_configs)
+    return compiled
+
+
+def _oxml_parser():
+    """python-pptx的XML解析器：解析出的元素是带属性方法的自定义元素类"""
+    from pptx.oxml import oxml_parser
+    return oxml_parser
+
+
+# ========== 快速保存（媒体不重复压缩，XML多线程压缩） ==========
+
+# 本身已压缩、再deflate几乎无收益的媒体类型，直接以ZIP_STORED存储
+STORED_CONTENT_TYPES = {
+    'image/jpeg', 'image/png', 'image/gif', 'image/webp',
+    'video/mp4', 'video/mpeg', 'video/quicktime', 'audio/mpeg', 'audio/mp4',
+}
+
+DEFAULT_SAVE_OPTIONS = {
+    "fast": False,        # True时快速保存（--fast-save），否则使用python-pptx自带的prs.save
+    "compresslevel": 6,   # XML等部件的deflate压缩级别（0-9）
+    "workers": None,      # 压缩线程数，None为CPU核数，1为单线程
+}
+
+
+class SpooledMedia:
+    """留在磁盘上的媒体内容：构建时只记录路径和签名，保存时才分块读取并流式写入ZIP"""
+
+    CHUNK_SIZE = 1 << 20
+
+    def __init__(self, path):
+        self.path = path
+        self.signature = stat_signature(path)
+        if self.signature is None:
+            raise FileNotFoundError(path)
+        self.size = self.signature[1]
+
+    def open(self):
+        if stat_signature(self.path) != self.signature:
+            raise OSError(f"图片在生成期间被修改或删除: {self.path}")
+        return open(self.path, 'rb')
+
+    def read(self):
+        with self.open() as f:
+            return f.read()
+
+    def copy_to(self, dst):
+        with self.open() as src:
+            for chunk in iter(lambda: src.read(self.CHUNK_SIZE), b''):
+                dst.write(chunk)
+
+
+def iter_package_items(prs):
+    """按python-pptx的PackageWriter顺序列出包内所有条目：(成员名, 内容, 内容类型)
+
+    磁盘上的媒体部件（见 SpooledMedia）不读入内存，内容直接给出 SpooledMedia 对象。
+    """
+    from pptx.opc.constants import CONTENT_TYPE as CT
+    from pptx.opc.oxml import serialize_part_xml
+    from pptx.opc.packuri import CONTENT_TYPES_URI, PACKAGE_URI
+    from pptx.opc.serialized import _ContentTypesItem
+
+    package = prs.part.package
+    parts = tuple(package.iter_parts())
+    yield (CONTENT_TYPES_URI.membername,
+           serialize_part_xml(_ContentTypesItem.xml_for(parts)), CT.XML)
+    yield PACKAGE_URI.rels_uri.membername, package._rels.xml, CT.OPC_RELATIONSHIPS
+    for part in parts:
+        yield part.partname.membername, getattr(part, 'spool', None) or part.blob, part.content_type
+        if part._rels:
+            yield part.partname.rels_uri.membername, part.rels.xml, CT.OPC_RELATIONSHIPS
+
+
+def _deflate(blob, compresslevel):
+    """raw deflate压缩（zlib在压缩时释放GIL，可多线程并行），返回 (压缩数据, CRC32)"""
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, -15)
+    return compressor.compress(blob) + compressor.flush(), zlib.crc32(blob)
+
+
+def _write_raw_member(zf, zinfo, chunks):
+    """把已压缩好的数据（按块给出）作为一个成员写入ZipFile，本地文件头中直接带上大小和CRC
+
+    zinfo 须已设好 compress_type、file_size、compress_size、CRC。zipfile没有写入已压缩数据的公开接口，
+    这里直接维护其内部状态（fp、filelist、NameToInfo、start_dir），调用前须经 raw_zip_writes_supported() 自检。
+    """
+    zinfo.header_offset = zf.fp.tell()
+    zf.fp.write(zinfo.FileHeader())
+    written = 0
+    for chunk in chunks:
+        zf.fp.write(chunk)
+        written += len(chunk)
+    if written != zinfo.compress_size:
+        raise zipfile.BadZipFile(f"成员 {zinfo.filename} 的数据长度不符")
+    zf.filelist.append(zinfo)
+    zf.NameToInfo[zinfo.filename] = zinfo
+    zf.start_dir = zf.fp.tell()
+    zf._didModify = True
+
+
+_raw_zip_writes = None
+
+
+def raw_zip_writes_supported():
+    """当前Python的zipfile能否由 _write_raw_member 直接写入已压缩的数据
+
+    首次调用时在内存中写一个小ZIP再用zipfile读回校验，结果缓存；zipfile内部实现变化导致自检失败时，
+    快速保存等改用公开接口（zf.open/writestr）重新压缩写入，结果相同只是慢一些。
+    """
+    global _raw_zip_writes
+    if _raw_zip_writes is None:
+        try:
+            blob = b'<a:t>0123456789</a:t>' * 64
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w') as zf:
+                zf.writestr('a.txt', b'stored')
+                zinfo = zipfile.ZipInfo('b.xml')
+                raw, zinfo.CRC = _deflate(blob, 6)
+                zinfo.compress_type, zinfo.file_size, zinfo.compress_size = zipfile.ZIP_DEFLATED, len(blob), len(raw)
+                _write_raw_member(zf, zinfo, [raw[:10], raw[10:]])
+                zf.writestr('c.txt', b'after')
+            with zipfile.ZipFile(buffer) as zf:
+                _raw_zip_writes = (zf.testzip() is None and zf.namelist() == ['a.txt', 'b.xml', 'c.txt']
+                                   and zf.read('b.xml') == blob)
+        except Exception:
+            _raw_zip_writes = False
+    return _raw_zip_writes
+
+
+def _write_deflated_member(zf, zinfo, blob, compressed=None, compresslevel=6):
+    """写入一个DEFLATED成员；compressed 为 _deflate 预先（可在其他线程）压缩好的 (数据, CRC32)
+
+    zipfile自检不通过或没有预先压缩时，由zipfile按compresslevel压缩写入。
+    """
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    if compressed is None or not raw_zip_writes_supported():
+        zf.writestr(zinfo, blob, compresslevel=compresslevel)
+        return
+    raw, zinfo.CRC = compressed
+    zinfo.file_size = len(blob)
+    zinfo.compress_size = len(raw)
+    _write_raw_member(zf, zinfo, [raw])
+
+
+def save_presentation_fast(prs, output, compresslevel=6, workers=None):
+    """快速保存：已压缩的媒体以ZIP_STORED写入，XML等部件按compresslevel多线程deflate
+
+    生成的仍是标准OOXML包（条目顺序与python-pptx一致），output可以是路径或可写二进制流。
+    依赖python-pptx包序列化的内部接口，这些接口不可用时退回 prs.save。
+    """
+    try:
+        items = list(iter_package_items(prs))
+    except (ImportError, AttributeError):
+        prs.save(output)
+        return
+    to_deflate = [blob for _, blob, content_type in items
+                  if content_type not in STORED_CONTENT_TYPES and not isinstance(blob, SpooledMedia)]
+    if not raw_zip_writes_supported():
+        compressed = [None] * len(to_deflate)  # 由zipfile在写入时压缩
+    elif workers == 1 or len(to_deflate) < 2:
+        compressed = [_deflate(blob, compresslevel) for blob in to_deflate]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            compressed = list(pool.map(lambda blob: _deflate(blob, compresslevel), to_deflate))
+
+    date_time = datetime.now().timetuple()[:6]
+    compressed = iter(compressed)
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+        for name, blob, content_type in items:
+            zinfo = zipfile.ZipInfo(name, date_time=date_time)
+            zinfo.external_attr = 0o644 << 16
+            if isinstance(blob, SpooledMedia):
+                # 磁盘上的媒体分块写入，内存占用与文件大小无关
+                zinfo.compress_type = (zipfile.ZIP_STORED if content_type in STORED_CONTENT_TYPES
+                                       else zipfile.ZIP_DEFLATED)
+                zinfo.file_size = blob.size
+                with zf.open(zinfo, 'w', force_zip64=blob.size > 0x7FFFFFFF) as dst:
+                    blob.copy_to(dst)
+            elif content_type in STORED_CONTENT_TYPES:
+                zinfo.compress_type = zipfile.ZIP_STORED
+                zf.writestr(zinfo, blob)
+            else:
+                _write_deflated_member(zf, zinfo, blob, next(compressed), compresslevel)
+
+
+def save_presentation(prs, output, save_options=None):
+    """按保存选项保存（默认python-pptx自带的保存，fast为True时快速保存，见 DEFAULT_SAVE_OPTIONS）"""
+    options = dict(DEFAULT_SAVE_OPTIONS, **(save_options or {}))
+    if options["fast"]:
+        save_presentation_fast(prs, output, options["compresslevel"], options["workers"])
+    else:
+        prs.save(output)
+
+
+def resolve_mode_template(mode_config):
+    """模式关联的模板文件；不存在时退回程序目录下的默认模板，都没有返回None"""
+    template_file = mode_config.get("template_file")
+    if not template_file:
+        return None
+    if os.path.exists(template_file):
+        return template_file
+    prog_dir = os.path.dirname(os.path.abspath(__file__))
+    default_template = os.path.join(prog_dir, DEFAULT_TEMPLATE_FILE)
+    if os.path.exists(default_template):
+        return default_template
+    return None
+
+
+SHEET_KEYS = ("sheet_columns", "sheet_pattern", "sheet_labels", "sheet_dpi")
+
+
+def configs_from_mode(mode_config, work_dir):
+    """把模式布局转换为生成用的配置（与界面中"填充所有图片"一致：按文件名顺序分配图片）"""
+    image_files = list_image_files(work_dir)
+    image_configs = []
+    file_index = 0
+    for layout in mode_config.get("layouts", []):
+        config = {key: layout[key] for key in ("left", "top", "width", "height") if layout.get(key)}
+        config.setdefault("left", 0)
+        config.setdefault("top", 0)
+        if is_contact_sheet(layout):
+            # 联系表不占用按顺序分配的图片
+            config.update({key: layout[key] for key in SHEET_KEYS if key in layout})
+            config["filename"] = ""
+        else:
+            config["filename"] = layout.get("filename") or (
+                image_files[file_index] if file_index < len(image_files) else "")
+            file_index += 1
+        image_configs.append(config)
+    text_configs = []
+    for layout in mode_config.get("text_layouts", []):
+        config = dict(layout)
+        config.setdefault("line_number", 1)
+        config.setdefault("file_cols", "1")
+        config.setdefault("keyword", "")
+        text_configs.append(config)
+    return image_configs, text_configs
+
+
+def default_output_path(work_dir, mode_name):
+    """默认输出路径：布局模式_时-分-秒.pptx；同一秒内重复生成时追加序号
+
+    以独占方式创建空文件占住文件名，并发运行也不会互相覆盖。
+    """
+    base = f"{mode_name}_{datetime.now().strftime('%H-%M-%S')}"
+    for n in range(1, 1000):
+        suffix = "" if n == 1 else f"_{n}"
+        path = os.path.join(work_dir, f"{base}{suffix}.pptx")
+        try:
+            with open(path, 'xb'):
+                return path
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"无法生成不重复的输出文件名: {base}")
+
+
+@contextmanager
+def discard_on_failure(path):
+    """生成出错或被中断时删除 path（default_output_path 占位的空文件或写了一半的文件），异常照常抛出
+
+    path 为None时什么也不做（用户指定的输出文件不删除）。
+    """
+    try:
+        yield
+    except BaseException:
+        if path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        raise
+
+
+def render_deck_bytes(template, slide_index, image_configs, text_configs, work_dir, timer=None,
+                      save_options=None, extra_pages=None):
+    """生成PPT到内存，返回 (pptx字节, 结果字典)，供上传等下游直接使用而无需落盘"""
+    buffer = io.BytesIO()
+    result = generate_deck(template, slide_index, image_configs, text_configs, work_dir, buffer, timer,
+                           save_options, extra_pages)
+    return buffer.getvalue(), result
+
+
+def overflow_pages(image_configs, work_dir):
+    """工作目录中未被当前布局用到的图片，按布局位置分页后的后续各页图片配置"""
+    if any(is_contact_sheet(config) for config in image_configs):
+        return []  # 联系表已经容纳了其余图片
+    used = {config['filename'] for config in image_configs if config and config.get('filename')}
+    remaining = [name for name in list_image_files(work_dir) if name not in used]
+    return paginate_image_configs(image_configs, remaining)
+
+
+# ========== 干运行计划（不加载pptx） ==========
+
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def probe_image_header(path):
+    """只读文件头识别图片格式和像素尺寸，返回 (格式, 宽, 高)；无法识别时抛出ValueError
+
+    PNG/GIF/BMP/JPEG 直接解析文件头，不导入Pillow；其他格式才交给Pillow（也只读文件头）。
+    """
+    import struct
+    with open(path, 'rb') as f:
+        head = f.read(32)
+        if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+            return ('PNG',) + struct.unpack('>II', head[16:24])
+        if head[:6] in (b'GIF87a', b'GIF89a'):
+            return ('GIF',) + struct.unpack('<HH', head[6:10])
+        if head[:2] == b'BM' and len(head) >= 26:
+            if struct.unpack('<I', head[14:18])[0] == 12:  # OS/2 BITMAPCOREHEADER
+                return ('BMP',) + struct.unpack('<HH', head[18:22])
+            width, height = struct.unpack('<ii', head[18:26])
+            return 'BMP', width, abs(height)
+        if head[:2] == b'\xff\xd8':
+            f.seek(2)
+            while True:
+                byte = f.read(1)
+                if not byte:
+                    break
+                if byte != b'\xff':
+                    continue
+                marker = f.read(1)
+                while marker == b'\xff':  # 填充字节
+                    marker = f.read(1)
+                if not marker:
+                    break
+                code = marker[0]
+                if code == 0x01 or 0xD0 <= code <= 0xD9:  # 无长度字段的标记
+                    continue
+                length_bytes = f.read(2)
+                if len(length_bytes) < 2:
+                    break
+                length = struct.unpack('>H', length_bytes)[0]
+                if code in JPEG_SOF_MARKERS:
+                    height, width = struct.unpack('>HH', f.read(5)[1:5])
+                    return 'JPEG', width, height
+                f.seek(length - 2, 1)
+            raise ValueError("JPEG文件不完整")
+    try:
+        from PIL import Image as PILImage
+        with PILImage.open(path) as img:
+            return (img.format,) + img.size
+    except Exception:
+        raise ValueError("无法识别的图片格式")
+
+
+def plan_slide(image_configs, text_configs, work_dir, timer=None):
+    """干运行：解析所有图片路径和文本来源、读取图片文件头、提取并格式化所有数值，不加载pptx也不打开模板
+
+    返回完整的计划字典，真正生成时由 execute_slide_plan 直接执行：
+    pictures [{index, path, format, size}]、sheets [{index, paths, config}]、textboxes、tokens、
+    errors/text_errors（全部错误，不截断）、image_configs/text_configs、timer。
+    """
+    timer = timer or PhaseTimer()
+    plan = {"pictures": [], "sheets": [], "errors": [], "image_configs": image_configs,
+            "text_configs": text_configs, "work_dir": work_dir, "timer": timer}
+    used = {config['filename'] for config in image_configs if config and not is_contact_sheet(config)}
+    with timer.phase("检查图片", images=len(image_configs)):
+        for i, config in enumerate(image_configs):
+            if config is None:
+                continue
+            if is_contact_sheet(config):
+                if not config.get('width') or not config.get('height'):
+                    plan["errors"].append(f"图片{i+1}: 联系表需要同时设置宽和高")
+                    continue
+                names = contact_sheet_files(config, work_dir, used)
+                if not names:
+                    plan["errors"].append(f"图片{i+1}: 联系表没有匹配的图片")
+                    continue
+                # 无法识别的图片跳过（只报告一次），其余照常拼接
+                paths = []
+                for name in names:
+                    path = os.path.join(work_dir, name)
+                    try:
+                        probe_image_header(path)
+                    except Exception as e:
+                        plan["errors"].append(f"图片{i+1}: 联系表中的 {name} {str(e)}，已跳过")
+                        continue
+                    paths.append(path)
+                if paths:
+                    plan["sheets"].append({"index": i, "paths": paths, "config": config})
+                continue
+            # 检查图片文件名
+            if not config.get('filename'):
+                plan["errors"].append(f"图片{i+1}: 未选择图片文件名")
+                continue
+            # 构建完整路径（工作路径 + 文件名）
+            image_path = os.path.join(work_dir, config['filename'])
+            if not os.path.exists(image_path):
+                plan["errors"].append(f"图片{i+1}: 找不到文件 {config['filename']}")
+                continue
+            try:
+                image_format, width, height = probe_image_header(image_path)
+            except Exception as e:
+                plan["errors"].append(f"图片{i+1}: {config['filename']} {str(e)}")
+                continue
+            plan["pictures"].append({"index": i, "path": image_path, "format": image_format,
+                                     "size": (width, height)})
+
+    # 处理每个文本（根据关键词从不同文件中提取）
+    plan["textboxes"], plan["tokens"], plan["text_errors"] = plan_texts(text_configs, work_dir, timer)
+    return plan
+
+
+def format_plan(plan):
+    """把计划格式化为多行文本（每张图片、每个数值、全部错误）"""
+    lines = []
+    for picture in plan["pictures"]:
+        width, height = picture["size"]
+        lines.append(f"图片{picture['index'] + 1}: {os.path.basename(picture['path'])} "
+                     f"({picture['format']} {width}×{height})")
+    for sheet in plan["sheets"]:
+        lines.append(f"图片{sheet['index'] + 1}: 联系表 {len(sheet['paths'])} 张")
+    for i, text in plan["textboxes"]:
+        lines.append(f"文本{i + 1}: {text}")
+    for i, token, text in plan["tokens"]:
+        lines.append(f"文本{i + 1}: {{{{{token}}}}} = {text}")
+    for error in plan["errors"] + plan["text_errors"]:
+        lines.append(f"错误 {error}")
+    return "\n".join(lines)
+
+
+def fill_slide(slide, image_configs, text_configs, work_dir, timer, media=None, deck_dir=None):
+    """在幻灯片上插入所有图片和文本（先生成计划再执行），返回结果字典，见 execute_slide_plan"""
+    plan = dict(plan_slide(image_configs, text_configs, work_dir, timer), deck_dir=deck_dir)
+    return execute_slide_plan(slide, plan, timer, media)
+
+
+def output_dir(output):
+    """输出为文件路径时返回其所在目录（绝对路径），输出到流时返回None"""
+    return os.path.dirname(os.path.abspath(output)) if isinstance(output, (str, os.PathLike)) else None
+
+
+def execute_slide_plan(slide, plan, timer, media=None):
+    """按计划填充幻灯片，返回结果字典：image_success、text_success、errors、text_errors、
+    image_files（图片路径 -> 关系ID）。plan 中的 deck_dir 为PPT将要保存到的目录（用于文本框的来源标记）。
+
+    media 为 MediaStore 时图片部件由它按SHA1去重（多页时避免python-pptx每张图都遍历整个包）。
+    """
+    compiled = compile_layout(plan["image_configs"], plan["text_configs"])
+    errors = list(plan["errors"])
+    pictures = []
+    image_parts = {}  # 同一文件只加入一次（按SHA1查重需要遍历整个包）
+
+    # 联系表：多张小图拼成一张，只插入一个图片形状
+    for sheet in plan["sheets"]:
+        i, config = sheet["index"], sheet["config"]
+        try:
+            with timer.phase("拼接联系表", index=i, tiles=len(sheet["paths"])):
+                stream, failed = compose_contact_sheet(sheet["paths"], config['width'], config['height'],
+                                                       int(config['sheet_columns']),
+                                                       config.get('sheet_dpi', CONTACT_SHEET_DPI),
+                                                       config.get('sheet_labels', False))
+            errors += [f"图片{i+1}: 联系表中的 {os.path.basename(path)} 无法解码，已用占位框代替"
+                       for path in failed]
+            with timer.phase("插入图片", index=i, file="联系表"):
+                image_part, rId = slide.part.get_or_add_image_part(stream)
+            pictures.append((i, rId, image_part, f"联系表（{len(sheet['paths'])}张）"))
+        except Exception as e:
+            errors.append(f"图片{i+1}: {str(e)}")
+
+    # 先加入图片部件取得关系ID，形状稍后批量插入
+    for picture in plan["pictures"]:
+        i, image_path = picture["index"], picture["path"]
+        try:
+            with timer.phase("插入图片", index=i, file=os.path.basename(image_path)):
+                if image_path not in image_parts:
+                    if media is not None:
+                        image_part = media.get(image_path)
+                        rId = slide.part.relate_to(image_part, RT_IMAGE)
+                    else:
+                        image_part, rId = slide.part.get_or_add_image_part(image_path)
+                    image_part.scale(None, None)  # 提前解析图片尺寸，python-pptx不支持的图片在这里报错
+                    image_parts[image_path] = (image_part, rId)
+                image_part, rId = image_parts[image_path]
+            pictures.append((i, rId, image_part, os.path.basename(image_path)))
+        except Exception as e:
+            errors.append(f"图片{i+1}: {str(e)}")
+    pictures.sort(key=lambda picture: picture[0])
+
+    tags = {i: text_source_tag(plan["text_configs"][i], plan["work_dir"], plan.get("deck_dir"))
+            for i, _ in plan["textboxes"]}
+    with timer.phase("批量插入形状", shapes=len(pictures) + len(plan["textboxes"])):
+        compiled.stamp(slide, pictures, plan["textboxes"], tags)
+    token_success, token_errors = apply_tokens(slide, plan["tokens"], timer)
+
+    return {
+        "image_success": len(pictures),
+        "text_success": len(plan["textboxes"]) + token_success,
+        "errors": errors,
+        "text_errors": plan["text_errors"] + token_errors,
+        "image_files": {path: rId for path, (_, rId) in image_parts.items()},
+    }
+
+
+def generate_deck(template, slide_index, image_configs, text_configs, work_dir, output, timer=None,
+                  save_options=None, extra_pages=None, plan=None):
+    """无界面生成PPT：复制模板页，插入图片和文本，保存到output
+
+    output 可以是文件路径，也可以是任何可写的二进制流（如 io.BytesIO、sys.stdout.buffer）。
+    save_options 见 DEFAULT_SAVE_OPTIONS（默认python-pptx自带的保存）。
+    image_configs/text_configs 为 get_config() 格式的字典列表，None 表示该条目配置无效（只占位、保持编号）。
+    extra_pages 为超出布局的图片分页后的后续各页图片配置（见 paginate_image_configs），
+    每页都复制同一模板页并填入相同的文本。
+    plan 为已做过的干运行计划（plan_slide），传入时直接执行、不再重新解析。
+    所有图片和文本都在加载pptx、打开模板之前解析完毕。
+    返回结果字典：image_success、text_success、errors、text_errors、slide_index、page_count、timer（分阶段计时）。
+    """
+    timer = timer or PhaseTimer()
+    extra_pages = extra_pages or []
+    plan = dict(plan or plan_slide(image_configs, text_configs, work_dir, timer), deck_dir=output_dir(output))
+    # 后续各页只检查图片，文本沿用第一页已提取的值
+    page_plans = [dict(plan_slide(page_configs, [], work_dir, timer), text_configs=plan["text_configs"],
+                       textboxes=plan["textboxes"], tokens=plan["tokens"], deck_dir=plan["deck_dir"])
+                  for page_configs in extra_pages]
+    with timer.phase("导入依赖"):
+        load_heavy_modules()
+    with timer.phase("模板加载"):
+        prs = open_template(template)
+    with timer.phase("复制模板页", pages=1 + len(extra_pages)):
+        new_slides, slide_index = clone_template_slides(prs, slide_index, 1 + len(extra_pages))
+
+    if not extra_pages:
+        result = execute_slide_plan(new_slides[0], plan, timer)
+    else:
+        media = MediaStore(prs)
+        result = execute_slide_plan(new_slides[0], plan, timer, media)
+        for page, (slide, page_plan) in enumerate(zip(new_slides[1:], page_plans), start=2):
+            page_result = execute_slide_plan(slide, page_plan, timer, media)
+            result["image_success"] += page_result["image_success"]
+            result["errors"] += [f"第{page}页{error}" for error in page_result["errors"]]
+            result["text_errors"] += [f"第{page}页{error}" for error in page_result["text_errors"]]
+    result["page_count"] = len(new_slides)
+
+    # 保存到输出路径
+    with timer.phase("保存"):
+        save_presentation(prs, output, save_options)
+
+    result.update(slide_index=slide_index, timer=timer)
+    return result
+
+
+# ========== 自动排版（按图片真实宽高比） ==========
+
+SLIDE_WIDTH_CM = 66.69  # 默认幻灯片尺寸（厘米），与预览画布一致
+SLIDE_HEIGHT_CM = 37.27
+AUTO_LAYOUT_MARGIN_CM = 1.0
+AUTO_LAYOUT_GUTTER_CM = 0.5
+AUTO_LAYOUT_MAX_STEPS = 400  # 每个方向最多尝试的目标行高个数（1.05^400 远超实际需要的范围）
+
+
+def _row_breaks(prefix, width, gutter, target):
+    """动态规划：按目标行高把图片（保持顺序）分行，使各行高度与目标行高的偏差平方和最小
+
+    每行撑满宽度时的行高由宽高比前缀和O(1)求出；行内图片越多行越矮，
+    矮于目标的一半就不再向前扩展，因此每个位置只检查少数几种行长。
+    """
+    count = len(prefix) - 1
+    cost = [0.0] + [float('inf')] * count
+    back = [0] * (count + 1)
+    for end in range(1, count + 1):
+        for start in range(end - 1, -1, -1):
+            row_width = width - gutter * (end - start - 1)
+            if row_width <= 0:
+                break
+            row_height = row_width / (prefix[end] - prefix[start])
+            candidate = cost[start] + (row_height - target) ** 2
+            if candidate < cost[end]:
+                cost[end], back[end] = candidate, start
+            if row_height < target / 2:
+                break
+    breaks = [count]
+    while breaks[-1] > 0:
+        breaks.append(back[breaks[-1]])
+    return breaks[::-1]
+
+
+def _score_rows(prefix, breaks, width, height, gutter):
+    """计算一种分行的排版：每行撑满宽度，整体超高时等比缩小；返回 (显示面积, 缩放比例, 各行高度)"""
+    heights = []
+    area = 0.0
+    for start, end in zip(breaks, breaks[1:]):
+        row_width = width - gutter * (end - start - 1)
+        if row_width <= 0:
+            return 0.0, 0.0, heights
+        aspect_sum = prefix[end] - prefix[start]
+        row_height = row_width / aspect_sum
+        heights.append(row_height)
+        area += row_height * row_height * aspect_sum
+    free = height - gutter * (len(heights) - 1)
+    if free <= 0:
+        return 0.0, 0.0, heights
+    scale = min(1.0, free / sum(heights))
+    return area * scale * scale, scale, heights
+
+
+def solve_auto_layout(sizes, slide_width=SLIDE_WIDTH_CM, slide_height=SLIDE_HEIGHT_CM,
+                      margin=AUTO_LAYOUT_MARGIN_CM, gutter=AUTO_LAYOUT_GUTTER_CM):
+    """按图片像素尺寸 [(宽, 高), ...] 求使显示面积最大的两端对齐行排版，返回与模式一致的布局列表
+
+    图片保持顺序逐行排列，每行等高并撑满可用宽度，各行高度尽量一致（只追求总面积会把部分图片挤成细条）。
+    各行高度之和恰好等于可用高度时面积最大（更矮会留白，更高会整体缩小），所以从估计的最优行高出发
+    向两侧调整目标行高，每个目标行高用动态规划分行，保留显示面积最大的一种，连续几种分法没有改进、
+    已达到可能的最多/最少行数（间距限制了每行最多放几张）或尝试次数用完时停止。
+    每次分行约 O(n × 每行图片数)，几百张图片也在毫秒级完成。
+    """
+    if not sizes:
+        return []
+    aspects = [width / height if width > 0 and height > 0 else 1.0 for width, height in sizes]
+    prefix = [0.0]
+    for aspect in aspects:
+        prefix.append(prefix[-1] + aspect)
+    width = slide_width - 2 * margin
+    height = slide_height - 2 * margin
+
+    # 各行均匀时 k 行的总高度约为 k²×宽度/宽高比之和，由此估计最优行数和起始目标行高，向两侧搜索
+    initial = height / max(1.0, (height * prefix[-1] / width) ** 0.5)
+    # 一行的宽度要放下 k-1 个间距，每行最多 per_row 张，因此至少需要 min_rows 行
+    per_row = max(1, int(-(-width // gutter))) if gutter > 0 else len(aspects)
+    min_rows = -(-len(aspects) // per_row)
+    best = None
+    for factor in (1.05, 1 / 1.05):  # 目标行高变大（行数变多）/ 变小（行数变少）
+        target, previous, misses = initial, None, 0
+        for _ in range(AUTO_LAYOUT_MAX_STEPS):
+            if misses >= 3:
+                break
+            breaks = _row_breaks(prefix, width, gutter, target)
+            if breaks != previous:
+                score = _score_rows(prefix, breaks, width, height, gutter)
+                if best is None or score[0] > best[0][0]:
+                    best, misses = (score, breaks), 0
+                else:
+                    misses += 1
+                previous = breaks
+            rows = len(breaks) - 1
+            if (rows >= len(aspects)) if factor > 1 else (rows <= min_rows):
+                break  # 已是每行一张 / 已是可能的最少行数
+            target *= factor
+
+    score, breaks = best
+    if score[0] <= 0:
+        return []  # 图片太多，间距已占满版面
+    _, scale, heights = score
+    block_height = sum(heights) * scale + gutter * (len(heights) - 1)
+    top = margin + (height - block_height) / 2
+    layouts = []
+    for (start, end), row_height in zip(zip(breaks, breaks[1:]), heights):
+        image_height = row_height * scale
+        row_width = (prefix[end] - prefix[start]) * image_height + gutter * (end - start - 1)
+        left = margin + (width - row_width) / 2
+        for aspect in aspects[start:end]:
+            image_width = aspect * image_height
+            layouts.append({"slide": 0, "left": round(left, 2), "top": round(top, 2),
+                            "width": round(image_width, 2), "height": round(image_height, 2)})
+            left += image_width + gutter
+        top += image_height + gutter
+    return layouts
+
+
+def auto_layout_files(work_dir, filenames, slide_width=SLIDE_WIDTH_CM, slide_height=SLIDE_HEIGHT_CM,
+                      margin=AUTO_LAYOUT_MARGIN_CM, gutter=AUTO_LAYOUT_GUTTER_CM):
+    """读取图片文件头得到像素尺寸后自动排版；返回 (布局列表, 错误列表)，无法识别的图片按4:3处理"""
+    sizes, errors = [], []
+    for filename in filenames:
+        try:
+            _, width, height = probe_image_header(os.path.join(work_dir, filename))
+        except (OSError, ValueError) as e:
+            errors.append(f"{filename}: {e}")
+            width, height = 4, 3
+        sizes.append((width, height))
+    layouts = solve_auto_layout(sizes, slide_width, slide_height, margin, gutter)
+    return layouts, errors
+
+
+# ========== 监视模式 ==========
+
+def referenced_inputs(image_configs, text_configs, work_dir):
+    """当前配置实际引用的输入文件（图片 + 按关键词匹配到的文本文件），返回排序后的路径列表"""
+    paths = set()
+    used = {config['filename'] for config in image_configs if config and not is_contact_sheet(config)}
+    for config in image_configs:
+        if is_contact_sheet(config):
+            paths.update(os.path.join(work_dir, name) for name in contact_sheet_files(config, work_dir, used))
+        elif config and config.get('filename'):
+            paths.add(os.path.join(work_dir, config['filename']))
+    for config in text_configs:
+        if not config:
+            continue
+        try:
+            matched_file = find_text_file(work_dir, config.get('keyword', '').strip())
+        except TextExtractionError:
+            matched_file = None
+        if matched_file:
+            paths.add(os.path.join(work_dir, matched_file))
+    return sorted(paths)
+
+
+class InputWatcher:
+    """轮询被引用输入文件的 (mtime, 大小)，变化后连续 debounce 秒不再变化才报告（合并成批写入）
+
+    只监视配置引用的文件，输出PPT等其他文件的变化不会触发重新生成。
+    """
+
+    def __init__(self, resolve_inputs, debounce=1.0):
+        self.resolve_inputs = resolve_inputs  # 无参函数，返回当前引用的输入路径列表
+        self.debounce = debounce
+        self.state = self.snapshot()
+        self.changed_at = None
+
+    def snapshot(self):
+        state = {}
+        for path in self.resolve_inputs():
+            try:
+                st = os.stat(path)
+                state[path] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                state[path] = None
+        return state
+
+    def poll(self):
+        """检查一次，输入已变化且已稳定时返回True"""
+        state = self.snapshot()
+        now = time.monotonic()
+        if state != self.state:
+            self.state = state
+            self.changed_at = now
+            return False
+        if self.changed_at is not None and now - self.changed_at >= self.debounce:
+            self.changed_at = None
+            return True
         return False
 
 
+# ========== 批量生成（跳过未变化的目录） ==========
+
+BATCH_MANIFEST_FILE = os.path.join(CONFIG_DIR, "batch_manifest.json")
+# 清单每记录这么多个目录或每隔这么多秒写盘一次（另在批量结束时写盘），避免每个目录都重写整个清单
+MANIFEST_SAVE_EVERY = 50
+MANIFEST_SAVE_INTERVAL = 5.0
+
+
+def stat_signature(path):
+    """文件签名 [修改时间ns, 大小]，文件不存在时为None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def mode_fingerprint(mode_config):
+    """布局模式内容的哈希：改动布局、文本配置或模板后输出随之失效"""
+    data = json.dumps(mode_config, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class BuildManifest:
+    """记录每个输出PPT的构建依据（模式哈希、模板标识、各输入文件的修改时间和大小），类似make的过期判断
+
+    判断只需要stat：工作目录的修改时间没变时直接比较已记录的输入；
+    目录有增删文件时才重新解析引用的输入，集合不变就仍视为最新。
+    """
+
+    def __init__(self, path=BATCH_MANIFEST_FILE, report=print):
+        self.path = path
+        self.entries = {}
+        self.dirty = 0  # 上次写盘后的改动数
+        self.saved_at = time.monotonic()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get("outputs", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            report(f"批量清单损坏，将全部重新生成: {e}")
+
+    def is_up_to_date(self, output, mode_hash, template_id, work_dir, resolve_inputs):
+        entry = self.entries.get(os.path.abspath(output))
+        if not entry or entry.get("mode_hash") != mode_hash or entry.get("template") != template_id:
+            return False
+        if stat_signature(output) != entry.get("output"):
+            return False
+        inputs = entry.get("inputs", {})
+        if any(stat_signature(path) != signature for path, signature in inputs.items()):
+            return False
+        dir_signature = stat_signature(work_dir)
+        if dir_signature != entry.get("work_dir"):
+            # 目录有增删文件：重新解析实际引用的输入，没有变化就只更新目录签名
+            if set(resolve_inputs()) != set(inputs):
+                return False
+            entry["work_dir"] = dir_signature
+            self.dirty += 1
+        return True
+
+    def record(self, output, mode_hash, template_id, work_dir_signature, inputs, rejected=None):
+        """inputs 为构建前采集的 {路径: 签名}，构建期间被改动的输入下次会被判为过期
+
+        rejected 为干运行发现的错误列表：被拒绝的目录同样按输入签名记录，输入变化前再次运行直接沿用结论。
+        """
+        entry = self.entries[os.path.abspath(output)] = {
+            "mode_hash": mode_hash,
+            "template": template_id,
+            "work_dir": work_dir_signature,
+            "inputs": inputs,
+            "output": stat_signature(output),
+            "built_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        if rejected:
+            entry["rejected"] = list(rejected)
+        self.dirty += 1
+
+    def rejected(self, output):
+        """记录中该输出被拒绝的原因（未被拒绝时为空列表）"""
+        return self.entries.get(os.path.abspath(output), {}).get("rejected", [])
+
+    def save(self):
+        if self.dirty:
+            atomic_write_json(self.path, {"version": 1, "outputs": self.entries})
+            self.dirty = 0
+            self.saved_at = time.monotonic()
+
+    def checkpoint(self):
+        """改动累积到 MANIFEST_SAVE_EVERY 个或距上次写盘超过 MANIFEST_SAVE_INTERVAL 秒时写盘"""
+        if self.dirty >= MANIFEST_SAVE_EVERY or (
+                self.dirty and time.monotonic() - self.saved_at >= MANIFEST_SAVE_INTERVAL):
+            self.save()
+
+
+def run_batch(work_dirs, mode_name, mode_config, template, output_name=None, manifest_path=None, force=False,
+              save_options=None, report=print):
+    """对多个工作目录批量生成，输入未变化的目录直接跳过（被拒绝的目录沿用上次的结论）；返回 (重建数, 跳过数, 失败数)"""
+    manifest = BuildManifest(manifest_path or BATCH_MANIFEST_FILE, report=report)
+    mode_hash = mode_fingerprint(mode_config)
+    template_id = list(template_cache_key(template))
+    slide_index = mode_config.get("slide_index", 0)
+    built = skipped = failed = 0
+    try:
+        for work_dir in work_dirs:
+            output = os.path.join(work_dir, output_name or f"{mode_name}.pptx")
+
+            def resolve_inputs():
+                image_configs, text_configs = configs_from_mode(mode_config, work_dir)
+                return referenced_inputs(image_configs, text_configs, work_dir)
+
+            if not force and manifest.is_up_to_date(output, mode_hash, template_id, work_dir, resolve_inputs):
+                rejected = manifest.rejected(output)
+                if rejected:
+                    failed += 1
+                    report(f"拒绝 {work_dir}（输入未变化）: " + "; ".join(rejected))
+                else:
+                    skipped += 1
+                manifest.checkpoint()
+                continue
+
+            work_dir_signature = stat_signature(work_dir)
+            image_configs, text_configs = configs_from_mode(mode_config, work_dir)
+            inputs = {path: stat_signature(path)
+                      for path in referenced_inputs(image_configs, text_configs, work_dir)}
+            # 先做干运行，有缺图、找不到数据等错误的目录直接拒绝，不打开模板
+            plan = plan_slide(image_configs, text_configs, work_dir)
+            if plan["errors"] or plan["text_errors"]:
+                failed += 1
+                errors = plan["errors"] + plan["text_errors"]
+                for error in errors:
+                    report(f"拒绝 {work_dir}: {error}")
+                manifest.record(output, mode_hash, template_id, work_dir_signature, inputs, rejected=errors)
+                manifest.checkpoint()
+                continue
+            try:
+                result = generate_deck(template, slide_index, image_configs, text_configs, work_dir, output,
+                                       save_options=save_options, plan=plan)
+            except Exception as e:
+                failed += 1
+                report(f"失败 {work_dir}: {e}")
+                continue
+            for error in result["errors"] + result["text_errors"]:
+                report(f"警告 {work_dir}: {error}")
+            manifest.record(output, mode_hash, template_id, work_dir_signature, inputs)
+            manifest.checkpoint()
+            built += 1
+            report(f"已生成 {output}")
+    finally:
+        manifest.save()
+    return built, skipped, failed
+
+
+# ========== 多页PPT（多进程并行生成） ==========
+
+def drop_dangling_relationships(part, element):
+    """删除element中在part里不存在的关系属性（从模板页复制来的形状带着模板页的rId）
+
+    必须在新增关系之前调用，否则新分配的rId可能与这些旧值重名，使形状指向错误的部件。
+    """
+    prefix = '{%s}' % R_NAMESPACE
+    for node in element.iter():
+        for key, value in list(node.attrib.items()):
+            if key.startswith(prefix) and value not in part.rels:
+                del node.attrib[key]
+
+
+def build_slide_worker(job):
+    """工作进程：独立复制模板页并填充一个工作目录，返回序列化的幻灯片XML和它引用的外部资源
+
+    图片不跨进程传输，只返回文件路径和SHA1，由写入进程统一读取、去重。
+    """
+    template, slide_index, work_dir, image_configs, text_configs, deck_dir = job
+    timer = PhaseTimer()
+    load_heavy_modules()
+    from lxml import etree
+    prs = open_template(template)  # 每个进程各自缓存模板
+    slide, _ = clone_template_slide(prs, slide_index)
+    drop_dangling_relationships(slide.part, slide._element)
+    result = fill_slide(slide, image_configs, text_configs, work_dir, timer, deck_dir=deck_dir)
+    rels = slide.part.rels
+    images = [(rId, path, rels[rId].target_part.sha1) for path, rId in result.pop("image_files").items()]
+    externals = [(rId, rel.reltype, rel.target_ref) for rId, rel in rels.items() if rel.is_external]
+    result.update(work_dir=work_dir, timer=timer.totals(), images=images, externals=externals,
+                  xml=etree.tostring(slide._element))
+    return result
+
+
+def file_sha1(path, chunk_size=1 << 20):
+    """分块计算文件SHA1（与python-pptx图片部件的sha1一致）"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+DEFAULT_MEDIA_MEMORY_BUDGET = 256 * 1024 * 1024  # 多页PPT构建时在内存中保留的图片总量上限（字节）
+
+_file_backed_image_part_class = None
+
+
+def file_backed_image_part(partname, content_type, package, spool, filename):
+    """创建内容留在磁盘上的图片部件：blob在访问时才读取，快速保存时直接从文件流式写入"""
+    global _file_backed_image_part_class
+    if _file_backed_image_part_class is None:
+        from pptx.parts.image import ImagePart
+
+        class FileBackedImagePart(ImagePart):
+            @property
+            def blob(self):
+                return self.spool.read()
+
+        _file_backed_image_part_class = FileBackedImagePart
+    part = _file_backed_image_part_class(partname, content_type, package, b'', filename)
+    part.spool = spool
+    return part
+
+
+class MediaStore:
+    """写入进程的图片部件表：按SHA1去重，自行分配部件名（python-pptx每次都遍历整个包查找）
+
+    memory_budget 为内存中保留的图片总字节数上限，超出后新图片不再读入内存，
+    只引用磁盘上的原文件（SpooledMedia），保存时流式写入；None 表示不限制。
+    """
+
+    HEADER_SIZE = 64 * 1024  # 识别图片格式只需文件开头
+
+    def __init__(self, prs, memory_budget=None):
+        from pptx.opc.packuri import PackURI
+        from pptx.parts.image import Image as PptxImage, ImagePart
+        self._pack_uri, self._image_cls, self._part_cls = PackURI, PptxImage, ImagePart
+        self.package = prs.part.package
+        self.memory_budget = memory_budget
+        self.in_memory = 0
+        self.spooled = 0
+        self.parts = {}
+        self.next_number = 1
+        for part in self.package.iter_parts():
+            match = re.match(r'/ppt/media/image(\d+)\.', str(part.partname))
+            if match:
+                self.next_number = max(self.next_number, int(match.group(1)) + 1)
+            if isinstance(part, ImagePart):
+                self.parts.setdefault(part.sha1, part)
+
+    def get(self, path, sha1=None):
+        if sha1 is None:
+            sha1 = file_sha1(path)
+        part = self.parts.get(sha1)
+        if part is not None:
+            return part
+        size = os.path.getsize(path)
+        if self.memory_budget is None or self.in_memory + size <= self.memory_budget:
+            image = self._image_cls.from_file(path)
+            partname = self._pack_uri(f'/ppt/media/image{self.next_number}.{image.ext}')
+            part = self._part_cls(partname, image.content_type, self.package, image.blob, image.filename)
+            self.in_memory += size
+        else:
+            spool = SpooledMedia(path)
+            with spool.open() as f:
+                image = self._image_cls(f.read(self.HEADER_SIZE), os.path.basename(path))
+            partname = self._pack_uri(f'/ppt/media/image{self.next_number}.{image.ext}')
+            part = file_backed_image_part(partname, image.content_type, self.package, spool, image.filename)
+            self.spooled += size
+        self.next_number += 1
+        self.parts[sha1] = part
+        return part
+
+
+def merge_built_slide(prs, layout, media, built):
+    """把工作进程生成的幻灯片并入prs：新建幻灯片、替换内容、重建图片和外部链接关系（重新分配rId）
+
+    所有 r:embed / r:id / r:link 等关系属性都要改写：不在工作进程返回的映射中的rId（如指向版式的关系、
+    未经 drop_dangling_relationships 清理的模板rId）保留原值会与这里新分配的rId重名，直接删除。
+    """
+    from pptx.oxml import parse_xml
+    slide = prs.slides.add_slide(layout)
+    remap = {}
+    for rId, path, sha1 in built["images"]:
+        remap[rId] = slide.part.relate_to(media.get(path, sha1), RT_IMAGE)
+    for rId, reltype, target in built["externals"]:
+        remap[rId] = slide.part.relate_to(target, reltype, is_external=True)
+
+    element = parse_xml(built["xml"])
+    prefix = '{%s}' % R_NAMESPACE
+    for node in element.iter():
+        for key, value in list(node.attrib.items()):
+            if not key.startswith(prefix):
+                continue
+            if value in remap:
+                node.set(key, remap[value])
+            else:
+                del node.attrib[key]
+    sld = slide._element
+    for child in list(sld):
+        sld.remove(child)
+    sld.extend(list(element))
+    return slide
+
+
+def build_multi_slide_deck(template, slide_index, jobs, output, workers=None, timer=None, save_options=None,
+                           report=None, memory_budget=DEFAULT_MEDIA_MEMORY_BUDGET):
+    """每个工作目录生成一页，合并为一个多页PPT
+
+    jobs 为 [(工作目录, image_configs, text_configs)]。各页在工作进程中并行生成
+    （workers=1 时在当前进程顺序生成），写入进程按顺序合并、统一分配部件名和关系ID、图片按SHA1去重。
+    图片超出 memory_budget 后留在磁盘上，保存时流式写入（见 MediaStore）。
+    返回结果字典：slides（每页的结果）、slide_count、media_in_memory/media_spooled（字节）、timer。
+    """
+    import concurrent.futures
+    timer = timer or PhaseTimer()
+    workers = workers or os.cpu_count() or 1
+    with timer.phase("导入依赖"):
+        load_heavy_modules()
+    with timer.phase("模板加载"):
+        prs = open_template(template)
+        if slide_index < 0 or slide_index >= len(prs.slides):
+            slide_index = 0
+        layout = prs.slides[slide_index].slide_layout
+        template_slide_count = len(prs.slides)
+        media = MediaStore(prs, memory_budget)
+
+    tasks = [(template, slide_index, work_dir, image_configs, text_configs, output_dir(output))
+             for work_dir, image_configs, text_configs in jobs]
+    slides = []
+    with timer.phase("生成并合并幻灯片", slides=len(tasks), workers=workers):
+        if workers == 1 or len(tasks) <= 1:
+            built_iter = map(build_slide_worker, tasks)
+            executor = None
+        else:
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks)))
+            built_iter = executor.map(build_slide_worker, tasks)
+        try:
+            for built in built_iter:
+                merge_built_slide(prs, layout, media, built)
+                for key in ("xml", "images", "externals"):
+                    del built[key]
+                slides.append(built)
+                if report:
+                    report(f"[{len(slides)}/{len(tasks)}] {built['work_dir']}")
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+
+    # 删除模板原有的幻灯片，只保留生成的页
+    for idx in reversed(range(template_slide_count)):
+        rId = prs.slides._sldIdLst[idx].rId
+        prs.part.drop_rel(rId)
+        del prs.slides._sldIdLst[idx]
+
+    with timer.phase("保存"):
+        save_presentation(prs, output, save_options)
+    return {"slides": slides, "slide_count": len(slides), "slide_index": slide_index, "timer": timer,
+            "media_in_memory": media.in_memory, "media_spooled": media.spooled}
+
+
+# ========== 追加到已有PPT ==========
+
+R_NAMESPACE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+CT_NAMESPACE = 'http://schemas.openxmlformats.org/package/2006/content-types'
+PR_NAMESPACE = 'http://schemas.openxmlformats.org/package/2006/relationships'
+RT_SLIDE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide'
+RT_SLIDE_LAYOUT = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/slideLayout'
+CT_SLIDE = 'application/vnd.openxmlformats-officedocument.presentationml.slide+xml'
+
+
+def unsupported_relationship(part, element):
+    """element引用的、copy_relationships无法复制的内部关系类型（图表、OLE对象等），都能复制时返回None"""
+    prefix = '{%s}' % R_NAMESPACE
+    for el in element.iter():
+        for attr, rId in el.attrib.items():
+            if not attr.startswith(prefix):
+                continue
+            rel = part.rels.get(rId)
+            if rel is not None and not rel.is_external and rel.reltype != RT_IMAGE:
+                return rel.reltype
+    return None
+
+
+def copy_relationships(src_part, dst_part, element):
+    """重写element中的关系ID，使其在dst_part中有效（调用前须用 unsupported_relationship 检查）
+
+    图片通过 get_or_add_image_part 复制，包中已有SHA1相同的图片时直接复用；外部链接原样重建；
+    源部件中不存在的关系ID直接删除。
+    """
+    prefix = '{%s}' % R_NAMESPACE
+    for el in element.iter():
+        for attr, rId in list(el.attrib.items()):
+            if not attr.startswith(prefix):
+                continue
+            rel = src_part.rels.get(rId)
+            if rel is None:
+                del el.attrib[attr]
+            elif rel.is_external:
+                el.set(attr, dst_part.relate_to(rel.target_ref, rel.reltype, is_external=True))
+            else:
+                _, new_rId = dst_part.get_or_add_image_part(io.BytesIO(rel.target_part.blob))
+                el.set(attr, new_rId)
+
+
+def append_template_slide(prs, source_slide_index):
+    """在prs末尾追加第source_slide_index页的副本（不复制图片），返回 (新幻灯片, 页索引, 未复制的形状说明列表)
+
+    新页只保留图片和外部链接关系，便于整页并入另一个PPT；引用图表、OLE对象等其他部件的形状不复制并报告。
+    """
+    if source_slide_index < 0 or source_slide_index >= len(prs.slides):
+        source_slide_index = 0
+    source_slide = prs.slides[source_slide_index]
+    new_slide = prs.slides.add_slide(source_slide.slide_layout)
+    dropped = []
+
+    for shape in source_slide.shapes:
+        try:
+            # 与 clone_template_slide 一致：跳过图片和图片占位符
+            if shape.shape_type == 13:
+                continue
+            if shape.is_placeholder and shape.placeholder_format.type == 18:
+                continue
+            reltype = unsupported_relationship(source_slide.part, shape.element)
+            if reltype:
+                dropped.append(f"模板页形状'{shape.name}'（{reltype.rsplit('/', 1)[-1]}）不支持追加，未复制")
+                continue
+            newel = deepcopy(shape.element)
+            copy_relationships(source_slide.part, new_slide.part, newel)
+            new_slide.shapes._spTree.append(newel)
+        except Exception as e:
+            dropped.append(f"模板页形状'{shape.name}'复制失败: {str(e)}")
+    return new_slide, source_slide_index, dropped
+
+
+class DeckPackage:
+    """已有PPT的ZIP包：只解析追加一页需要的部件（内容类型、presentation.xml及其关系、版式名称）"""
+
+    def __init__(self, zin):
+        from lxml import etree
+        self.zin = zin
+        self.names = set(zin.namelist())
+        self.content_types = etree.fromstring(zin.read('[Content_Types].xml'))
+        self.presentation = etree.fromstring(zin.read('ppt/presentation.xml'))
+        self.presentation_rels = etree.fromstring(zin.read('ppt/_rels/presentation.xml.rels'))
+        # CRC32和大小来自中央目录，不必读取图片内容；相同时再比较字节确认
+        self.media = {}
+        for info in zin.infolist():
+            if info.filename.startswith('ppt/media/'):
+                self.media.setdefault((info.CRC, info.file_size), []).append(info.filename)
+
+    def next_number(self, pattern):
+        numbers = [int(m.group(1)) for m in map(re.compile(pattern).match, self.names) if m]
+        return max(numbers, default=0) + 1
+
+    def layout_target(self, layout_name):
+        """同名版式的部件名；找不到时使用占位符最少的版式（通常是空白版式）"""
+        from lxml import etree
+        p = '{%s}' % P_NAMESPACE
+        layouts = []
+        for name in sorted(n for n in self.names if re.match(r'ppt/slideLayouts/slideLayout\d+\.xml$', n)):
+            root = etree.fromstring(self.zin.read(name))
+            c_sld = root.find(p + 'cSld')
+            if c_sld is not None and c_sld.get('name') == layout_name:
+                return name
+            layouts.append((sum(1 for _ in root.iter(p + 'ph')), name))
+        if not layouts:
+            raise ValueError("目标PPT中没有幻灯片版式")
+        return min(layouts)[1]
+
+    def find_media(self, blob):
+        for name in self.media.get((zlib.crc32(blob), len(blob)), []):
+            if self.zin.read(name) == blob:
+                return name
+        return None
+
+    def ensure_default_content_type(self, extension, content_type):
+        ct = '{%s}' % CT_NAMESPACE
+        for default in self.content_types.iterfind(ct + 'Default'):
+            if default.get('Extension', '').lower() == extension.lower():
+                return
+        from lxml import etree
+        self.content_types.insert(0, etree.Element(ct + 'Default', Extension=extension, ContentType=content_type))
+
+    def add_slide(self, slide_name):
+        """在presentation.xml末尾登记新幻灯片，返回新的页数"""
+        from lxml import etree
+        p, r, pr = '{%s}' % P_NAMESPACE, '{%s}' % R_NAMESPACE, '{%s}' % PR_NAMESPACE
+        used = {rel.get('Id') for rel in self.presentation_rels}
+        rId = next(f"rId{n}" for n in range(1, len(used) + 2) if f"rId{n}" not in used)
+        etree.SubElement(self.presentation_rels, pr + 'Relationship', Id=rId, Type=RT_SLIDE,
+                         Target=slide_name[len('ppt/'):])
+        etree.SubElement(self.content_types, '{%s}Override' % CT_NAMESPACE,
+                         PartName='/' + slide_name, ContentType=CT_SLIDE)
+
+        sld_id_lst = self.presentation.find(p + 'sldIdLst')
+        if sld_id_lst is None:
+            # 按schema顺序放在各母版ID列表之后
+            sld_id_lst = etree.Element(p + 'sldIdLst')
+            anchors = [el for el in (self.presentation.find(p + tag) for tag in
+                                     ('sldMasterIdLst', 'notesMasterIdLst', 'handoutMasterIdLst')) if el is not None]
+            if not anchors:
+                self.presentation.insert(0, sld_id_lst)
+            else:
+                anchors[-1].addnext(sld_id_lst)
+        ids = [int(sld_id.get('id')) for sld_id in sld_id_lst]
+        sld_id = etree.SubElement(sld_id_lst, p + 'sldId', id=str(max(ids + [255]) + 1))
+        sld_id.set(r + 'id', rId)
+        return len(sld_id_lst)
+
+
+def _xml_bytes(element):
+    from lxml import etree
+    return etree.tostring(element, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+
+def append_to_deck(deck_path, template, slide_index, image_configs, text_configs, work_dir, timer=None,
+                   save_options=None):
+    """把新生成的一页追加到已有PPT末尾，原子地写回deck_path
+
+    新页在模板的副本中生成，再整页并入目标PPT的ZIP包：原有成员的压缩数据原样复制（不解析、不重新压缩），
+    只写入新幻灯片及其关系、新图片（与已有图片相同时复用）、[Content_Types].xml 和 presentation.xml(.rels)，
+    追加的耗时与已有页数基本无关。
+    """
+    from lxml import etree
+    timer = timer or PhaseTimer()
+    options = dict(DEFAULT_SAVE_OPTIONS, **(save_options or {}))
+    with timer.phase("导入依赖"):
+        load_heavy_modules()
+    with timer.phase("模板加载"):
+        scratch = open_template(template)
+    with timer.phase("复制模板页"):
+        new_slide, slide_index, dropped = append_template_slide(scratch, slide_index)
+
+    result = fill_slide(new_slide, image_configs, text_configs, work_dir, timer, deck_dir=output_dir(deck_path))
+    result["errors"] = dropped + result["errors"]
+
+    tmp_path = f"{deck_path}.{os.getpid()}.tmp"
+    try:
+        with zipfile.ZipFile(deck_path) as zin:
+            with timer.phase("打开目标PPT"):
+                deck = DeckPackage(zin)
+                slide_number = deck.next_number(r'ppt/slides/slide(\d+)\.xml$')
+                slide_name = f"ppt/slides/slide{slide_number}.xml"
+                media_number = deck.next_number(r'ppt/media/image(\d+)\.')
+                rels = etree.Element('{%s}Relationships' % PR_NAMESPACE, nsmap={None: PR_NAMESPACE})
+                new_members = []
+                for rId, rel in new_slide.part.rels.items():
+                    attrs = {"Id": rId, "Type": rel.reltype}
+                    if rel.is_external:
+                        attrs.update(Target=rel.target_ref, TargetMode="External")
+                    elif rel.reltype == RT_SLIDE_LAYOUT:
+                        attrs["Target"] = "../" + deck.layout_target(new_slide.slide_layout.name)[len('ppt/'):]
+                    elif rel.reltype == RT_IMAGE:
+                        part = rel.target_part
+                        media_name = deck.find_media(part.blob)
+                        if media_name is None:
+                            media_name = f"ppt/media/image{media_number}.{part.partname.ext}"
+                            media_number += 1
+                            deck.ensure_default_content_type(part.partname.ext, part.content_type)
+                            deck.media[(zlib.crc32(part.blob), len(part.blob))] = [media_name]
+                            new_members.append((media_name, part.blob, part.content_type))
+                        attrs["Target"] = "../" + media_name[len('ppt/'):]
+                    else:
+                        raise ValueError(f"新幻灯片含有不支持追加的关系: {rel.reltype}")
+                    etree.SubElement(rels, '{%s}Relationship' % PR_NAMESPACE, **attrs)
+                slide_count = deck.add_slide(slide_name)
+                new_members += [
+                    (slide_name, _xml_bytes(new_slide._element), CT_SLIDE),
+                    (slide_name.replace('slides/', 'slides/_rels/') + '.rels', _xml_bytes(rels), None),
+                ]
+                patched = {
+                    '[Content_Types].xml': _xml_bytes(deck.content_types),
+                    'ppt/presentation.xml': _xml_bytes(deck.presentation),
+                    'ppt/_rels/presentation.xml.rels': _xml_bytes(deck.presentation_rels),
+                }
+
+            # 先写临时文件再替换，保存失败不会损坏已有的PPT
+            with timer.phase("保存", parts=len(patched) + len(new_members)):
+                date_time = datetime.now().timetuple()[:6]
+                level = options["compresslevel"]
+                with zipfile.ZipFile(tmp_path, 'w', allowZip64=True) as zout:
+                    for info in zin.infolist():
+                        blob = patched.get(info.filename)
+                        if blob is None:
+                            _copy_member(zin, info, zout)
+                        else:
+                            _write_deflated_member(zout, zipfile.ZipInfo(info.filename, info.date_time), blob,
+                                                   _deflate(blob, level), level)
+                    for name, blob, content_type in new_members:
+                        zinfo = zipfile.ZipInfo(name, date_time=date_time)
+                        zinfo.external_attr = 0o644 << 16
+                        if content_type in STORED_CONTENT_TYPES:
+                            zinfo.compress_type = zipfile.ZIP_STORED
+                            zout.writestr(zinfo, blob)
+                        else:
+                            _write_deflated_member(zout, zinfo, blob, _deflate(blob, level), level)
+        os.replace(tmp_path, deck_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    result.update(slide_index=slide_index, timer=timer, slide_count=slide_count)
+    return result
+
+
+# ========== 刷新已生成PPT中的数值 ==========
+
+SLIDE_PART_NAME = re.compile(r'ppt/slides/slide\d+\.xml$')
+
+
+def _copy_member(zin, info, zout):
+    """把zin中的一个成员复制到zout：原样复制压缩数据（不解压、不重新压缩，按块流式拷贝）
+
+    zipfile自检不通过时（见 raw_zip_writes_supported）改为经公开接口解压后重新压缩写入。
+    """
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.external_attr = info.external_attr
+    if not raw_zip_writes_supported():
+        import shutil
+        with zin.open(info) as src, zout.open(zinfo, 'w', force_zip64=info.file_size > 0x7FFFFFFF) as dst:
+            shutil.copyfileobj(src, dst, STREAM_CHUNK_SIZE)
+        return
+
+    import struct
+    zin.fp.seek(info.header_offset)
+    header = zin.fp.read(30)
+    if header[:4] != b'PK\x03\x04':
+        raise zipfile.BadZipFile(f"成员 {info.filename} 的本地文件头损坏")
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    zin.fp.seek(info.header_offset + 30 + name_length + extra_length)
+
+    def chunks(remaining=info.compress_size):
+        while remaining:
+            chunk = zin.fp.read(min(remaining, STREAM_CHUNK_SIZE))
+            if not chunk:
+                raise zipfile.BadZipFile(f"成员 {info.filename} 的数据不完整")
+            remaining -= len(chunk)
+            yield chunk
+
+    zinfo.file_size = info.file_size
+    zinfo.compress_size = info.compress_size
+    zinfo.CRC = info.CRC
+    _write_raw_member(zout, zinfo, chunks())
+
+
+def refresh_slide_values(root, deck_dir, work_dir, values, timer, output_dir=None):
+    """改写一页幻灯片XML（lxml元素）中带来源标记的文本框的文本和大小
+
+    工作目录为 work_dir，为空时按标记中相对 deck_dir 的路径解析；output_dir 与 deck_dir 不同（另存到其他目录）
+    或指定了其他工作目录时，同时把标记中的相对路径改为相对 output_dir。
+    values 是各页共用的提取结果缓存（同一来源只读一次数据文件）。
+    返回 (改动数, 未变数, 错误列表, XML是否有改动)。
+    """
+    a = '{%s}' % A_NAMESPACE
+    p = '{%s}' % P_NAMESPACE
+    output_dir = output_dir or deck_dir
+    updated, unchanged, errors, modified = 0, 0, [], False
+    for c_nv_pr in root.iter(p + 'cNvPr'):
+        source = parse_text_source_tag(c_nv_pr)
+        shape = c_nv_pr.getparent().getparent()
+        if source is None or shape.tag != p + 'sp':
+            continue
+        name = c_nv_pr.get('name', '文本框')
+        source_dir = work_dir or os.path.normpath(os.path.join(deck_dir, source.pop('work_dir', '.')))
+        key = (source_dir, json.dumps({k: source.get(k) for k in TEXT_SOURCE_KEYS}, sort_keys=True))
+        if key not in values:
+            try:
+                values[key] = XML_INVALID_CHARS.sub('', extract_text_value(source_dir, source, timer)[0])
+            except Exception as e:
+                values[key] = e
+        text = values[key]
+        if isinstance(text, Exception):
+            errors.append(f"{name}: {str(text)}")
+            continue
+
+        # 另存到其他目录或改用其他工作目录时，标记中的相对路径随之更新
+        tag = c_nv_pr.find(f'{a}extLst/{a}ext/{{{TEXT_SOURCE_NAMESPACE}}}source')
+        try:
+            relative = os.path.relpath(os.path.abspath(source_dir), output_dir).replace(os.sep, '/')
+        except ValueError:
+            relative = None
+        if tag.get('work_dir') != relative:
+            if relative is None:
+                tag.attrib.pop('work_dir', None)
+            else:
+                tag.set('work_dir', relative)
+            modified = True
+
+        runs = list(shape.iter(a + 'r'))
+        if not runs:
+            errors.append(f"{name}: 文本框中没有文字")
+            continue
+        if ''.join(t.text or '' for t in shape.iter(a + 't')) == text:
+            unchanged += 1
+            continue
+
+        # 数值写入第一个文字块，其余文字块和段落删除（保留第一个文字块的字体格式）
+        first_run = runs[0]
+        paragraph = first_run.getparent()
+        for other in list(paragraph.getparent().iterfind(a + 'p')):
+            if other is not paragraph:
+                other.getparent().remove(other)
+        for child in list(paragraph):
+            if child is not first_run and child.tag in (a + 'r', a + 'br', a + 'fld'):
+                paragraph.remove(child)
+        first_run.find(a + 't').text = text
+
+        # 不换行的文本框按新文本重新测量大小（位置不变）
+        body = shape.find(f'{p}txBody/{a}bodyPr')
+        ext = shape.find(f'{p}spPr/{a}xfrm/{a}ext')
+        if body is not None and body.get('wrap') == 'none' and ext is not None:
+            r_pr = first_run.find(a + 'rPr')
+            latin = r_pr.find(a + 'latin') if r_pr is not None else None
+            size = int(r_pr.get('sz')) / 100 if r_pr is not None and r_pr.get('sz') else TEXT_FONT_SIZE
+            font_name = latin.get('typeface') if latin is not None else TEXT_FONT_NAME
+            width, height = measure_text(text, font_name, size)
+            ext.set('cx', str(cm_to_emu(width)))
+            ext.set('cy', str(cm_to_emu(height)))
+        updated += 1
+        modified = True
+    return updated, unchanged, errors, modified
+
+
+def refresh_deck(deck_path, work_dir=None, output=None, timer=None, compresslevel=6):
+    """刷新已生成PPT中本工具添加的文本框的数值：按来源标记重新提取，只改写这些文本
+
+    只解析带标记的幻灯片XML，图片等其他成员的压缩数据原样复制；数值都没有变化时不写文件。
+    work_dir 为空时按标记中相对PPT所在目录的路径取值（没有记录时就是PPT所在目录）；
+    output 为空时原子地写回 deck_path。
+    返回结果字典：updated、unchanged、errors、slides（改写的幻灯片数）、timer。
+    """
+    from lxml import etree
+    timer = timer or PhaseTimer()
+    output = output or deck_path
+    deck_dir = output_dir(deck_path)
+    result = {"updated": 0, "unchanged": 0, "errors": [], "slides": 0, "timer": timer}
+    values = {}
+    patched = {}
+    tag_bytes = TEXT_SOURCE_NAMESPACE.encode()
+    tmp_path = f"{output}.{os.getpid()}.tmp"
+    try:
+        with zipfile.ZipFile(deck_path) as zin:
+            with timer.phase("刷新数值"):
+                for info in zin.infolist():
+                    if not SLIDE_PART_NAME.match(info.filename):
+                        continue
+                    blob = zin.read(info)
+                    if tag_bytes not in blob:
+                        continue
+                    root = etree.fromstring(blob)
+                    updated, unchanged, errors, modified = refresh_slide_values(
+                        root, deck_dir, work_dir, values, timer, output_dir(output))
+                    result["updated"] += updated
+                    result["unchanged"] += unchanged
+                    result["errors"] += [f"{info.filename}: {error}" for error in errors]
+                    if modified:
+                        patched[info.filename] = etree.tostring(root, xml_declaration=True, encoding='UTF-8',
+                                                                standalone=True)
+            result["slides"] = len(patched)
+            if not patched and output == deck_path:
+                return result
+
+            # 先写临时文件再替换，保存失败不会损坏已有的PPT
+            with timer.phase("保存", parts=len(patched)):
+                with zipfile.ZipFile(tmp_path, 'w') as zout:
+                    for info in zin.infolist():
+                        blob = patched.get(info.filename)
+                        if blob is None:
+                            _copy_member(zin, info, zout)
+                            continue
+                        _write_deflated_member(zout, zipfile.ZipInfo(info.filename, info.date_time), blob,
+                                               _deflate(blob, compresslevel), compresslevel)
+        os.replace(tmp_path, output)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return result
+
+
+# ========== 本地任务服务 ==========
+
+JOB_SERVER_PORT = 8765
+JOB_TOKEN_FILE = os.path.join(CONFIG_DIR, "job_server.token")
+JOB_MAX_REQUEST_BYTES = 64 * 1024
+
+
+def create_job_token():
+    """生成新的访问令牌，写入配置目录中仅本人可读写（0600）的文件；每次启动服务都换新令牌"""
+    import secrets
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    tmp_path = f"{JOB_TOKEN_FILE}.{os.getpid()}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='ascii') as f:
+            f.write(token)
+        os.replace(tmp_path, JOB_TOKEN_FILE)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return token
+
+
+def read_job_token():
+    """读取任务服务的访问令牌（服务未启动过时抛出OSError）"""
+    with open(JOB_TOKEN_FILE, 'r', encoding='ascii') as f:
+        return f.read().strip()
+
+
+def resolve_job_output(work_dir, output):
+    """任务的输出路径：相对路径按工作目录解析；必须位于工作目录内、扩展名为.pptx且文件尚不存在"""
+    root = os.path.realpath(work_dir)
+    path = os.path.realpath(os.path.join(root, output))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"输出路径必须在工作目录内: {output}")
+    if not path.lower().endswith('.pptx'):
+        raise ValueError(f"输出文件必须是.pptx: {output}")
+    if os.path.exists(path):
+        raise ValueError(f"输出文件已存在，不会覆盖: {path}")
+    return path
+
+
+class JobServer:
+    """本地任务服务：接收生成任务排队，由常驻的工作线程依次执行
+
+    进程常驻，模板文件内容和元数据、预编译布局、日志行索引等缓存一直保持热，
+    大量短任务不必每次启动解释器、导入pptx、读模板。每个任务仍从缓存的字节解析一个新的
+    Presentation：生成会修改它，解析好的对象不能在任务之间共用。
+    """
+
+    MAX_FINISHED = 1000  # 保留的已结束任务数，更早的任务不再能查询
+
+    def __init__(self, workers=2):
+        import queue
+        self.queue = queue.Queue()
+        self.jobs = {}
+        self.finished = []
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.running = 0
+        self.started = time.time()
+        self.workers = max(1, workers)
+        self._modes = None
+        self._modes_stamp = None
+        for _ in range(self.workers):
+            threading.Thread(target=self.worker, daemon=True).start()
+
+    def modes(self):
+        """布局模式存储：模式目录或索引变化时才重新加载（界面中新保存的模式立即可用）"""
+        stamp = tuple(os.stat(path).st_mtime_ns if os.path.exists(path) else None
+                      for path in (MODES_DIR, os.path.join(MODES_DIR, ModeStore.INDEX_NAME)))
+        with self.lock:
+            if self._modes is None or stamp != self._modes_stamp:
+                self._modes, self._modes_stamp = load_custom_modes(), stamp
+            return self._modes
+
+    def submit(self, request):
+        """校验并排队一个任务：{"work_dir", "mode", 可选 "output", "template", "overflow"}，返回任务字典
+
+        output 按工作目录解析，必须在工作目录内且尚不存在（任务服务不覆盖任何文件）。
+        """
+        work_dir, mode_name = request.get("work_dir"), request.get("mode")
+        if not work_dir or not mode_name:
+            raise ValueError("需要 work_dir 和 mode")
+        if not os.path.isdir(work_dir):
+            raise ValueError(f"工作目录不存在: {work_dir}")
+        output = resolve_job_output(work_dir, request["output"]) if request.get("output") else None
+        mode_config = self.modes().get(mode_name)
+        if mode_config is None:
+            raise ValueError(f"找不到布局模式: {mode_name}")
+        template = request.get("template") or resolve_mode_template(mode_config)
+        if not template or not os.path.exists(template):
+            raise ValueError(f"模板文件不存在: {template}")
+        with self.lock:
+            job = {"id": str(self.next_id), "status": "queued", "work_dir": work_dir, "mode": mode_name,
+                   "template": template, "output": output,
+                   "overflow": bool(request.get("overflow")), "mode_config": mode_config,
+                   "submitted": datetime.now().isoformat(timespec="seconds")}
+            self.next_id += 1
+            self.jobs[job["id"]] = job
+        self.queue.put(job)
+        return job
+
+    def worker(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                job["status"] = "running"
+                self.running += 1
+            try:
+                result = dict(self.run_job(job), status="done")
+            except Exception as e:
+                result = {"status": "failed", "error": str(e)}
+            finally:
+                with self.lock:
+                    job.update(result)
+                    self.running -= 1
+                    job.pop("mode_config", None)
+                    self.finished.append(job["id"])
+                    while len(self.finished) > self.MAX_FINISHED:
+                        self.jobs.pop(self.finished.pop(0), None)
+
+    def run_job(self, job):
+        mode_config, work_dir = job["mode_config"], job["work_dir"]
+        image_configs, text_configs = configs_from_mode(mode_config, work_dir)
+        extra_pages = overflow_pages(image_configs, work_dir) if job["overflow"] else None
+        if job["output"]:
+            open(job["output"], 'xb').close()  # 排队期间出现了同名文件时不覆盖（抛出FileExistsError）
+        output = job["output"] or default_output_path(work_dir, job["mode"])
+        with discard_on_failure(output):
+            result = generate_deck(job["template"], mode_config.get("slide_index", 0), image_configs,
+                                   text_configs, work_dir, output, extra_pages=extra_pages)
+        return {
+            "output": output,
+            "page_count": result["page_count"],
+            "image_success": result["image_success"],
+            "text_success": result["text_success"],
+            "errors": result["errors"] + result["text_errors"],
+            "timings_ms": {name: round(total * 1000, 1) for name, (total, _) in result["timer"].totals().items()},
+            "finished": datetime.now().isoformat(timespec="seconds"),
+        }
+
+    def job_view(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return None if job is None else {k: v for k, v in job.items() if k != "mode_config"}
+
+    def status(self):
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return {"queue_depth": self.queue.qsize(), "running": self.running, "workers": self.workers,
+                    "jobs": counts, "templates_cached": len(_template_cache),
+                    "uptime_s": round(time.time() - self.started, 1)}
+
+
+def make_job_handler(job_server, port, token):
+    """HTTP接口：POST /jobs 提交任务，GET /jobs/<id> 查询任务，GET /status 查询队列
+
+    每个请求都要求 Host 为本机地址（防DNS重绑定）并带上令牌（Authorization: Bearer <令牌>）；
+    POST 只接受 application/json（浏览器跨域的简单请求无法满足这两项）。
+    """
+    import hmac
+    from http.server import BaseHTTPRequestHandler
+    allowed_hosts = {f"127.0.0.1:{port}", f"localhost:{port}"}
+    expected = f"Bearer {token}".encode('ascii')
+
+    class JobHandler(BaseHTTPRequestHandler):
+        def send_json(self, code, data):
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def authorized(self):
+            """检查Host和令牌，不通过时已发送错误响应"""
+            if self.headers.get("Host", "").lower() not in allowed_hosts:
+                self.send_json(403, {"error": "不接受的Host"})
+                return False
+            supplied = self.headers.get("Authorization", "").encode('utf-8', 'replace')
+            if not hmac.compare_digest(supplied, expected):
+                self.send_json(401, {"error": f"缺少或错误的令牌（见 {JOB_TOKEN_FILE}）"})
+                return False
+            return True
+
+        def do_POST(self):
+            if not self.authorized():
+                return
+            if self.path.rstrip('/') != '/jobs':
+                return self.send_json(404, {"error": "未知路径"})
+            if self.headers.get_content_type() != "application/json":
+                return self.send_json(415, {"error": "需要 Content-Type: application/json"})
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                if length < 0:  # rfile.read(-1) 会一直等到客户端关闭连接
+                    raise ValueError("Content-Length 无效")
+                if length > JOB_MAX_REQUEST_BYTES:
+                    return self.send_json(413, {"error": "请求过大"})
+                request = json.loads(self.rfile.read(length) or b'{}')
+                if not isinstance(request, dict):
+                    raise ValueError("请求必须是JSON对象")
+                job = job_server.submit(request)
+            except (ValueError, TypeError) as e:
+                return self.send_json(400, {"error": str(e)})
+            self.send_json(202, {"id": job["id"], "status": job["status"],
+                                 "queue_depth": job_server.queue.qsize()})
+
+        def do_GET(self):
+            if not self.authorized():
+                return
+            path = self.path.rstrip('/')
+            if path == '/status':
+                return self.send_json(200, job_server.status())
+            if path.startswith('/jobs/'):
+                job = job_server.job_view(path[len('/jobs/'):])
+                if job is None:
+                    return self.send_json(404, {"error": "任务不存在或已过期"})
+                return self.send_json(200, job)
+            self.send_json(404, {"error": "未知路径"})
+
+        def log_message(self, format, *args):
+            pass  # 不为每个请求打印访问日志
+
+    return JobHandler
+
+
+def serve_jobs(port=JOB_SERVER_PORT, workers=2, report=print):
+    """在本机 127.0.0.1:port 上运行任务服务（阻塞，Ctrl+C退出）；启动时预热各模式的模板"""
+    from http.server import ThreadingHTTPServer
+    load_heavy_modules()
+    modes = load_custom_modes()
+    for name in modes.keys():
+        template = resolve_mode_template(modes.get(name) or {})
+        if template:
+            warm_template_cache(template)
+    job_server = JobServer(workers)
+    token = create_job_token()
+    httpd = ThreadingHTTPServer(("127.0.0.1", port), make_job_handler(job_server, port, token))
+    report(f"任务服务已启动: http://127.0.0.1:{port}（{job_server.workers} 个工作线程），按 Ctrl+C 退出")
+    report(f"访问令牌保存在 {JOB_TOKEN_FILE}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+    return 0
+
+
+def submit_job(request, port=JOB_SERVER_PORT, wait=False, poll_interval=0.2):
+    """向本地任务服务提交任务（只用标准库，不导入pptx），wait为True时等到任务结束，返回任务字典
+
+    令牌从服务写入的 JOB_TOKEN_FILE 读取，只有同一用户能提交。
+    """
+    import urllib.request
+    import urllib.error
+    base = f"http://127.0.0.1:{port}"
+    headers = {"Authorization": f"Bearer {read_job_token()}"}
+    data = json.dumps(request, ensure_ascii=False).encode('utf-8')
+    post = urllib.request.Request(f"{base}/jobs", data=data,
+                                  headers=dict(headers, **{"Content-Type": "application/json"}))
+    try:
+        with urllib.request.urlopen(post) as response:
+            job = json.load(response)
+        while wait and job.get("status") in ("queued", "running"):
+            time.sleep(poll_interval)
+            poll = urllib.request.Request(f"{base}/jobs/{job['id']}", headers=headers)
+            with urllib.request.urlopen(poll) as response:
+                job = json.load(response)
+    except urllib.error.HTTPError as e:
+        raise ValueError(json.load(e).get("error", str(e)))
+    return job
+
+
 class ImageEntry:
     """图片条目类，用于管理单个图片的配置"""
 
@@ -320,6 +4036,15 @@ class ImageEntry:
         tk.Entry(settings_frame, textvariable=self.height_var, width=8,
                 font=("微软雅黑", 8)).grid(row=0, column=7, padx=3)
 
+        # 联系表：填写列数后，文件名一栏作为通配符（空为其余全部图片），多张小图拼成一张插入
+        tk.Label(settings_frame, text="联系表列数:", bg='white', font=("微软雅黑", 8)).grid(row=0, column=8, padx=3)
+        self.sheet_columns_var = tk.StringVar(value="")
+        tk.Entry(settings_frame, textvariable=self.sheet_columns_var, width=4,
+                font=("微软雅黑", 8)).grid(row=0, column=9, padx=3)
+        self.sheet_labels_var = tk.BooleanVar(value=True)
+        tk.Checkbutton(settings_frame, text="标注", variable=self.sheet_labels_var, bg='white',
+                       font=("微软雅黑", 8)).grid(row=0, column=10, padx=3)
+
     def delete_self(self):
         """删除当前条目"""
         self.frame.destroy()
@@ -339,6 +4064,25 @@ class ImageEntry:
             self.height_var.set(f"{layout.get('height'):.2f}")
         else:
             self.height_var.set("")
+        if is_contact_sheet(layout):
+            self.sheet_columns_var.set(str(layout['sheet_columns']))
+            self.sheet_labels_var.set(layout.get('sheet_labels', True))
+            self.image_filename.set(layout.get('sheet_pattern', ''))
+        else:
+            self.sheet_columns_var.set("")
+
+    def is_contact_sheet(self):
+        return bool(self.sheet_columns_var.get().strip())
+
+    def sheet_config(self):
+        """联系表相关的配置项（非联系表时为空字典）"""
+        if not self.is_contact_sheet():
+            return {}
+        return {
+            "sheet_columns": int(self.sheet_columns_var.get()),
+            "sheet_pattern": self.image_filename.get().strip(),
+            "sheet_labels": self.sheet_labels_var.get(),
+        }
 
     def get_config(self):
         """获取当前配置"""
@@ -354,6 +4098,9 @@ class ImageEntry:
                 config["width"] = float(self.width_var.get())
             if self.height_var.get().strip():
                 config["height"] = float(self.height_var.get())
+            if self.is_contact_sheet():
+                config.update(self.sheet_config())
+                config["filename"] = ""
 
             return config
         except ValueError as e:
@@ -382,6 +4129,12 @@ class TextEntry:
         tk.Entry(path_frame, textvariable=self.keyword_var, width=15,
                 font=("微软雅黑", 8)).pack(side=tk.LEFT, padx=(0, 10))
 
+        # 替换标记：填写后把值写入模板页中的 {{标记}}，不再新建文本框
+        tk.Label(path_frame, text="替换标记:", bg='white', font=("微软雅黑", 8)).pack(side=tk.LEFT, padx=(0, 5))
+        self.token_var = tk.StringVar(value="")
+        tk.Entry(path_frame, textvariable=self.token_var, width=10,
+                font=("微软雅黑", 8)).pack(side=tk.LEFT, padx=(0, 10))
+
         RoundedButton(path_frame, text="删除", command=self.delete_self,
                      bg='#FFE0E0', hover_bg='#FFD0D0', font=("微软雅黑", 8),
                      width=70, height=28, corner_radius=10).pack(side=tk.LEFT, padx=(5, 0))
@@ -414,6 +4167,13 @@ class TextEntry:
         tk.Entry(settings_frame, textvariable=self.top_var, width=5,
                 font=("微软雅黑", 8)).grid(row=0, column=7, padx=3)
 
+        # 数据路径：JSON文件填 $.results[0].energy，XML文件填 /run/energy 或 //item[@name='e']/@value，
+        # 多个用逗号分隔；填写后不再按行、列读取
+        tk.Label(settings_frame, text="路径:", bg='white', font=("微软雅黑", 8)).grid(row=0, column=8, padx=3, sticky=tk.W)
+        self.path_var = tk.StringVar(value="")
+        tk.Entry(settings_frame, textvariable=self.path_var, width=16,
+                font=("微软雅黑", 8)).grid(row=0, column=9, padx=3)
+
     def delete_self(self):
         """删除当前条目"""
         self.frame.destroy()
@@ -426,6 +4186,8 @@ class TextEntry:
         self.left_var.set(str(layout.get('left', 2)))
         self.top_var.set(str(layout.get('top', 2)))
         self.keyword_var.set(layout.get('keyword', ''))
+        self.token_var.set(layout.get('token', ''))
+        self.path_var.set(layout.get('path', ''))
 
     def get_config(self):
         """获取当前配置"""
@@ -437,11 +4199,21 @@ class TextEntry:
                 "top": float(self.top_var.get()),
                 "keyword": self.keyword_var.get().strip()  # 添加关键词
             }
+            token = self.token_var.get().strip()
+            if token:
+                config["token"] = token  # 替换模板中的 {{token}}
+            path = self.path_var.get().strip()
+            if path:
+                config["path"] = path  # JSON/XML数据路径
             return config
         except ValueError as e:
             raise ValueError(f"配置错误: {str(e)}")
 
 
+PREVIEW_SAMPLE_TEXT = "-1.23E+04"  # 预览中没有实际值时用于估算文本框大小（format_number最长的常见输出）
+PREVIEW_PENDING_TEXT_BOX_CM = (5, 1)  # 测量字体在后台加载完成前，预览中文本框的临时大小
+
+
 class LayoutPreviewCanvas(tk.Canvas):
     """布局预览画布"""
 
@@ -452,10 +4224,21 @@ class LayoutPreviewCanvas(tk.Canvas):
         self.ppt_width = 66.69  # PPT宽度（厘米）- 用户自定义尺寸
         self.ppt_height = 37.27  # PPT高度（厘米）- 用户自定义尺寸
         self.use_letters = use_letters  # 是否使用字母命名
+        self.pending_redraw = None  # 用临时文本框大小绘制时记下参数，测量字体就绪后重绘
+
+    def redraw_pending(self):
+        """测量字体就绪后，重绘用临时文本框大小画出的预览"""
+        if self.pending_redraw and measure_font_ready():
+            self.draw_layout(*self.pending_redraw)
+
+    def draw_layout(self, layouts, text_layouts=None, text_values=None):
+        """绘制布局预览（包含图片和文本框）
 
-    def draw_layout(self, layouts, text_layouts=None):
-        """绘制布局预览（包含图片和文本框）"""
+        文本框按与生成时相同的测量结果绘制：text_values 给出各文本条目的实际值（如检查结果），
+        没有时按一个典型的格式化数值估算。测量字体还在后台加载时先用临时大小，就绪后由 redraw_pending 重绘。
+        """
         self.delete("all")
+        self.pending_redraw = None
 
         if not layouts and not text_layouts:
             self.create_text(self.canvas_width/2, self.canvas_height/2,
@@ -549,9 +4332,13 @@ class LayoutPreviewCanvas(tk.Canvas):
                 left = left_cm * scale + offset_x
                 top = top_cm * scale + offset_y
 
-                # 文本框默认宽度和高度
-                width_cm = 5  # 默认宽度5cm
-                height_cm = 1  # 默认高度1cm
+                # 文本框大小与生成时一致：按文本的字形宽度测量
+                value = text_values[i] if text_values and i < len(text_values) else None
+                if measure_font_ready():
+                    width_cm, height_cm = measure_text(value if value is not None else PREVIEW_SAMPLE_TEXT)
+                else:
+                    width_cm, height_cm = PREVIEW_PENDING_TEXT_BOX_CM
+                    self.pending_redraw = (layouts, text_layouts, text_values)
                 width = width_cm * scale
                 height = height_cm * scale
 
@@ -585,8 +4372,16 @@ class PPTImageInserterGUI:
 
         self.image_entries = []
         self.text_entries = []
-        self.preset_modes = load_custom_modes()
+        # 先只用内置模式绘制界面，custom_modes.json在首次绘制后再加载
+        self.preset_modes = default_custom_modes()
         self.current_mode = tk.StringVar(value="自定义")
+        self.mode_filter_var = tk.StringVar(value="")
+        self.profile_var = tk.BooleanVar(value=PROFILE_ENABLED)  # 性能分析模式
+        self.watch_var = tk.BooleanVar(value=False)  # 监视模式
+        self.overflow_var = tk.BooleanVar(value=False)  # 图片超出布局时自动分页
+        self.watcher = None
+        self.last_output = None  # 最近一次生成的PPT，刷新数值时默认选中
+        self.trace_format_var = tk.StringVar(value=TRACE_FORMAT or "")  # 计时数据导出格式
         self.list_info_var = tk.StringVar(value="（可上下滚动）")
         self.preview_info_var = tk.StringVar(value="")
         self.info_hint = tk.StringVar(value="（提示）选择布局模式后，程序将自动加载模板和图片布局")
@@ -594,7 +4389,48 @@ class PPTImageInserterGUI:
         self.template_filename = tk.StringVar()
         self.work_path = tk.StringVar()  # 工作路径（原output_path）
 
+        start = time.perf_counter()
         self.create_widgets()
+        record_startup_phase("构建界面", start)
+
+        # 首次绘制之后再做的初始化（加载布局模式、后台导入pptx/Pillow）
+        self.root.after(0, self.deferred_init)
+
+    def deferred_init(self):
+        """首次绘制后执行：记录首屏时间、加载布局模式、后台预加载重量级依赖"""
+        self.root.update_idletasks()
+        STARTUP_TIMES["首次绘制"] = time.perf_counter() - _STARTUP_T0
+
+        start = time.perf_counter()
+        self.preset_modes = load_custom_modes()
+        self.refresh_mode_list()
+        record_startup_phase("加载布局模式", start)
+
+        threading.Thread(target=self.preload_heavy_modules, daemon=True).start()
+
+    def preload_heavy_modules(self):
+        """后台线程：预加载python-pptx和Pillow、预热测量字体，完成后汇报启动耗时"""
+        try:
+            load_heavy_modules()
+            # 默认字体通常没有安装，查找时会遍历字体目录，不能放在界面线程
+            start = time.perf_counter()
+            measure_font(TEXT_FONT_NAME)
+            record_startup_phase("预热测量字体", start)
+        except Exception as e:
+            # 导入失败留到首次使用时再报错
+            if sys.stderr:
+                print(f"预加载依赖失败: {e}", file=sys.stderr)
+        # Tk对象只能在主线程访问
+        self.root.after(0, self.report_startup_times)
+        self.root.after(0, self.preview_canvas.redraw_pending)
+
+    def report_startup_times(self):
+        """在状态区显示冷启动耗时分解（设置 PPT_INSERTER_STARTUP_TIMING=1 时同时打印）"""
+        report = format_startup_report()
+        if not self.preview_info_var.get():
+            self.preview_info_var.set(report)
+        if os.environ.get("PPT_INSERTER_STARTUP_TIMING") and sys.stdout:
+            print(report)
 
     def create_widgets(self):
         """创建界面组件"""
@@ -624,6 +4460,27 @@ class PPTImageInserterGUI:
                         bordercolor='#F5F5F5',
                         arrowsize=0)
 
+        # 菜单栏：诊断（性能分析、计时导出）
+        menubar = tk.Menu(self.root)
+        file_menu = tk.Menu(menubar, tearoff=0)
+        file_menu.add_command(label="生成到指定文件...", command=self.generate_ppt_as)
+        file_menu.add_command(label="追加到已有PPT...", command=self.append_ppt_to_deck)
+        file_menu.add_command(label="刷新数值...", command=self.fill_all_text)
+        file_menu.add_command(label="检查（不生成）", command=self.dry_run)
+        file_menu.add_separator()
+        file_menu.add_checkbutton(label="图片超出布局时自动分页", variable=self.overflow_var)
+        file_menu.add_checkbutton(label="监视模式（输入文件变化时自动重新生成）", variable=self.watch_var,
+                                  command=self.toggle_watch)
+        menubar.add_cascade(label="文件", menu=file_menu)
+        diag_menu = tk.Menu(menubar, tearoff=0)
+        diag_menu.add_checkbutton(label="性能分析模式（cProfile + 内存快照）", variable=self.profile_var)
+        diag_menu.add_separator()
+        diag_menu.add_radiobutton(label="不导出计时数据", variable=self.trace_format_var, value="")
+        diag_menu.add_radiobutton(label="导出计时数据（JSON Lines）", variable=self.trace_format_var, value="jsonl")
+        diag_menu.add_radiobutton(label="导出计时数据（Chrome trace）", variable=self.trace_format_var, value="chrome")
+        menubar.add_cascade(label="诊断", menu=diag_menu)
+        self.root.config(menu=menubar)
+
         # 主容器，白色背景
         main_container = tk.Frame(self.root, bg='white')
         main_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=15)
@@ -646,6 +4503,12 @@ class PPTImageInserterGUI:
         self.mode_combo.pack(side=tk.LEFT, padx=(0, 10))
         self.mode_combo.bind("<<ComboboxSelected>>", self.on_mode_change)
 
+        # 按名称筛选布局模式（模式很多时使用）
+        tk.Label(row1, text="筛选:", font=("微软雅黑", 9), bg='white').pack(side=tk.LEFT)
+        tk.Entry(row1, textvariable=self.mode_filter_var, width=10,
+                 font=("微软雅黑", 9), relief=tk.SOLID, bd=1).pack(side=tk.LEFT, padx=(3, 10), ipady=2)
+        self.mode_filter_var.trace_add("write", lambda *args: self.refresh_mode_list())
+
         # 合并后的模板按钮
         RoundedButton(row1, text="设置模板文件", command=self.browse_template,
                      bg='#FFF3E0', hover_bg='#FFE0C0', font=("微软雅黑", 9, "bold"),
@@ -655,6 +4518,10 @@ class PPTImageInserterGUI:
                      bg='#FFE0E0', hover_bg='#FFD0D0', font=("微软雅黑", 9, "bold"),
                      width=120, height=32, corner_radius=10).pack(side=tk.LEFT, padx=(0, 10))
 
+        RoundedButton(row1, text="从模板导入布局", command=self.import_layout_from_template,
+                     bg='#E3F2FD', hover_bg='#CFE3F7', font=("微软雅黑", 9, "bold"),
+                     width=130, height=32, corner_radius=10).pack(side=tk.LEFT, padx=(0, 10))
+
         # 模板文件名显示（只显示文件名，不显示完整路径）
         self.template_filename = tk.StringVar()
         tk.Label(row1, textvariable=self.template_filename,
@@ -679,15 +4546,19 @@ class PPTImageInserterGUI:
                      bg="#F1EFC0", hover_bg="#E4E1C0", font=("微软雅黑", 9, "bold"),
                      width=100, height=32, corner_radius=10).pack(side=tk.LEFT, padx=(8, 0))
 
-        # 工作目录右侧：填充所有图片、填充所有文本
+        # 工作目录右侧：填充所有图片、刷新数值
         RoundedButton(row2, text="填充所有图片", command=self.select_all_images,
                      bg='#E8F4E8', hover_bg='#D4E8D4', font=("微软雅黑", 9, "bold"),
                      width=110, height=32, corner_radius=10).pack(side=tk.LEFT, padx=(10, 0))
 
-        RoundedButton(row2, text="填充所有文本", command=self.fill_all_text,
+        RoundedButton(row2, text="刷新数值", command=self.fill_all_text,
                      bg='#E8F4FF', hover_bg='#D0E0FF', font=("微软雅黑", 9, "bold"),
                      width=110, height=32, corner_radius=10).pack(side=tk.LEFT, padx=(8, 0))
 
+        RoundedButton(row2, text="自动排版", command=self.auto_layout_images,
+                     bg='#F3E5F5', hover_bg='#E1CCE6', font=("微软雅黑", 9, "bold"),
+                     width=100, height=32, corner_radius=10).pack(side=tk.LEFT, padx=(8, 0))
+
         # ========== 中间区域：左侧图片列表 + 右侧预览（16:9） ==========
         middle_row = tk.Frame(main_container, bg='white')
         middle_row.pack(fill=tk.BOTH, expand=True, pady=(15, 0))
@@ -783,6 +4654,16 @@ class PPTImageInserterGUI:
         # 初始化
         self.update_preview()
 
+    def refresh_mode_list(self):
+        """按筛选条件刷新布局模式下拉列表"""
+        text = self.mode_filter_var.get()
+        if isinstance(self.preset_modes, ModeStore):
+            names = self.preset_modes.filter(text)
+        else:
+            # 模式存储尚未加载（启动阶段）
+            names = list(self.preset_modes.keys())
+        self.mode_combo['values'] = names
+
     def browse_template(self):
         """浏览并选择模板PPT"""
         filename = filedialog.askopenfilename(
@@ -795,6 +4676,7 @@ class PPTImageInserterGUI:
             filename_only = os.path.basename(filename)
             self.template_filename.set(filename_only)
             self.info_hint.set(f"已选择模板: {filename_only}")
+            warm_template_cache(filename)
 
             # 如果当前选中的模式有幻灯片索引，应用该模式
             mode = self.current_mode.get()
@@ -847,10 +4729,14 @@ class PPTImageInserterGUI:
             mode_to_delete = deletable_modes[selection[0]]
 
             if messagebox.askyesno("确认删除", f"确定要删除布局模式'{mode_to_delete}'吗？"):
-                del self.preset_modes[mode_to_delete]
-                save_custom_modes(self.preset_modes)
+                try:
+                    if not self.preset_modes.delete_mode(mode_to_delete):
+                        return
+                except Exception as e:
+                    messagebox.showerror("错误", f"删除模式失败: {str(e)}")
+                    return
 
-                self.mode_combo['values'] = list(self.preset_modes.keys())
+                self.refresh_mode_list()
                 if self.current_mode.get() == mode_to_delete:
                     self.current_mode.set("自定义")
 
@@ -866,6 +4752,74 @@ class PPTImageInserterGUI:
                      bg='#F0F0F0', hover_bg='#E0E0E0', font=("微软雅黑", 10),
                      width=120, height=32, corner_radius=10).pack(side=tk.LEFT, fill=tk.X, expand=True)
 
+    def import_layout_from_template(self):
+        """读取模板某一页的图片占位符和图片形状位置，直接保存为布局模式"""
+        template = self.template_path.get()
+        if not template or not os.path.exists(template):
+            messagebox.showwarning("提示", "请先设置模板文件！")
+            return
+
+        try:
+            info = get_template_info(template)
+        except Exception as e:
+            messagebox.showerror("错误", f"读取模板失败: {str(e)}")
+            return
+
+        total_slides = info["slide_count"]
+        if total_slides == 0:
+            messagebox.showinfo("提示", "模板文件中没有幻灯片")
+            return
+
+        slide_num = simpledialog.askinteger(
+            "选择模板页",
+            f"模板文件共有 {total_slides} 页幻灯片\n\n请输入从第几页导入布局（1-{total_slides}）：",
+            parent=self.root, minvalue=1, maxvalue=total_slides, initialvalue=1)
+        if not slide_num:
+            return
+
+        layouts, text_layouts = layouts_from_template_slide(info["slides"][slide_num - 1])
+        if not layouts and not text_layouts:
+            messagebox.showinfo("提示", f"模板第{slide_num}页没有图片占位符、图片或空白文本框")
+            return
+
+        default_name = f"{os.path.splitext(os.path.basename(template))[0]}_第{slide_num}页"
+        name = simpledialog.askstring("保存为布局模式",
+                                      f"找到 {len(layouts)} 个图片位置，{len(text_layouts)} 个文本位置\n\n模式名称:",
+                                      parent=self.root, initialvalue=default_name)
+        if not name or not name.strip():
+            return
+        name = name.strip()
+        if name == "自定义":
+            messagebox.showwarning("提示", "不能使用'自定义'作为模式名称！")
+            return
+        if name in self.preset_modes and not messagebox.askyesno("确认", f"布局模式'{name}'已存在，是否覆盖？"):
+            return
+
+        description = f"{len(layouts)}张图片布局（模板第{slide_num}页）"
+        if text_layouts:
+            description += f"，{len(text_layouts)}个文本"
+        mode_data = {
+            "description": description,
+            "template_file": template,
+            "slide_index": slide_num - 1,
+            "layouts": layouts,
+            "text_layouts": text_layouts
+        }
+        if self.store_mode(name, mode_data):
+            self.refresh_mode_list()
+            self.current_mode.set(name)
+            self.on_mode_change()
+            self.info_hint.set(f"已从模板第{slide_num}页导入布局模式: {name}")
+
+    def store_mode(self, name, mode_data):
+        """保存布局模式，失败时弹出错误对话框，返回是否成功"""
+        try:
+            self.preset_modes.save_mode(name, mode_data)
+        except Exception as e:
+            messagebox.showerror("错误", f"保存模式失败: {str(e)}")
+            return False
+        return True
+
     def browse_work_path(self):
         """选择工作路径"""
         dirname = filedialog.askdirectory(title="选择工作目录")
@@ -883,20 +4837,13 @@ class PPTImageInserterGUI:
         if not mode_config:
             return
 
-        # 如果模式包含模板信息，自动设置模板路径
-        if mode_config.get("template_file"):
-            template_file = mode_config["template_file"]
-            if os.path.exists(template_file):
-                self.template_path.set(template_file)
-                # 更新模板文件名显示
-                self.template_filename.set(os.path.basename(template_file))
-            else:
-                # 尝试使用默认模板文件
-                prog_dir = os.path.dirname(os.path.abspath(__file__))
-                default_template = os.path.join(prog_dir, DEFAULT_TEMPLATE_FILE)
-                if os.path.exists(default_template):
-                    self.template_path.set(default_template)
-                    self.template_filename.set(os.path.basename(default_template))
+        # 如果模式包含模板信息，自动设置模板路径（模板不存在时尝试默认模板文件）
+        template_file = resolve_mode_template(mode_config)
+        if template_file:
+            self.template_path.set(template_file)
+            # 更新模板文件名显示
+            self.template_filename.set(os.path.basename(template_file))
+            warm_template_cache(template_file)
 
     def on_mode_change(self, event=None):
         """当布局模式改变时更新预览、设置模板并应用模式"""
@@ -959,14 +4906,9 @@ class PPTImageInserterGUI:
             messagebox.showwarning("提示", f"工作路径不存在: {work_dir}")
             return
 
-        # 获取所有图片文件
-        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
-        image_files = []
-
+        # 获取所有图片文件（按文件名排序）
         try:
-            for filename in os.listdir(work_dir):
-                if os.path.splitext(filename.lower())[1] in image_extensions:
-                    image_files.append(filename)
+            image_files = list_image_files(work_dir)
         except Exception as e:
             messagebox.showerror("错误", f"读取文件失败: {str(e)}")
             return
@@ -975,8 +4917,11 @@ class PPTImageInserterGUI:
             messagebox.showinfo("提示", f"工作路径 {work_dir} 下没有找到图片文件")
             return
 
-        # 按文件名排序
-        image_files.sort()
+        # 联系表位置在生成时自动收集图片，只给普通图片位置分配文件名
+        slots = [entry for entry in self.image_entries if not entry.is_contact_sheet()]
+        if self.image_entries and not slots:
+            self.preview_info_var.set(f"找到 {len(image_files)} 张图片，生成时将由联系表自动拼接")
+            return
 
         # 提示用户
         if not self.image_entries:
@@ -985,8 +4930,13 @@ class PPTImageInserterGUI:
             if not result:
                 return
         else:
-            expected_count = len(self.image_entries)
-            if len(image_files) > expected_count:
+            expected_count = len(slots)
+            if len(image_files) > expected_count and self.overflow_var.get():
+                # 自动分页：当前页填前几张，其余生成时按相同布局分页
+                pages = -(-len(image_files) // expected_count)
+                self.list_info_var.set(f"共 {len(image_files)} 张图片，生成时将自动分为 {pages} 页")
+                image_files = image_files[:expected_count]
+            elif len(image_files) > expected_count:
                 result = messagebox.askyesno("确认",
                     f"找到 {len(image_files)} 张图片\n当前布局需要 {expected_count} 张\n\n是否只使用前 {expected_count} 张？")
                 if not result:
@@ -1004,9 +4954,9 @@ class PPTImageInserterGUI:
 
         # 创建或填入图片条目
         for i, filename in enumerate(image_files):
-            if i < len(self.image_entries):
+            if i < len(slots):
                 # 已有序目，只填文件名
-                self.image_entries[i].image_filename.set(filename)
+                slots[i].image_filename.set(filename)
             else:
                 # 创建新条目
                 entry = ImageEntry(self.scrollable_frame, self.remove_image_entry, i, app_master=self)
@@ -1016,6 +4966,61 @@ class PPTImageInserterGUI:
         self.list_info_var.set(f"已加载 {len(image_files)} 张图片，当前共 {len(self.image_entries)} 个")
         self.preview_info_var.set(f"已填充 {len(image_files)} 张图片")
 
+    def auto_layout_images(self):
+        """按图片真实宽高比自动排版：已填文件名的图片条目按原顺序重排，否则排工作目录下所有图片"""
+        work_dir = self.work_path.get()
+        if not work_dir or not os.path.isdir(work_dir):
+            messagebox.showwarning("提示", "请先选择有效的工作路径！")
+            return
+
+        slots = [entry for entry in self.image_entries if not entry.is_contact_sheet()]
+        filenames = [entry.image_filename.get() for entry in slots if entry.image_filename.get()]
+        if not filenames:
+            try:
+                filenames = list_image_files(work_dir)
+            except Exception as e:
+                messagebox.showerror("错误", f"读取文件失败: {str(e)}")
+                return
+        if not filenames:
+            messagebox.showinfo("提示", f"工作路径 {work_dir} 下没有找到图片文件")
+            return
+
+        # 设置了模板时使用模板的实际页面尺寸
+        slide_width, slide_height = SLIDE_WIDTH_CM, SLIDE_HEIGHT_CM
+        template = self.template_path.get()
+        if template and os.path.exists(template):
+            try:
+                info = get_template_info(template)
+                slide_width, slide_height = info["slide_width"], info["slide_height"]
+            except Exception:
+                pass
+
+        layouts, errors = auto_layout_files(work_dir, filenames, slide_width, slide_height)
+        if not layouts:
+            messagebox.showwarning("提示", f"{len(filenames)} 张图片无法排入一页，请减少图片数量")
+            return
+
+        # 用排版结果替换普通图片条目（联系表和文本条目保留）
+        for entry in slots:
+            entry.frame.destroy()
+            self.image_entries.remove(entry)
+        for filename, layout in zip(filenames, layouts):
+            entry = ImageEntry(self.scrollable_frame, self.remove_image_entry, len(self.image_entries),
+                               app_master=self)
+            entry.image_filename.set(filename)
+            entry.left_var.set(str(layout["left"]))
+            entry.top_var.set(str(layout["top"]))
+            entry.width_var.set(str(layout["width"]))
+            entry.height_var.set(str(layout["height"]))
+            self.image_entries.append(entry)
+
+        self.preview_canvas.ppt_width, self.preview_canvas.ppt_height = slide_width, slide_height
+        self.preview_canvas.draw_layout(layouts)
+        rows = len({layout["top"] for layout in layouts})
+        self.list_info_var.set(f"已自动排版 {len(layouts)} 张图片（{rows} 行），可点击\"保存当前布局\"保存为模式")
+        if errors:
+            self.show_text_report("自动排版", "以下图片无法读取尺寸，按4:3排版：\n" + "\n".join(errors))
+
     def add_single_image(self):
         """添加单个图片（选择文件名）"""
         work_dir = self.work_path.get()
@@ -1101,6 +5106,7 @@ class PPTImageInserterGUI:
                         layout["width"] = float(entry.width_var.get())
                     if entry.height_var.get().strip():
                         layout["height"] = float(entry.height_var.get())
+                    layout.update(entry.sheet_config())
 
                     layouts.append(layout)
                 except Exception as e:
@@ -1136,8 +5142,7 @@ class PPTImageInserterGUI:
             # 如果设置了模板文件，询问使用哪一页
             if self.template_path.get() and os.path.exists(self.template_path.get()):
                 try:
-                    prs = Presentation(self.template_path.get())
-                    total_slides = len(prs.slides)
+                    total_slides = get_template_info(self.template_path.get())["slide_count"]
                     slide_num = simpledialog.askinteger(
                         "选择模板页",
                         f"模板文件共有 {total_slides} 页幻灯片\n\n请输入使用第几页作为模板（1-{total_slides}）：",
@@ -1154,11 +5159,9 @@ class PPTImageInserterGUI:
                 except:
                     pass
 
-            self.preset_modes[name] = mode_data
-
-            if save_custom_modes(self.preset_modes):
+            if self.store_mode(name, mode_data):
                 # 更新下拉列表
-                self.mode_combo['values'] = list(self.preset_modes.keys())
+                self.refresh_mode_list()
                 self.current_mode.set(name)
                 self.on_mode_change()
                 self.list_info_var.set(f"已保存模式'{name}'，包含 {len(layouts)} 个图片位置，{len(text_layouts)} 个文本")
@@ -1193,8 +5196,126 @@ class PPTImageInserterGUI:
         self.text_entries.clear()
         self.list_info_var.set("已清空所有条目")
 
-    def generate_ppt(self):
-        """生成PPT文件"""
+    def collect_configs(self):
+        """收集所有图片/文本条目的配置，配置无效的条目用None占位并记录错误"""
+        image_configs, text_configs = [], []
+        image_errors, text_errors = [], []
+        for i, entry in enumerate(self.image_entries):
+            try:
+                image_configs.append(entry.get_config())
+            except Exception as e:
+                image_configs.append(None)
+                image_errors.append(f"图片{i+1}: {str(e)}")
+        for i, entry in enumerate(self.text_entries):
+            try:
+                text_configs.append(entry.get_config())
+            except Exception as e:
+                text_configs.append(None)
+                text_errors.append(f"文本{i+1}: {str(e)}")
+        return image_configs, text_configs, image_errors, text_errors
+
+    def dry_run(self):
+        """干运行：解析所有图片和文本、提取全部数值，列出完整计划和全部错误（不加载pptx、不生成文件）"""
+        work_dir = self.work_path.get()
+        if not work_dir or not os.path.isdir(work_dir):
+            messagebox.showwarning("提示", "请先选择工作路径！")
+            return
+        image_configs, text_configs, image_errors, text_errors = self.collect_configs()
+        timer = PhaseTimer()
+        plan = plan_slide(image_configs, text_configs, work_dir, timer)
+        # 预览中的文本框按提取到的实际值重新测量
+        values = dict(plan["textboxes"])
+        shown = [i for i, config in enumerate(text_configs) if config is not None]
+        self.preview_canvas.draw_layout([config for config in image_configs if config is not None],
+                                        [text_configs[i] for i in shown], [values.get(i) for i in shown])
+        sections = [format_plan(plan)]
+        if self.overflow_var.get():
+            for page, page_configs in enumerate(overflow_pages(image_configs, work_dir), start=2):
+                page_plan = plan_slide(page_configs, [], work_dir, timer)
+                sections.append(f"—— 第{page}页 ——\n" + format_plan(page_plan))
+        errors = image_errors + text_errors
+        report = "\n".join(f"错误 {error}" for error in errors)
+        report = "\n".join(part for part in [report] + sections if part)
+        self.show_text_report("检查结果", f"{report}\n\n耗时: {timer.summary()}")
+        error_count = len(errors) + len(plan["errors"]) + len(plan["text_errors"])
+        self.preview_info_var.set(f"检查完成：{error_count} 个错误" if error_count else "检查完成：没有发现错误")
+
+    def show_text_report(self, title, text):
+        """在可滚动的窗口中显示多行文本（不截断）"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title(title)
+        dialog.geometry("640x420")
+        dialog.configure(bg='white')
+        dialog.transient(self.root)
+        scrollbar = tk.Scrollbar(dialog)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        text_widget = tk.Text(dialog, wrap=tk.WORD, font=("微软雅黑", 9), yscrollcommand=scrollbar.set)
+        text_widget.insert("1.0", text)
+        text_widget.configure(state=tk.DISABLED)
+        text_widget.pack(fill=tk.BOTH, expand=True)
+        scrollbar.config(command=text_widget.yview)
+
+    def generate_ppt_as(self):
+        """生成PPT到用户指定的文件"""
+        mode_name = self.current_mode.get()
+        output = filedialog.asksaveasfilename(
+            title="生成到指定文件",
+            initialdir=self.work_path.get() or None,
+            initialfile=f"{mode_name}.pptx",
+            defaultextension=".pptx",
+            filetypes=[("PowerPoint文件", "*.pptx")]
+        )
+        if output:
+            self.generate_ppt(output)
+
+    def append_ppt_to_deck(self):
+        """把新生成的一页追加到已有PPT末尾"""
+        deck = filedialog.askopenfilename(
+            title="选择要追加到的PPT",
+            initialdir=self.work_path.get() or None,
+            filetypes=[("PowerPoint文件", "*.pptx")]
+        )
+        if deck:
+            self.generate_ppt(deck, append=True)
+
+    WATCH_INTERVAL_MS = 1000
+
+    def toggle_watch(self):
+        """开启/关闭监视模式：轮询当前配置引用的图片和文本文件，变化稳定后重新生成到固定文件"""
+        if not self.watch_var.get():
+            self.watcher = None
+            self.info_hint.set("已关闭监视模式")
+            return
+        work_dir = self.work_path.get()
+        if not work_dir or not os.path.isdir(work_dir):
+            messagebox.showwarning("提示", "请先选择工作路径！")
+            self.watch_var.set(False)
+            return
+
+        def resolve_inputs():
+            image_configs, text_configs, _, _ = self.collect_configs()
+            return referenced_inputs(image_configs, text_configs, self.work_path.get())
+
+        self.watcher = InputWatcher(resolve_inputs)
+        self.watch_output = os.path.join(work_dir, f"{self.current_mode.get()}_监视.pptx")
+        self.preview_info_var.set(f"监视模式：正在监视 {len(self.watcher.state)} 个输入文件，"
+                                  f"变化后自动生成到 {self.watch_output}")
+        self.generate_ppt(self.watch_output)
+        self.root.after(self.WATCH_INTERVAL_MS, self.poll_watch)
+
+    def poll_watch(self):
+        watcher = self.watcher
+        if watcher is None or not self.watch_var.get():
+            return
+        try:
+            if watcher.poll():
+                self.generate_ppt(self.watch_output)
+        finally:
+            if self.watcher is watcher:
+                self.root.after(self.WATCH_INTERVAL_MS, self.poll_watch)
+
+    def generate_ppt(self, output=None, append=False):
+        """生成PPT文件（output为空时自动命名并保存到工作目录；append为True时追加到output）"""
         if not self.image_entries and not self.text_entries:
             self.preview_info_var.set("请至少添加一个图片或文本！")
             return
@@ -1210,524 +5331,118 @@ class PPTImageInserterGUI:
             self.preview_info_var.set("请选择工作路径！")
             return
 
-        # 自动生成输出文件名：布局模式+时-分-秒
-        mode_name = self.current_mode.get()
-        current_time = datetime.now().strftime("%H-%M-%S")
-        output_filename = f"{mode_name}_{current_time}.pptx"
+        if append and self.overflow_var.get():
+            self.preview_info_var.set("追加到已有PPT只添加一页，请先取消\"图片超出布局时自动分页\"")
+            return
 
-        # 构建输出文件路径
-        output = os.path.join(work_dir, output_filename)
+        mode_name = self.current_mode.get()
 
         try:
             self.preview_info_var.set("正在插入图片...")
             self.root.update()
 
-            # 打开模板PPT
-            if os.path.exists(template):
-                prs = Presentation(template)
-
-                # 获取当前布局模式的幻灯片索引（如果有的话）
-                mode_name = self.current_mode.get()
-                mode_config = self.preset_modes.get(mode_name, {})
-                source_slide_index = mode_config.get("slide_index", 0)
-
-                # 检查幻灯片索引是否有效
-                if source_slide_index < 0 or source_slide_index >= len(prs.slides):
-                    source_slide_index = 0
-
-                mode_text = f"基于模板: {os.path.basename(template)}，第{source_slide_index + 1}页"
-            else:
+            if not os.path.exists(template):
                 self.preview_info_var.set(f"模板文件不存在: {template}")
                 return
 
-            # 确保源幻灯片存在
-            while len(prs.slides) <= source_slide_index:
-                prs.slides.add_slide(prs.slide_layouts[0])
-
-            # 复制源幻灯片创建新幻灯片
-            source_slide = prs.slides[source_slide_index]
-            new_slide = prs.slides.add_slide(source_slide.slide_layout)
-
-            # 只复制非图片元素（跳过图片，避免重复）
-            for shape in source_slide.shapes:
-                try:
-                    # 跳过图片类型的形状
-                    if shape.shape_type == 13:  # 13 = MSO_SHAPE_TYPE.PICTURE
-                        continue
-
-                    el = shape.element
-                    newel = deepcopy(el)
-                    new_slide.shapes._spTree.append(newel)
-                except:
-                    pass
-
-            # 删除所有旧幻灯片，只保留新创建的幻灯片
-            slides_to_delete = list(range(len(prs.slides) - 1))
-            for idx in reversed(slides_to_delete):
-                rId = prs.slides._sldIdLst[idx].rId
-                prs.part.drop_rel(rId)
-                del prs.slides._sldIdLst[idx]
-
-            # 处理每个图片
-            success_count = 0
-            errors = []
-
-            for i, entry in enumerate(self.image_entries):
-                try:
-                    config = entry.get_config()
-
-                    # 检查图片文件名
-                    if not config['filename']:
-                        errors.append(f"图片{i+1}: 未选择图片文件名")
-                        continue
-
-                    # 构建完整路径（工作路径 + 文件名）
-                    image_path = os.path.join(work_dir, config['filename'])
-
-                    if not os.path.exists(image_path):
-                        errors.append(f"图片{i+1}: 找不到文件 {config['filename']}")
-                        continue
-
-                    # 转换单位
-                    left = Cm(config['left'])
-                    top = Cm(config['top'])
-                    width = Cm(config['width']) if 'width' in config else None
-                    height = Cm(config['height']) if 'height' in config else None
-
-                    # 插入图片到幻灯片
-                    if width and height:
-                        new_slide.shapes.add_picture(image_path, left, top, width=width, height=height)
-                    elif width:
-                        new_slide.shapes.add_picture(image_path, left, top, width=width)
-                    elif height:
-                        new_slide.shapes.add_picture(image_path, left, top, height=height)
-                    else:
-                        new_slide.shapes.add_picture(image_path, left, top)
-
-                    success_count += 1
-
-                except Exception as e:
-                    errors.append(f"图片{i+1}: {str(e)}")
-                    continue
-
-            # 处理每个文本（根据关键词从不同文件中提取）
-            text_success_count = 0
-            text_errors = []
-
-            for i, entry in enumerate(self.text_entries):
-                try:
-                    config = entry.get_config()
-                    keyword = config.get('keyword', '').strip()
-
-                    # 根据关键词搜索文件
-                    matched_file = None
-                    if keyword:
-                        # 搜索包含关键词的文件
-                        try:
-                            for filename in os.listdir(work_dir):
-                                if keyword in filename:
-                                    filepath = os.path.join(work_dir, filename)
-                                    if os.path.isfile(filepath):
-                                        matched_file = filename
-                                        break
-                        except Exception as e:
-                            text_errors.append(f"文本{i+1}: 搜索文件失败 - {str(e)}")
-                            continue
-                    else:
-                        # 如果没有关键词，搜索所有文本文件
-                        text_files = []
-                        text_extensions = ['.txt', '.csv', '.log', '.dat', '.json', '.xml']
-                        try:
-                            for filename in os.listdir(work_dir):
-                                # 检查标准扩展名
-                                if os.path.splitext(filename.lower())[1] in text_extensions:
-                                    text_files.append(filename)
-                                # 检查.o数字格式（如 .o2343908）
-                                elif re.search(r'\.o\d+$', filename):
-                                    text_files.append(filename)
-                        except Exception as e:
-                            text_files = []
-
-                        # 如果没有找到文本文件，也尝试读取所有文件，判断是否为文本
-                        if not text_files:
-                            try:
-                                for filename in os.listdir(work_dir):
-                                    filepath = os.path.join(work_dir, filename)
-                                    if os.path.isfile(filepath):
-                                        # 先检查是否是.o数字格式
-                                        if not re.search(r'\.o\d+$', filename):
-                                            # 尝试读取文件前100字节判断是否为文本
-                                            try:
-                                                with open(filepath, 'rb') as f:
-                                                    chunk = f.read(100)
-                                                    # 检查是否包含大量控制字符（非文本）
-                                                    text_chars = 0
-                                                    for byte in chunk:
-                                                        if byte >= 32 or byte in [9, 10, 13]:  # 空格及可打印字符、制表符、换行符
-                                                            text_chars += 1
-                                                    if text_chars / max(len(chunk), 1) > 0.7:  # 70%以上是文本字符
-                                                        text_files.append(filename)
-                                            except:
-                                                continue
-                            except Exception as e:
-                                pass
-
-                        # 按文件名排序，使用第一个文件
-                        text_files.sort()
-                        if text_files:
-                            matched_file = text_files[0]
-
-                    if not matched_file:
-                        if keyword:
-                            text_errors.append(f"文本{i+1}: 找不到包含关键词'{keyword}'的文件")
-                        else:
-                            text_errors.append(f"文本{i+1}: 找不到文本文件")
-                        continue
-
-                    text_path = os.path.join(work_dir, matched_file)
-
-                    if not os.path.exists(text_path):
-                        text_errors.append(f"文本{i+1}: 找不到文件 {matched_file}")
-                        continue
-
-                    # 尝试多种编码读取文本文件
-                    line_content = None
-                    encodings = ['utf-8', 'gbk', 'gb2312', 'utf-16', 'latin-1']
-                    for encoding in encodings:
-                        try:
-                            with open(text_path, 'r', encoding=encoding) as f:
-                                lines = f.readlines()
-
-                            # 获取指定行（行号从1开始）
-                            line_index = config['line_number'] - 1
-                            if 0 <= line_index < len(lines):
-                                line_content = lines[line_index].strip()
-                                break
-                            else:
-                                # 编码读取成功但行数不够，继续尝试其他编码
-                                continue
-                        except UnicodeDecodeError:
-                            continue
-                        except Exception:
-                            continue
-
-                    if line_content is None:
-                        # 所有编码都尝试失败，使用二进制方式读取并尝试解码
-                        try:
-                            with open(text_path, 'rb') as f:
-                                lines = f.read().decode('utf-8', errors='ignore').split('\n')
-                            line_index = config['line_number'] - 1
-                            if 0 <= line_index < len(lines):
-                                line_content = lines[line_index].strip()
-                            else:
-                                text_errors.append(f"文本{i+1}: 第{config['line_number']}行不存在")
-                                continue
-                        except Exception as e:
-                            text_errors.append(f"文本{i+1}: 读取文件失败 - {str(e)}")
-                            continue
-
-                    # 解析需要读取的列（多个列用逗号分隔）
-                    file_cols_str = config['file_cols']
-                    col_values = []
-                    try:
-                        col_numbers = [int(x.strip()) for x in file_cols_str.split(',')]
-                        for col_num in col_numbers:
-                            col_idx = col_num - 1  # 转换为索引
-                            if 0 <= col_idx < len(line_content.split()):
-                                # 按空格或制表符分割行内容
-                                words = line_content.split()
-                                if col_idx < len(words):
-                                    col_values.append(words[col_idx])
-                    except Exception as e:
-                        text_errors.append(f"文本{i+1}: 解析列号失败 - {str(e)}")
-                        continue
-
-                    # 如果没有成功获取任何列的值，整行作为默认值
-                    if not col_values:
-                        text_content = line_content
-                        # 格式化单列数据
-                        text_content = format_text(text_content)
-                    else:
-                        # 使用/分隔多个列的值，每列都格式化
-                        formatted_values = [format_text(val) for val in col_values]
-                        text_content = '/'.join(formatted_values)
-
-                    # 添加文本框（通过左、上坐标定位）
-                    left = Cm(config['left'])
-                    top = Cm(config['top'])
-
-                    # 添加文本框
-                    text_box = new_slide.shapes.add_textbox(left, top, width=Cm(5), height=Cm(1))
-
-                    # 设置文本内容
-                    text_frame = text_box.text_frame
-                    text_frame.word_wrap = False
-
-                    for paragraph in text_frame.paragraphs:
-                        paragraph.text = text_content
-                        # 文本默认左对齐
-                        paragraph.alignment = PP_ALIGN.LEFT
-
-                        for run in paragraph.runs:
-                            run.font.name = 'LiciumFont 2022'
-                            run.font.size = Pt(20)
-                            run.font.color.rgb = RGBColor(0, 0, 0)
-                            # 字体不加粗
-                            run.font.bold = False
-
-                    text_success_count += 1
-
-                except Exception as e:
-                    text_errors.append(f"文本{i+1}: {str(e)}")
-                    continue
-
-            # 保存到输出路径
-            prs.save(output)
+            # 获取当前布局模式的幻灯片索引（如果有的话）
+            mode_config = self.preset_modes.get(mode_name, {})
+            image_configs, text_configs, image_errors, text_errors = self.collect_configs()
+            extra_pages = None
+            if self.overflow_var.get() and os.path.isdir(work_dir):
+                extra_pages = overflow_pages(image_configs, work_dir)
+            timer = PhaseTimer()
+
+            # 自动生成输出文件名：布局模式+时-分-秒（重名时追加序号），生成失败时删除占位文件
+            reserved = None if output else default_output_path(work_dir, mode_name)
+            output = output or reserved
+
+            def run():
+                with timer.phase("总计"):
+                    if append:
+                        return append_to_deck(output, template, mode_config.get("slide_index", 0),
+                                              image_configs, text_configs, work_dir, timer)
+                    return generate_deck(template, mode_config.get("slide_index", 0),
+                                         image_configs, text_configs, work_dir, output, timer,
+                                         extra_pages=extra_pages)
+
+            profile_info = None
+            with discard_on_failure(reserved):
+                if self.profile_var.get():
+                    result, profile_info = run_profiled(run, output, timer)
+                else:
+                    result = run()
+            self.last_output = output
+            mode_text = f"基于模板: {os.path.basename(template)}，第{result['slide_index'] + 1}页"
+            success_count = result["image_success"]
+            text_success_count = result["text_success"]
+            all_errors = image_errors + result["errors"] + text_errors + result["text_errors"]
 
             # 显示结果
             if success_count == 0 and text_success_count == 0:
                 # 如果没有成功插入任何内容，直接显示警告
                 result_msg = f"警告: 没有成功插入任何内容\n"
-                all_errors = errors + text_errors
                 if all_errors:
                     result_msg += f"{len(all_errors)} 个错误: " + "; ".join(all_errors[:3])
                     if len(all_errors) > 3:
-                        result_msg += f"... 还有 {len(all_errors)-3} 个"
+                        result_msg += f"... 还有 {len(all_errors)-3} 个（文件 → 检查 可查看全部）"
             else:
                 # 有内容成功插入，显示成功信息
                 text_info = f"，{text_success_count}个文本" if text_success_count > 0 else ""
-                result_msg = f"（成功插入）{mode_text}\n成功插入 {success_count}/{len(self.image_entries)} 张图片{text_info}\n保存位置: {output}"
+                image_total = len(self.image_entries) + sum(len(page) for page in extra_pages or [])
+                result_msg = f"（成功插入）{mode_text}\n成功插入 {success_count}/{image_total} 张图片{text_info}\n保存位置: {output}"
+                if extra_pages:
+                    result_msg += f"（共{result['page_count']}页）"
+                if append:
+                    result_msg += f"（已追加为第{result['slide_count']}页）"
 
-                all_errors = errors + text_errors
                 if all_errors:
                     result_msg += f"\n警告: {len(all_errors)} 个错误: " + "; ".join(all_errors[:3])
                     if len(all_errors) > 3:
-                        result_msg += f"... 还有 {len(all_errors)-3} 个"
-
+                        result_msg += f"... 还有 {len(all_errors)-3} 个（文件 → 检查 可查看全部）"
+
+            result_msg += f"\n耗时: {timer.summary()}"
+            trace_format = self.trace_format_var.get()
+            if trace_format:
+                result_msg += f"\n计时数据: {timer.export(output, trace_format)}"
+            if profile_info:
+                result_msg += (f"\n性能分析: {profile_info['prof']}，"
+                               f"峰值内存 {profile_info['peak'] / 1024 / 1024:.1f} MB")
             self.preview_info_var.set(result_msg)
 
         except Exception as e:
             self.preview_info_var.set(f"操作失败: {str(e)}")
 
     def fill_all_text(self):
-        """填充所有文本到模板PPT（不生成新PPT，直接在模板中填充文本）"""
-        if not self.text_entries:
-            messagebox.showinfo("提示", "没有文本需要填充")
-            return
-
-        template = self.template_path.get()
-        work_dir = self.work_path.get()
-
-        if not template:
-            messagebox.showwarning("提示", "请先选择模板PPT！")
-            return
-
-        if not work_dir:
-            messagebox.showwarning("提示", "请先选择工作路径！")
+        """刷新已生成PPT中的所有文本数值：按文本框记录的来源重新提取，只改写这些文本（图片等原样保留）"""
+        last = self.last_output if self.last_output and os.path.exists(self.last_output) else None
+        deck = filedialog.askopenfilename(
+            title="选择要刷新数值的PPT",
+            initialdir=os.path.dirname(last) if last else self.work_path.get() or None,
+            initialfile=os.path.basename(last) if last else None,
+            filetypes=[("PowerPoint文件", "*.pptx")]
+        )
+        if not deck:
             return
 
         try:
-            self.preview_info_var.set("正在填充文本...")
+            self.preview_info_var.set("正在刷新数值...")
             self.root.update()
-
-            # 打开模板PPT
-            if os.path.exists(template):
-                prs = Presentation(template)
-
-                # 获取当前布局模式的幻灯片索引
-                mode_name = self.current_mode.get()
-                mode_config = self.preset_modes.get(mode_name, {})
-                slide_index = mode_config.get("slide_index", 0)
-
-                # 检查幻灯片索引是否有效
-                if slide_index < 0 or slide_index >= len(prs.slides):
-                    messagebox.showwarning("提示", f"幻灯片索引超出范围（共{len(prs.slides)}页）")
-                    return
-
-                slide = prs.slides[slide_index]
-            else:
-                messagebox.showerror("错误", f"模板文件不存在: {template}")
-                return
-
-            success_count = 0
-            errors = []
-
-            for i, entry in enumerate(self.text_entries):
-                try:
-                    config = entry.get_config()
-                    keyword = config.get('keyword', '').strip()
-
-                    # 根据关键词搜索文件
-                    matched_file = None
-                    if keyword:
-                        # 搜索包含关键词的文件
-                        try:
-                            for filename in os.listdir(work_dir):
-                                if keyword in filename:
-                                    filepath = os.path.join(work_dir, filename)
-                                    if os.path.isfile(filepath):
-                                        matched_file = filename
-                                        break
-                        except Exception as e:
-                            errors.append(f"文本{i+1}: 搜索文件失败 - {str(e)}")
-                            continue
-                    else:
-                        # 如果没有关键词，搜索所有文本文件
-                        text_files = []
-                        text_extensions = ['.txt', '.csv', '.log', '.dat', '.json', '.xml']
-                        try:
-                            for filename in os.listdir(work_dir):
-                                # 检查标准扩展名
-                                if os.path.splitext(filename.lower())[1] in text_extensions:
-                                    text_files.append(filename)
-                                # 检查.o数字格式（如 .o2343908）
-                                elif re.search(r'\.o\d+$', filename):
-                                    text_files.append(filename)
-                        except Exception as e:
-                            text_files = []
-
-                        # 如果没有找到文本文件，也尝试读取所有文件，判断是否为文本
-                        if not text_files:
-                            try:
-                                for filename in os.listdir(work_dir):
-                                    filepath = os.path.join(work_dir, filename)
-                                    if os.path.isfile(filepath):
-                                        # 先检查是否是.o数字格式
-                                        if not re.search(r'\.o\d+$', filename):
-                                            # 尝试读取文件前100字节判断是否为文本
-                                            try:
-                                                with open(filepath, 'rb') as f:
-                                                    chunk = f.read(100)
-                                                    # 检查是否包含大量控制字符（非文本）
-                                                    text_chars = 0
-                                                    for byte in chunk:
-                                                        if byte >= 32 or byte in [9, 10, 13]:  # 空格及可打印字符、制表符、换行符
-                                                            text_chars += 1
-                                                    if text_chars / max(len(chunk), 1) > 0.7:  # 70%以上是文本字符
-                                                        text_files.append(filename)
-                                            except:
-                                                continue
-                            except Exception as e:
-                                pass
-
-                        # 按文件名排序，使用第一个文件
-                        text_files.sort()
-                        if text_files:
-                            matched_file = text_files[0]
-
-                    if not matched_file:
-                        if keyword:
-                            errors.append(f"文本{i+1}: 找不到包含关键词'{keyword}'的文件")
-                        else:
-                            errors.append(f"文本{i+1}: 找不到文本文件")
-                        continue
-
-                    text_path = os.path.join(work_dir, matched_file)
-
-                    if not os.path.exists(text_path):
-                        errors.append(f"文本{i+1}: 找不到文件 {matched_file}")
-                        continue
-
-                    # 尝试多种编码读取文本文件
-                    line_content = None
-                    encodings = ['utf-8', 'gbk', 'gb2312', 'utf-16', 'latin-1']
-                    for encoding in encodings:
-                        try:
-                            with open(text_path, 'r', encoding=encoding) as f:
-                                lines = f.readlines()
-
-                            # 获取指定行（行号从1开始）
-                            line_index = config['line_number'] - 1
-                            if 0 <= line_index < len(lines):
-                                line_content = lines[line_index].strip()
-                                break
-                            else:
-                                # 编码读取成功但行数不够，继续尝试其他编码
-                                continue
-                        except UnicodeDecodeError:
-                            continue
-                        except Exception:
-                            continue
-
-                    if line_content is None:
-                        # 所有编码都尝试失败，使用二进制方式读取并尝试解码
-                        try:
-                            with open(text_path, 'rb') as f:
-                                lines = f.read().decode('utf-8', errors='ignore').split('\n')
-                            line_index = config['line_number'] - 1
-                            if 0 <= line_index < len(lines):
-                                line_content = lines[line_index].strip()
-                            else:
-                                errors.append(f"文本{i+1}: 第{config['line_number']}行不存在")
-                                continue
-                        except Exception as e:
-                            errors.append(f"文本{i+1}: 读取文件失败 - {str(e)}")
-                            continue
-
-                    # 解析需要读取的列（多个列用逗号分隔）
-                    file_cols_str = config['file_cols']
-                    col_values = []
-                    try:
-                        col_numbers = [int(x.strip()) for x in file_cols_str.split(',')]
-                        for col_num in col_numbers:
-                            col_idx = col_num - 1  # 转换为索引
-                            if 0 <= col_idx < len(line_content.split()):
-                                # 按空格或制表符分割行内容
-                                words = line_content.split()
-                                if col_idx < len(words):
-                                    col_values.append(words[col_idx])
-                    except Exception as e:
-                        errors.append(f"文本{i+1}: 解析列号失败 - {str(e)}")
-                        continue
-
-                    # 如果没有成功获取任何列的值，整行作为默认值
-                    if not col_values:
-                        text_content = line_content
-                        # 格式化单列数据
-                        text_content = format_text(text_content)
-                    else:
-                        # 使用/分隔多个列的值，每列都格式化
-                        formatted_values = [format_text(val) for val in col_values]
-                        text_content = '/'.join(formatted_values)
-
-                    # 添加文本框（通过左、上坐标定位）
-                    left = Cm(config['left'])
-                    top = Cm(config['top'])
-
-                    # 添加文本框
-                    text_box = slide.shapes.add_textbox(left, top, width=Cm(5), height=Cm(1))
-
-                    # 设置文本内容
-                    text_frame = text_box.text_frame
-                    text_frame.word_wrap = False
-
-                    for paragraph in text_frame.paragraphs:
-                        paragraph.text = text_content
-                        # 文本默认左对齐
-                        paragraph.alignment = PP_ALIGN.LEFT
-
-                        for run in paragraph.runs:
-                            run.font.name = 'LiciumFont 2022'
-                            run.font.size = Pt(20)
-                            run.font.color.rgb = RGBColor(0, 0, 0)
-                            # 字体不加粗
-                            run.font.bold = False
-
-                    success_count += 1
-
-                except Exception as e:
-                    errors.append(f"文本{i+1}: {str(e)}")
-                    continue
-
-            # 不保存到输出路径（只需在模板中填充文本即可）
-            # prs.save(output)
+            timer = PhaseTimer()
+            with timer.phase("总计"):
+                result = refresh_deck(deck, timer=timer)
+            errors = result["errors"]
 
             # 显示结果
-            result_msg = f"成功填充 {success_count}/{len(self.text_entries)} 个文本"
+            if not result["updated"] and not result["unchanged"] and not errors:
+                result_msg = "没有找到本工具生成的文本框（早期版本生成的PPT没有来源标记）"
+            else:
+                result_msg = f"已刷新 {result['updated']} 个数值（{result['unchanged']} 个未变化）\n保存位置: {deck}"
             if errors:
                 result_msg += f"\n警告: {len(errors)} 个错误: " + "; ".join(errors[:3])
                 if len(errors) > 3:
                     result_msg += f"... 还有 {len(errors)-3} 个"
+            result_msg += f"\n耗时: {timer.summary()}"
 
             self.preview_info_var.set(result_msg)
 
@@ -1736,9 +5451,333 @@ class PPTImageInserterGUI:
             messagebox.showerror("错误", f"操作失败: {str(e)}")
 
 
-def main():
+def format_startup_report():
+    """把 STARTUP_TIMES 格式化为一行冷启动耗时分解"""
+    order = ["模块导入", "创建窗口", "构建界面", "首次绘制", "加载布局模式", "导入pptx/Pillow"]
+    parts = [f"{name} {STARTUP_TIMES[name] * 1000:.0f}ms" for name in order if name in STARTUP_TIMES]
+    return "启动耗时: " + "，".join(parts)
+
+
+def parse_args(argv=None):
+    """命令行参数：不带参数时启动图形界面，--headless 时无界面生成"""
+    import argparse
+    parser = argparse.ArgumentParser(description="PPT自动化工具")
+    parser.add_argument("--headless", action="store_true", help="无界面生成（不启动图形界面）")
+    parser.add_argument("--mode", help="布局模式名称")
+    parser.add_argument("--work-dir", help="工作目录（图片和数据文件所在目录）")
+    parser.add_argument("--template", help="模板PPT（默认使用模式关联的模板）")
+    parser.add_argument("--output", help="输出文件路径；'-' 表示写到标准输出（默认自动命名保存到工作目录）")
+    parser.add_argument("--append-to", metavar="DECK", help="把新页追加到已有PPT末尾（而不是生成新文件）")
+    parser.add_argument("--batch", nargs="+", metavar="DIR",
+                        help="批量生成：对多个工作目录（支持通配符）各生成一份，输入未变化的目录自动跳过")
+    parser.add_argument("--deck", metavar="OUTPUT",
+                        help="与 --batch 一起使用：每个目录生成一页，合并为一个多页PPT")
+    parser.add_argument("--workers", type=int,
+                        help="合并多页PPT时并行生成的进程数（默认CPU核数）；任务服务的工作线程数（默认2）")
+    parser.add_argument("--serve", action="store_true", help="运行本地任务服务（HTTP，仅监听127.0.0.1）")
+    parser.add_argument("--submit", action="store_true",
+                        help="把 --mode/--work-dir/--output 作为任务提交给本地任务服务")
+    parser.add_argument("--wait", action="store_true", help="与 --submit 一起使用：等待任务完成")
+    parser.add_argument("--port", type=int, default=JOB_SERVER_PORT, help="本地任务服务端口")
+    parser.add_argument("--memory-budget", type=int, metavar="MB",
+                        default=DEFAULT_MEDIA_MEMORY_BUDGET // (1024 * 1024),
+                        help="合并多页PPT时在内存中保留的图片总量（MB），超出部分留在磁盘上、保存时流式写入")
+    parser.add_argument("--auto-layout", metavar="NAME",
+                        help="按 --work-dir 下图片的真实宽高比自动排版，保存为名为NAME的布局模式（可配合 --template 使用其页面尺寸）")
+    parser.add_argument("--refresh", metavar="DECK",
+                        help="刷新已生成PPT中的数值：按文本框记录的来源重新提取并只改写这些文本"
+                             "（--work-dir 可改用其他工作目录，--output 可另存）")
+    parser.add_argument("--manifest", help="批量生成的构建清单路径（默认保存在配置目录）")
+    parser.add_argument("--force", action="store_true", help="批量生成时忽略清单，全部重新生成")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只检查：解析所有图片和文本并列出计划和全部错误，不加载pptx、不生成文件")
+    parser.add_argument("--overflow", action="store_true", help="图片多于布局位置时按相同布局自动分页")
+    parser.add_argument("--watch", action="store_true", help="监视模式：引用的输入文件变化时自动重新生成")
+    parser.add_argument("--interval", type=float, default=1.0, help="监视模式的轮询间隔（秒）")
+    parser.add_argument("--debounce", type=float, default=1.0, help="监视模式下输入稳定多久后才重新生成（秒）")
+    parser.add_argument("--fast-save", action="store_true",
+                        help="快速保存：已压缩的图片不再压缩，XML部件多线程压缩（默认使用python-pptx自带的保存）")
+    parser.add_argument("--compress-level", type=int, default=DEFAULT_SAVE_OPTIONS["compresslevel"],
+                        choices=range(10), metavar="0-9", help="快速保存和刷新数值时XML部件的压缩级别")
+    parser.add_argument("--save-workers", type=int, help="快速保存时的压缩线程数（默认CPU核数）")
+    return parser.parse_args(argv)
+
+
+def save_options_from_args(args):
+    return {"fast": args.fast_save, "compresslevel": args.compress_level,
+            "workers": args.save_workers}
+
+
+def log(message):
+    """无界面模式的提示信息写到标准错误（标准输出可能用于输出PPT数据）"""
+    if sys.stderr:
+        print(message, file=sys.stderr)
+
+
+def run_headless(args):
+    """无界面生成一页PPT，返回进程退出码"""
+    if not args.mode or not (args.work_dir or args.batch):
+        log("无界面模式需要 --mode 和 --work-dir（或 --batch）")
+        return 2
+    if args.overflow and args.append_to:
+        log("--overflow 不能与 --append-to 同时使用（追加只添加一页）")
+        return 2
+    modes = load_custom_modes()
+    mode_config = modes.get(args.mode)
+    if mode_config is None:
+        log(f"找不到布局模式: {args.mode}")
+        return 2
+    # 干运行只检查输入，不需要模板
+    if args.dry_run:
+        return dry_run_headless(args, mode_config)
+    template = args.template or resolve_mode_template(mode_config)
+    if not template or not os.path.exists(template):
+        log(f"模板文件不存在: {template}")
+        return 2
+    if args.batch:
+        return batch_headless(args, mode_config, template)
+    if args.watch:
+        return watch_headless(args, mode_config, template)
+
+    image_configs, text_configs = configs_from_mode(mode_config, args.work_dir)
+    slide_index = mode_config.get("slide_index", 0)
+    extra_pages = overflow_pages(image_configs, args.work_dir) if args.overflow else None
+    if args.append_to:
+        output = args.append_to
+        result = append_to_deck(output, template, slide_index, image_configs, text_configs, args.work_dir,
+                                save_options=save_options_from_args(args))
+    elif args.output == "-":
+        data, result = render_deck_bytes(template, slide_index, image_configs, text_configs, args.work_dir,
+                                         save_options=save_options_from_args(args), extra_pages=extra_pages)
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+        output = "<stdout>"
+    else:
+        reserved = None if args.output else default_output_path(args.work_dir, args.mode)
+        output = args.output or reserved
+        with discard_on_failure(reserved):
+            result = generate_deck(template, slide_index, image_configs, text_configs, args.work_dir, output,
+                                   save_options=save_options_from_args(args), extra_pages=extra_pages)
+
+    for error in result["errors"] + result["text_errors"]:
+        log(f"警告: {error}")
+    image_total = len(image_configs) + sum(len(page) for page in extra_pages or [])
+    log(f"成功插入 {result['image_success']}/{image_total} 张图片，"
+        f"{result['text_success']}/{len(text_configs)} 个文本，保存位置: {output}"
+        + (f"（共{result['page_count']}页）" if extra_pages else ""))
+    log(f"耗时: {result['timer'].summary()}")
+    return 0 if result["image_success"] or result["text_success"] else 1
+
+
+def auto_layout_headless(args):
+    """按工作目录下所有图片的宽高比自动排版，保存为布局模式"""
+    if not args.work_dir or not os.path.isdir(args.work_dir):
+        log("自动排版需要有效的 --work-dir")
+        return 2
+    filenames = list_image_files(args.work_dir)
+    if not filenames:
+        log(f"工作目录下没有图片: {args.work_dir}")
+        return 1
+    slide_width, slide_height = SLIDE_WIDTH_CM, SLIDE_HEIGHT_CM
+    template = os.path.abspath(args.template) if args.template else None
+    if template:
+        if not os.path.exists(template):
+            log(f"模板文件不存在: {template}")
+            return 2
+        info = get_template_info(template)
+        slide_width, slide_height = info["slide_width"], info["slide_height"]
+
+    layouts, errors = auto_layout_files(args.work_dir, filenames, slide_width, slide_height)
+    for error in errors:
+        log(f"警告: 无法读取尺寸，按4:3排版: {error}")
+    if not layouts:
+        log(f"{len(filenames)} 张图片无法排入一页")
+        return 1
+    mode = {
+        "description": f"{len(layouts)}张图片自动排版",
+        "template_file": template,
+        "slide_index": 0,
+        "layouts": layouts,
+        "text_layouts": [],
+    }
+    try:
+        load_custom_modes().save_mode(args.auto_layout, mode)
+    except Exception as e:
+        log(f"保存布局模式失败: {args.auto_layout}: {str(e)}")
+        return 1
+    rows = len({layout["top"] for layout in layouts})
+    log(f"已保存布局模式 '{args.auto_layout}'：{len(layouts)} 张图片，{rows} 行")
+    return 0
+
+
+def refresh_headless(args):
+    """无界面刷新数值：重新提取已生成PPT中带来源标记的文本框的数值，其他内容原样保留"""
+    if not os.path.exists(args.refresh):
+        log(f"PPT文件不存在: {args.refresh}")
+        return 2
+    if args.work_dir and not os.path.isdir(args.work_dir):
+        log(f"工作目录不存在: {args.work_dir}")
+        return 2
+    if args.output == "-":
+        log("刷新数值不支持输出到标准输出")
+        return 2
+    timer = PhaseTimer()
+    try:
+        with timer.phase("总计"):
+            result = refresh_deck(args.refresh, args.work_dir, args.output, timer, args.compress_level)
+    except Exception as e:
+        log(f"刷新失败: {str(e)}")
+        return 1
+    for error in result["errors"]:
+        log(f"警告: {error}")
+    if not result["updated"] and not result["unchanged"] and not result["errors"]:
+        log(f"没有找到本工具生成的文本框（早期版本生成的PPT没有来源标记）: {args.refresh}")
+        return 1
+    log(f"已刷新 {result['updated']} 个数值（{result['unchanged']} 个未变化）: {args.output or args.refresh}")
+    log(f"耗时: {timer.summary()}")
+    return 1 if result["errors"] else 0
+
+
+def dry_run_headless(args, mode_config):
+    """无界面干运行：单个目录列出完整计划，--batch 时每个目录一行结论；有错误时退出码为1"""
+    work_dirs = expand_work_dirs(args.batch) if args.batch else [args.work_dir]
+    timer = PhaseTimer()
+    error_dirs = 0
+    for work_dir in work_dirs:
+        image_configs, text_configs = configs_from_mode(mode_config, work_dir)
+        plans = [plan_slide(image_configs, text_configs, work_dir, timer)]
+        if args.overflow:
+            plans += [plan_slide(page_configs, [], work_dir, timer)
+                      for page_configs in overflow_pages(image_configs, work_dir)]
+        errors = [error for plan in plans for error in plan["errors"] + plan["text_errors"]]
+        error_dirs += bool(errors)
+        if args.batch:
+            log(f"{work_dir}: " + (f"{len(errors)} 个错误: " + "; ".join(errors) if errors else "OK"))
+        else:
+            for page, plan in enumerate(plans, start=1):
+                if len(plans) > 1:
+                    log(f"—— 第{page}页 ——")
+                log(format_plan(plan))
+    log(f"检查 {len(work_dirs)} 个目录，{error_dirs} 个有错误，耗时: {timer.summary()}")
+    return 1 if error_dirs else 0
+
+
+def expand_work_dirs(patterns):
+    """展开 --batch 的目录参数（Windows命令行不会展开通配符，这里统一处理）"""
+    import glob
+    work_dirs = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if re.search(r'[*?[]', pattern) else [pattern]
+        work_dirs.extend(path for path in matches if os.path.isdir(path))
+    return work_dirs
+
+
+def batch_headless(args, mode_config, template):
+    """无界面批量生成，--output 此时表示每个目录内的输出文件名"""
+    work_dirs = expand_work_dirs(args.batch)
+    if not work_dirs:
+        log("没有找到可用的工作目录")
+        return 2
+    if args.deck:
+        return deck_headless(args, mode_config, template, work_dirs)
+    start = time.perf_counter()
+    built, skipped, failed = run_batch(work_dirs, args.mode, mode_config, template,
+                                       output_name=args.output and os.path.basename(args.output),
+                                       manifest_path=args.manifest, force=args.force,
+                                       save_options=save_options_from_args(args), report=log)
+    log(f"共 {len(work_dirs)} 个目录：重新生成 {built}，未变化跳过 {skipped}，失败 {failed}，"
+        f"耗时 {time.perf_counter() - start:.1f}s")
+    return 1 if failed else 0
+
+
+def deck_headless(args, mode_config, template, work_dirs):
+    """无界面生成多页PPT：每个工作目录一页"""
+    jobs = [(work_dir,) + configs_from_mode(mode_config, work_dir) for work_dir in work_dirs]
+    result = build_multi_slide_deck(template, mode_config.get("slide_index", 0), jobs, args.deck,
+                                    workers=args.workers, save_options=save_options_from_args(args),
+                                    memory_budget=args.memory_budget * 1024 * 1024)
+    failed = 0
+    for slide in result["slides"]:
+        for error in slide["errors"] + slide["text_errors"]:
+            log(f"警告 {slide['work_dir']}: {error}")
+        if not slide["image_success"] and not slide["text_success"]:
+            failed += 1
+    log(f"共 {result['slide_count']} 页，保存位置: {args.deck}")
+    log(f"耗时: {result['timer'].summary()}")
+    return 1 if failed else 0
+
+
+def watch_headless(args, mode_config, template):
+    """无界面监视模式：每次引用的输入变化并稳定后重新生成到同一个输出文件（Ctrl+C退出）"""
+    output = args.output or os.path.join(args.work_dir, f"{args.mode}_监视.pptx")
+
+    def resolve_inputs():
+        image_configs, text_configs = configs_from_mode(mode_config, args.work_dir)
+        return referenced_inputs(image_configs, text_configs, args.work_dir)
+
+    def regenerate():
+        image_configs, text_configs = configs_from_mode(mode_config, args.work_dir)
+        try:
+            result = generate_deck(template, mode_config.get("slide_index", 0), image_configs, text_configs,
+                                   args.work_dir, output, save_options=save_options_from_args(args))
+        except Exception as e:
+            log(f"{datetime.now():%H:%M:%S} 生成失败: {e}")
+            return
+        for error in result["errors"] + result["text_errors"]:
+            log(f"警告: {error}")
+        log(f"{datetime.now():%H:%M:%S} 已重新生成 {output}（{result['timer'].summary()}）")
+
+    watcher = InputWatcher(resolve_inputs, debounce=args.debounce)
+    log(f"监视 {len(watcher.state)} 个输入文件，按 Ctrl+C 退出")
+    regenerate()
+    try:
+        while True:
+            time.sleep(args.interval)
+            if watcher.poll():
+                regenerate()
+    except KeyboardInterrupt:
+        return 0
+
+
+def submit_headless(args):
+    """提交任务到本地任务服务，--wait 时等待完成；返回进程退出码"""
+    request = {"work_dir": os.path.abspath(args.work_dir or "."), "mode": args.mode,
+               "output": args.output and os.path.abspath(args.output), "template": args.template,
+               "overflow": args.overflow}
+    try:
+        job = submit_job(request, args.port, wait=args.wait)
+    except (OSError, ValueError) as e:
+        log(f"提交失败: {e}")
+        return 2
+    if job["status"] == "failed":
+        log(f"任务 {job['id']} 失败: {job.get('error')}")
+        return 1
+    if job["status"] == "done":
+        for error in job["errors"]:
+            log(f"警告: {error}")
+        log(f"任务 {job['id']} 完成，保存位置: {job['output']}")
+    else:
+        log(f"已提交任务 {job['id']}，排队中（队列长度 {job.get('queue_depth')}）")
+    return 0
+
+
+def main(argv=None):
     """主函数"""
+    args = parse_args(argv)
+    if args.serve:
+        sys.exit(serve_jobs(args.port, args.workers or 2, report=log))
+    if args.submit:
+        sys.exit(submit_headless(args))
+    if args.auto_layout:
+        sys.exit(auto_layout_headless(args))
+    if args.refresh:
+        sys.exit(refresh_headless(args))
+    if args.headless:
+        sys.exit(run_headless(args))
+
+    start = record_startup_phase("模块导入", _STARTUP_T0)
     root = tk.Tk()
+    record_startup_phase("创建窗口", start)
 
     # 设置样式
     style = ttk.Style()
@@ -1749,4 +5788,6 @@ def main():
 
 
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()  # 打包成exe后多进程生成多页PPT需要
     main()
@@ -0,0 +1,50 @@
+import threading
+
+import ppt_image_inserter_gui as app
+
+
+def solve_with_timeout(sizes, timeout=30):
+    """在线程中求解，超时视为死循环"""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(app.solve_auto_layout(sizes)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "solve_auto_layout 没有结束"
+    return result[0]
+
+
+def assert_inside_slide(layouts):
+    margin = app.AUTO_LAYOUT_MARGIN_CM
+    for layout in layouts:
+        assert layout["left"] >= margin - 0.01
+        assert layout["top"] >= margin - 0.01
+        assert layout["left"] + layout["width"] <= app.SLIDE_WIDTH_CM - margin + 0.01
+        assert layout["top"] + layout["height"] <= app.SLIDE_HEIGHT_CM - margin + 0.01
+
+
+def test_many_tall_images_terminate():
+    # 间距限制了每行最多放几张，"全部一行"无法达到
+    layouts = solve_with_timeout([(10, 5000)] * 200)
+    assert len(layouts) == 200
+    assert_inside_slide(layouts)
+
+
+def test_more_images_than_fit_in_one_row():
+    layouts = solve_with_timeout([(4, 3)] * 1000)
+    assert len(layouts) == 1000
+    assert_inside_slide(layouts)
+
+
+def test_keeps_order_and_aspect_ratio():
+    sizes = [(1600, 900), (300, 400), (500, 500), (1024, 768)]
+    layouts = solve_with_timeout(sizes)
+    assert len(layouts) == len(sizes)
+    assert_inside_slide(layouts)
+    for (width, height), layout in zip(sizes, layouts):
+        assert abs(layout["width"] / layout["height"] - width / height) < 0.05
+    positions = [(layout["top"], layout["left"]) for layout in layouts]
+    assert positions == sorted(positions)
+
+
+def test_empty():
+    assert app.solve_auto_layout([]) == []
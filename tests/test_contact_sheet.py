@@ -0,0 +1,22 @@
+import os
+
+import ppt_image_inserter_gui as app
+
+
+def test_bad_images_do_not_drop_the_sheet(tmp_path):
+    app.load_heavy_modules()
+    for i in range(3):
+        app.Image.new('RGBA', (40, 30), (255, 0, 0, 0 if i == 0 else 255)).save(tmp_path / f"a{i}.png")
+    (tmp_path / "bad.png").write_bytes(b"not an image")
+    (tmp_path / "trunc.png").write_bytes((tmp_path / "a1.png").read_bytes()[:40])
+    config = {"left": 1, "top": 1, "width": 10, "height": 8, "filename": "", "sheet_columns": 3}
+
+    plan = app.plan_slide([config], [], str(tmp_path))
+    assert plan["errors"] == ["图片1: 联系表中的 bad.png 无法识别的图片格式，已跳过"]
+    assert [os.path.basename(path) for path in plan["sheets"][0]["paths"]] == \
+        ["a0.png", "a1.png", "a2.png", "trunc.png"]
+
+    stream, failed = app.compose_contact_sheet(plan["sheets"][0]["paths"], 10, 8, 3)
+    assert [path.endswith("trunc.png") for path in failed] == [True]
+    sheet = app.Image.open(stream)
+    assert sheet.getpixel((sheet.width // 6, sheet.height // 4)) == (255, 255, 255)  # 透明图片贴在白底上
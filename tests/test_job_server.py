@@ -0,0 +1,35 @@
+import socket
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import ppt_image_inserter_gui as app
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), None)
+    port = httpd.server_address[1]
+    httpd.RequestHandlerClass = app.make_job_handler(app.JobServer(1), port, "token")
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def post(port, content_length):
+    request = (f"POST /jobs HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nAuthorization: Bearer token\r\n"
+               f"Content-Type: application/json\r\nContent-Length: {content_length}\r\n\r\n")
+    with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+        sock.sendall(request.encode())
+        return sock.recv(4096).split(b"\r\n", 1)[0]
+
+
+def test_negative_content_length_is_rejected_without_reading(server):
+    assert b" 400 " in post(server, -1)
+
+
+def test_oversized_request_is_rejected(server):
+    assert b" 413 " in post(server, app.JOB_MAX_REQUEST_BYTES + 1)
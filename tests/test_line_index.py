@@ -0,0 +1,86 @@
+"""行索引与 bytes.split(b'\\n') 对比，块大小设得很小以覆盖块边界和检查点"""
+import bz2
+import gzip
+import lzma
+import random
+
+import pytest
+
+import ppt_image_inserter_gui as app
+
+
+def random_lines(rng, count):
+    pieces = [b"", b"a", b"12.5 3", "中文".encode("utf-8"), b"x" * 17, b"\r"]
+    return b"\n".join(rng.choice(pieces) + rng.choice(pieces) for _ in range(count)) + rng.choice([b"", b"\n"])
+
+
+def expected_line(data, index):
+    lines = data.split(b"\n")
+    return lines[index] if index < len(lines) else None
+
+
+@pytest.fixture
+def tiny_chunks(monkeypatch):
+    monkeypatch.setattr(app.LineIndex, "CHUNK_SIZE", 3)
+    monkeypatch.setattr(app.LineIndex, "TAIL_PROBE", 2)
+    monkeypatch.setattr(app.CompressedLineIndex, "CHUNK_SIZE", 5)
+    monkeypatch.setattr(app.CompressedLineIndex, "CHECKPOINT_INTERVAL", 16)
+    monkeypatch.setattr(app.CompressedLineIndex, "LINE_CACHE_SIZE", 4)
+
+
+def test_line_index_matches_split(tmp_path, tiny_chunks):
+    rng = random.Random(0)
+    path = tmp_path / "run.log"
+    for _ in range(20):
+        data = random_lines(rng, rng.randint(0, 40))
+        path.write_bytes(data)
+        index = app.LineIndex(str(path))
+        order = list(range(data.count(b"\n") + 3))
+        rng.shuffle(order)
+        for line in order:
+            assert index.get_line(line) == expected_line(data, line), line
+
+
+def test_line_index_follows_appends_and_rewrites(tmp_path, tiny_chunks):
+    rng = random.Random(1)
+    path = tmp_path / "run.log"
+    data = random_lines(rng, 10)
+    path.write_bytes(data)
+    index = app.LineIndex(str(path))
+    assert index.get_line(5) == expected_line(data, 5)
+    for _ in range(10):
+        extra = random_lines(rng, rng.randint(0, 5))
+        with open(path, "ab") as f:
+            f.write(extra)
+        data += extra
+        for line in (0, data.count(b"\n") // 2, data.count(b"\n"), data.count(b"\n") + 1):
+            assert index.get_line(line) == expected_line(data, line), line
+    data = random_lines(rng, 8)  # 改写为更短的内容
+    path.write_bytes(data)
+    for line in range(data.count(b"\n") + 2):
+        assert index.get_line(line) == expected_line(data, line), line
+
+
+@pytest.mark.parametrize("kind, compress", [
+    ("gzip", gzip.compress),
+    ("bz2", bz2.compress),
+    ("xz", lzma.compress),
+    ("gzip", lambda data: gzip.compress(data[:len(data) // 2]) + gzip.compress(data[len(data) // 2:])),
+])
+def test_compressed_line_index_matches_split(tmp_path, tiny_chunks, kind, compress):
+    rng = random.Random(kind)
+    path = tmp_path / "run.log.gz"
+    for _ in range(10):
+        data = random_lines(rng, rng.randint(0, 60))
+        path.write_bytes(compress(data))
+        index = app.CompressedLineIndex(str(path), kind)
+        order = list(range(data.count(b"\n") + 3)) * 2
+        rng.shuffle(order)
+        for line in order:
+            assert index.get_line(line) == expected_line(data, line), line
+
+
+def test_read_text_line_handles_cr_only_files(tmp_path):
+    path = tmp_path / "mac.log"
+    path.write_bytes(b"a b\r1 2\r3 4\r")
+    assert [app.read_text_line(str(path), n) for n in (1, 2, 3)] == ["a b", "1 2", "3 4"]
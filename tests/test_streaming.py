@@ -0,0 +1,157 @@
+"""流式JSON/XML提取与参考解析器（json、ElementTree）对比，块大小设得很小以覆盖块边界"""
+import io
+import json
+import random
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import ppt_image_inserter_gui as app
+
+STRINGS = ["", "a", "中文", "quote \" inside", "back\\slash", "brackets [{}] and , :", "tab\tnew\nline",
+           "é中\U0001F600", "\\u0041"]
+
+
+def random_json(rng, depth=0):
+    kind = rng.choice(["obj", "arr"] if depth == 0 else ["obj", "arr", "str", "num", "lit", "num", "str"])
+    if depth > 3 and kind in ("obj", "arr"):
+        kind = "num"
+    if kind == "obj":
+        return {rng.choice(STRINGS) + str(i): random_json(rng, depth + 1) for i in range(rng.randint(0, 4))}
+    if kind == "arr":
+        return [random_json(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    if kind == "str":
+        return rng.choice(STRINGS)
+    if kind == "num":
+        return rng.choice([0, -1, 12345678901234, 3.25, -0.5e-7, 1e21])
+    return rng.choice([True, False, None])
+
+
+def json_paths(value, prefix=()):
+    """所有路径及其值（容器也列出）"""
+    yield prefix, value
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from json_paths(item, prefix + (key,))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from json_paths(item, prefix + (index,))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64])
+def test_stream_json_values_matches_json(monkeypatch, chunk_size):
+    monkeypatch.setattr(app, "STREAM_CHUNK_SIZE", chunk_size)
+    rng = random.Random(chunk_size)
+    for _ in range(40):
+        document = random_json(rng)
+        text = json.dumps(document, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1]))
+        expected = dict(json_paths(document))
+        missing = [("no such key",), (99,)]
+        found = app.stream_json_values(io.StringIO(text), list(expected) + missing)
+        for path, value in expected.items():
+            if isinstance(value, (dict, list)):
+                assert found[path] is None, path
+            elif isinstance(value, str):
+                assert found[path] == value, path
+            else:
+                assert json.loads(found[path]) == value, path
+        assert not set(found) & set(missing)
+
+
+def test_stream_json_values_stops_reading_after_last_path(monkeypatch):
+    monkeypatch.setattr(app, "STREAM_CHUNK_SIZE", 4)
+    text = '{"a": 1, "b": [' + ", ".join(["2"] * 1000) + "]}"
+    f = io.StringIO(text)
+    assert app.stream_json_values(f, [("a",)]) == {("a",): "1"}
+    assert f.tell() < 100
+
+
+def test_stream_json_values_rejects_truncated_input(monkeypatch):
+    monkeypatch.setattr(app, "STREAM_CHUNK_SIZE", 2)
+    with pytest.raises(app.TextExtractionError):
+        app.stream_json_values(io.StringIO('{"a": {"x": "unterminated'), [("b",)])
+
+
+def random_xml(rng, depth=0):
+    """各层标签名不同（同名元素不嵌套），文档顺序与结束事件顺序一致"""
+    elem = ET.Element(f"d{depth}{rng.choice('abc')}")
+    if rng.random() < 0.7:
+        elem.set("id", rng.choice(["x", "y", "中"]))
+    if rng.random() < 0.8:
+        elem.text = rng.choice(["", " 1.5 ", "文本", "a&b<c>", "  "])
+    if depth < 3:
+        for _ in range(rng.randint(0, 4)):
+            elem.append(random_xml(rng, depth + 1))
+    elem.tail = rng.choice(["", "\n  "])
+    return elem
+
+
+def xml_reference(root, path):
+    """用ElementTree在完整的树上求同一路径的第一个值"""
+    steps, attribute = app.parse_xpath(path)
+    if steps[0][0]:  # //tag... ：任意层级，等价于 .//tag
+        query = ".//" + "/".join(step_query(step) for step in steps)
+        candidates = [root] if matches_step(root, steps[0]) and len(steps) == 1 else []
+        candidates += root.findall(query)
+    else:
+        if not matches_step(root, steps[0]):
+            return None
+        candidates = [root] if len(steps) == 1 else root.findall("./" + "/".join(step_query(s) for s in steps[1:]))
+    for elem in candidates:
+        if attribute is None:
+            return (elem.text or "").strip()
+        if attribute in elem.attrib:
+            return elem.attrib[attribute]
+    return None
+
+
+def step_query(step):
+    _, name, position, conditions = step
+    query = name
+    for key, value in conditions:
+        query += f"[@{key}='{value}']" if value is not None else f"[@{key}]"
+    if position is not None:
+        query += f"[{position}]"
+    return query
+
+
+def matches_step(elem, step):
+    _, name, position, conditions = step
+    return (name in ("*", elem.tag) and position in (None, 1)
+            and all(key in elem.attrib and value in (None, elem.attrib[key]) for key, value in conditions))
+
+
+class TinyByteReads(io.RawIOBase):
+    """每次最多返回 size 个字节（iterparse 自己按块读取，用它制造任意位置的块边界）"""
+
+    def __init__(self, data, size):
+        self.stream = io.BytesIO(data)
+        self.size = size
+
+    def readable(self):
+        return True
+
+    def read(self, n=-1):
+        return self.stream.read(self.size if n is None or n < 0 else min(n, self.size))
+
+
+@pytest.mark.parametrize("read_size", [1, 5, 4096])
+def test_stream_xml_values_matches_elementtree(read_size):
+    rng = random.Random(read_size)
+    for _ in range(30):
+        root = random_xml(rng)
+        data = ET.tostring(root, encoding="utf-8")
+        paths = set()
+        for elem in root.iter():
+            paths.add(f"//{elem.tag}")
+            paths.add(f"//{elem.tag}/@id")
+            paths.add(f"{elem.tag}[@id='x']/text()")
+        for child in root:
+            for index in (1, 2):
+                paths.add(f"/{root.tag}/{child.tag}[{index}]")
+                paths.add(f"/{root.tag}/{child.tag}[{index}]/*/@id")
+        paths.add("//missing")
+        paths = sorted(paths)
+        found = app.stream_xml_values(TinyByteReads(data, read_size), paths)
+        for path in paths:
+            assert found.get(path) == xml_reference(root, path), path
@@ -0,0 +1,15 @@
+import io
+
+import ppt_image_inserter_gui as app
+
+
+def test_token_values_drop_control_characters():
+    app.load_heavy_modules()
+    prs = app.Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    box = slide.shapes.add_textbox(0, 0, 100, 100)
+    box.text_frame.text = "状态: {{status}}"
+    success, errors = app.apply_tokens(slide, [(0, "status", "\x1b[32mOK\x1b[0m")], app.PhaseTimer())
+    assert (success, errors) == (1, [])
+    assert box.text_frame.text == "状态: [32mOK[0m"
+    prs.save(io.BytesIO())